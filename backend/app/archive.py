@@ -0,0 +1,249 @@
+# backend/app/archive.py
+"""
+Cold tier for aged recordings.
+
+Closed segments older than ARCHIVE_AFTER_DAYS are re-encoded (ARCHIVE_CODEC at
+ARCHIVE_CRF, at most ARCHIVE_MAX_WIDTH wide) into COLD_DIR under the same
+<camera>/<date>/<hour>/<file> path. Then the row is marked cold and the hot file
+is removed. Readers go through recordings.segment_path(), so listings, lookups,
+exports and /api/recordings/... find footage in either tier. Thumbnails stay where
+they are in REC_DIR. Segments a motion policy already compacted are moved as-is.
+
+Workers run ffmpeg under nice (and ionice idle class when available), with the
+encoder held to one thread. They start nothing while other work keeps more than
+ARCHIVE_PAUSE_LOAD of the CPUs busy, and they SIGSTOP a running encode until it
+drops again, so live encoding keeps the CPU. Busy time comes from /proc/stat with
+the encode's own ticks taken out: the load average counts the encode itself, and
+a worker judging by it would keep pausing on its own load.
+"""
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Set
+
+from . import db, metrics, thumbnails
+from .config import COLD_DIR, REC_DIR, settings
+from .models import RecordingSegment
+from .recording_policy import TIER_COMPACT
+
+logger = logging.getLogger("homecam.archive")
+
+BATCH = 4
+IDLE_SEC = 60
+LOAD_CHECK_SEC = 2.0
+RESUME_FRACTION = 0.8   # resume below this share of ARCHIVE_PAUSE_LOAD
+
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def load_per_cpu() -> float:
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+
+def _cpu_ticks(pid: int) -> int:
+    """utime + stime of a process in clock ticks (0 once it is gone)."""
+    stats = metrics.proc_stats(pid)
+    return round(stats[0] * _CLK_TCK) if stats else 0
+
+
+class CpuLoad:
+    """
+    Share of all CPUs busy since this thread's previous call, from /proc/stat,
+    not counting the CPU time of `exclude` (the caller's own encode). Falls back
+    to load_per_cpu() on a thread's first call and where /proc is missing.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, exclude: Optional[int] = None) -> float:
+        try:
+            with open("/proc/stat") as f:
+                fields = [int(v) for v in f.readline().split()[1:9]]  # user .. steal
+        except (OSError, ValueError):
+            return load_per_cpu()
+        total, idle = sum(fields), fields[3] + fields[4]  # idle + iowait
+        own = _cpu_ticks(exclude) if exclude else 0
+        prev = getattr(self._local, "prev", None)
+        self._local.prev = (total, idle, exclude, own)
+        if prev is None or total <= prev[0]:
+            return load_per_cpu()
+        # a new process started after the previous sample: all of its time is in this window
+        own_delta = own - prev[3] if prev[2] == exclude else own
+        busy = (total - prev[0]) - (idle - prev[1]) - max(0, own_delta)
+        return max(0.0, busy / (total - prev[0]))
+
+
+def archive_cmd(src: Path, out: Path) -> list:
+    if settings.RECORDING_FORMAT == "mp4":
+        movflags = "+faststart"
+    else:
+        movflags = "+frag_keyframe+empty_moov+default_base_moof"
+    # one encoder thread: a background job, not something that takes every core
+    video = ["-c:v", settings.ARCHIVE_CODEC, "-preset", "medium", "-crf", str(settings.ARCHIVE_CRF), "-threads", "1"]
+    if settings.ARCHIVE_CODEC in ("libx265", "hevc"):
+        # hvc1: playable in Safari; x265 sizes its own thread pools unless told
+        video += ["-tag:v", "hvc1", "-x265-params", "log-level=error:pools=1:frame-threads=1"]
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-threads", "1", "-i", str(src),
+        "-map", "0:v", "-map", "0:a?",
+        "-vf", f"scale='min(iw,{settings.ARCHIVE_MAX_WIDTH})':-2", "-filter_threads", "1",
+        *video,
+        "-c:a", "copy",
+        "-movflags", movflags, "-f", "mp4", str(out),
+    ]
+    if shutil.which("ionice"):
+        cmd = ["ionice", "-c", "3", *cmd]
+    return cmd
+
+
+def _lower_priority():
+    try:
+        os.nice(settings.ARCHIVE_NICE)
+    except OSError:
+        pass
+
+
+class ArchiveWorkers:
+    def __init__(self, load: Optional[Callable[..., float]] = None, sleep: Callable[[float], None] = time.sleep):
+        self._load = load or CpuLoad()
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._claimed: Set[int] = set()
+
+    def busy(self) -> bool:
+        return self._load() > settings.ARCHIVE_PAUSE_LOAD
+
+    def _claim(self, now: float) -> Optional[RecordingSegment]:
+        cut = now - settings.ARCHIVE_AFTER_DAYS * 86400
+        with self._lock, db.SessionLocal() as session:
+            q = (
+                session.query(RecordingSegment)
+                .filter(
+                    RecordingSegment.duration.isnot(None),
+                    RecordingSegment.cold.is_(None),
+                    RecordingSegment.start_ts + RecordingSegment.duration < cut,
+                )
+                .order_by(RecordingSegment.start_ts)
+            )
+            if self._claimed:
+                q = q.filter(RecordingSegment.id.notin_(self._claimed))
+            row = q.first()
+            if row is None:
+                return None
+            self._claimed.add(row.id)
+            session.expunge(row)
+            return row
+
+    def _finish(self, seg_id: int, size: Optional[int]) -> bool:
+        """Mark the row cold (with its new size) or failed; True if it went cold."""
+        with self._lock, db.SessionLocal() as session:
+            row = session.get(RecordingSegment, seg_id)
+            self._claimed.discard(seg_id)
+            if row is None:
+                return False  # deleted by retention meanwhile
+            row.cold = size is not None
+            if size is not None:
+                row.size_bytes = size
+            session.commit()
+            return size is not None
+
+    def transcode(self, src: Path, out: Path) -> bool:
+        """Run the archive encode, pausing it (SIGSTOP) while the machine is busy."""
+        proc = subprocess.Popen(
+            archive_cmd(src, out), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            preexec_fn=_lower_priority,
+        )
+        paused = False
+        try:
+            while True:
+                try:
+                    proc.wait(timeout=LOAD_CHECK_SEC)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                load = self._load(exclude=proc.pid)
+                if not paused and load > settings.ARCHIVE_PAUSE_LOAD:
+                    proc.send_signal(signal.SIGSTOP)
+                    paused = True
+                elif paused and load < settings.ARCHIVE_PAUSE_LOAD * RESUME_FRACTION:
+                    proc.send_signal(signal.SIGCONT)
+                    paused = False
+        finally:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGCONT)
+                proc.kill()
+                proc.wait()
+        err = proc.stderr.read().decode("utf-8", "ignore") if proc.stderr else ""
+        if proc.returncode != 0:
+            logger.warning("Archive encode failed for %s: %s", src, err[-500:])
+        return proc.returncode == 0 and out.exists()
+
+    def archive(self, row: RecordingSegment) -> Optional[int]:
+        """Write the cold copy of one segment; its size, or None on failure."""
+        src = REC_DIR / row.rel_path
+        out = COLD_DIR / row.rel_path
+        out.parent.mkdir(parents=True, exist_ok=True)
+        # the temporary name must not look like a segment to the index
+        tmp = out.with_name(f".{out.stem}.archive.tmp")
+        try:
+            if row.tier == TIER_COMPACT or not self.transcode(src, tmp) or tmp.stat().st_size >= src.stat().st_size:
+                shutil.copyfile(src, tmp)  # already small: keep the bytes as they are
+            os.replace(tmp, out)
+            return out.stat().st_size
+        except OSError:
+            logger.exception("Archiving %s failed", row.rel_path)
+            return None
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def run_batch(self, limit: int = BATCH, now: Optional[float] = None) -> int:
+        done = 0
+        while done < limit:
+            if self.busy():
+                break
+            row = self._claim(now if now is not None else time.time())
+            if row is None:
+                break
+            size = None
+            try:
+                if (REC_DIR / row.rel_path).exists():
+                    size = self.archive(row)
+            except Exception:
+                logger.exception("Archiving %s failed", row.rel_path)
+            if self._finish(row.id, size):
+                # readers now resolve the cold copy; drop the hot one, its thumbnails follow it
+                hot = REC_DIR / row.rel_path
+                thumbnails.move(hot, COLD_DIR / row.rel_path)
+                hot.unlink(missing_ok=True)
+            done += 1
+        return done
+
+    def run(self):
+        while True:
+            try:
+                if self.run_batch():
+                    continue
+            except Exception:  # a database error must not end the worker
+                logger.exception("Archive batch failed")
+            self._sleep(IDLE_SEC)
+
+
+archive_workers = ArchiveWorkers()
+
+
+def start_workers():
+    if COLD_DIR is None:
+        return
+    COLD_DIR.mkdir(parents=True, exist_ok=True)
+    for _ in range(max(0, settings.ARCHIVE_WORKERS)):
+        threading.Thread(target=archive_workers.run, name="archive", daemon=True).start()
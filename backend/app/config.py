@@ -1,3 +1,4 @@
+import tempfile
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,10 +10,130 @@ class Settings(BaseSettings):
     DB_PATH: str = "/data/homecam.db"
     LOG_LEVEL: str = "INFO"
     RECORDING_SEGMENT_SEC: int = 3600
+    # "fmp4": fragmented MP4 (moov up front, playable while growing, no rewrite on close)
+    # "mp4":  classic MP4 with +faststart (whole file rewritten when each segment closes)
+    RECORDING_FORMAT: str = "fmp4"
+    RECORDING_INDEX_POLL_SEC: int = 5   # how often the segment index tails ffmpeg's segment lists
     DEFAULT_RETENTION_DAYS: int = 7
-    IDLE_REAPER_INTERVAL_SEC: int = 10
+    # Retention pass (retention.py): age limits per camera, plus a disk watermark and an
+    # optional quota enforced by evicting the oldest segments (weighted by priority).
+    RETENTION_INTERVAL_SEC: int = 60
+    DISK_MIN_FREE_PCT: float = 10.0    # evict when the recordings disk has less free than this
+    RECORDINGS_QUOTA_GB: float = 0     # evict when recordings use more than this; 0 = no quota
+    RETENTION_HEADROOM_PCT: float = 5.0  # how far past the watermark/quota an eviction goes
+    RETENTION_DELETE_RATE: float = 50  # segment deletes per second; 0 = unpaced
+    IDLE_REAPER_INTERVAL_SEC: int = 10  # unused (idle stop is scheduled); kept so old .env files load
     ROLE_IDLE_TIMEOUT_SEC: int = 120
     LEASE_TIMEOUT_SEC: int = 60
+    LEASE_SESSIONS_PER_CLIENT: int = 8  # viewer session ids per address + user agent and stream
+    # Restarting a role whose ffmpeg exited (supervisor.py): the delay doubles from
+    # RESTART_BACKOFF_MIN_SEC up to the max (with jitter) while it keeps exiting within
+    # RESTART_HEALTHY_SEC; after RESTART_CRASHLOOP_COUNT such exits status() calls it crash-looping.
+    RESTART_BACKOFF_MIN_SEC: float = 1.0
+    RESTART_BACKOFF_MAX_SEC: float = 120.0
+    RESTART_HEALTHY_SEC: float = 60.0
+    RESTART_CRASHLOOP_COUNT: int = 5
+    # Role processes report -progress (progress.py); one whose output position stops
+    # advancing this long (stuck RTSP session, no new segments) is killed and restarted.
+    STALL_TIMEOUT_SEC: float = 30.0  # 0 = no stall watchdog
+
+    # Ingest relay: one RTSP session per camera stream, fanned out locally to
+    # every role (grid/medium/high/recording) instead of one pull per role.
+    INGEST_RELAY: bool = True
+    RELAY_LINGER_SEC: int = 15       # keep the pull open this long after the last role detaches
+    RELAY_QUEUE_CHUNKS: int = 64     # per-role backlog (~64 KiB chunks) before the role is detached
+    RTSP_TIMEOUT_SEC: float = 10     # end an RTSP session that sends nothing this long (0 = never)
+
+    # Stream-copy (-c copy) a role's video/audio when the probed source is already
+    # compatible and no scaling is needed; transcode otherwise.
+    ENCODE_PASSTHROUGH: bool = True
+    HLS_COPY_MAX_GOP_SEC: float = 4.0  # longest camera GOP we accept for copied HLS
+
+    # Adaptive bitrate: one always-on ffmpeg per camera decodes once and encodes the
+    # grid/medium/high ladder with aligned keyframes, plus live/<cam>/master.m3u8.
+    LIVE_ABR: bool = False
+
+    # Low-Latency HLS for these roles (comma list, e.g. "medium,high"): partial
+    # segments, EXT-X-PART/preload hints and blocking playlist reload.
+    LL_HLS_ROLES: str = ""
+    LL_HLS_PART_SEC: float = 0.5
+    LL_HLS_PARTS_PER_SEGMENT: int = 4
+
+    # Let nginx serve recording/clip bytes: the API answers with X-Accel-Redirect
+    # to these internal locations (must match deploy/nginx/nginx.conf). Only enable
+    # when every client reaches the API through that nginx.
+    ACCEL_REDIRECT: bool = False
+    ACCEL_REC_LOCATION: str = "/_accel/recordings/"
+    ACCEL_CLIP_LOCATION: str = "/_accel/clips/"
+    ACCEL_COLD_LOCATION: str = "/_accel/cold/"
+
+    # Clip export jobs: bounded ffmpeg pool at reduced CPU priority; downloads
+    # (save=false) wait in EXPORT_TMP_DIR for EXPORT_TTL_SEC.
+    EXPORT_WORKERS: int = 2
+    EXPORT_NICE: int = 10
+    EXPORT_TTL_SEC: int = 3600
+    EXPORT_TMP_DIR: str | None = None
+
+    # Recording scrub previews: one sprite sheet + WebVTT track per closed
+    # segment, a tile every THUMB_INTERVAL_SEC, decoded from keyframes only.
+    THUMBNAILS: bool = True
+    THUMB_INTERVAL_SEC: int = 10
+    THUMB_WIDTH: int = 160
+    THUMB_COLUMNS: int = 10
+    THUMB_WORKERS: int = 1
+    THUMB_NICE: int = 15
+
+    # Cold tier: closed segments older than ARCHIVE_AFTER_DAYS are re-encoded into
+    # COLD_ROOT (same <camera>/<date>/<hour>/ layout) by a nice/ionice'd worker pool
+    # that pauses while the machine is busy. No COLD_ROOT = no archiving.
+    COLD_ROOT: str | None = None
+    ARCHIVE_AFTER_DAYS: float = 3
+    ARCHIVE_CODEC: str = "libx265"
+    ARCHIVE_CRF: int = 30
+    ARCHIVE_MAX_WIDTH: int = 1280
+    ARCHIVE_WORKERS: int = 1
+    ARCHIVE_NICE: int = 19
+    ARCHIVE_PAUSE_LOAD: float = 0.75   # pause while other work keeps this share of the CPUs busy
+
+    # /api/cameras/{id}/snapshot.jpg: keyframe of the newest grid segment, cached
+    SNAPSHOT_TTL_SEC: float = 2.0
+    SNAPSHOT_QUALITY: int = 5         # ffmpeg -q:v (2 best .. 31 worst)
+
+    # ONVIF motion events: one PullPoint subscription per camera with onvif_port
+    # set, all on one asyncio loop; reconnects back off up to ONVIF_BACKOFF_MAX_SEC.
+    ONVIF_EVENTS: bool = True
+    ONVIF_PULL_TIMEOUT_SEC: int = 10
+    ONVIF_SUBSCRIPTION_SEC: int = 300
+    ONVIF_CONNECT_TIMEOUT_SEC: float = 5.0
+    ONVIF_BACKOFF_MAX_SEC: float = 60.0
+
+    # Software motion detection (cameras with motion_detect on): grayscale frames
+    # from the grid source, MOTION_FPS at MOTION_WIDTH x MOTION_HEIGHT, differenced.
+    MOTION_FPS: float = 4
+    MOTION_WIDTH: int = 160
+    MOTION_HEIGHT: int = 90
+    MOTION_PIXEL_DELTA: int = 25      # 0..255 change for a pixel to count
+    MOTION_THRESHOLD: float = 0.01    # changed fraction of watched pixels (per-camera override)
+    MOTION_START_FRAMES: int = 2      # consecutive frames over threshold to start
+    MOTION_HOLD_SEC: float = 5.0      # quiet time before motion ends
+
+    # Motion-aware recording (per-camera recording_policy, see recording_policy.py).
+    # Segments with no motion within the pre-/post-roll are "quiet": dropped after
+    # QUIET_RETENTION_HOURS, re-encoded at QUIET_CRF, or recorded from the substream.
+    MOTION_PREROLL_SEC: float = 10.0
+    MOTION_POSTROLL_SEC: float = 30.0
+    MOTION_SEGMENT_SEC: int = 60       # recording segment length under a motion policy
+    QUIET_RETENTION_HOURS: float = 24
+    QUIET_CRF: int = 32
+    QUIET_MAX_WIDTH: int = 640
+    QUIET_NICE: int = 15
+    RECORDING_POLICY_INTERVAL_SEC: int = 300
+
+    # Where live HLS lives: "disk" (files under LIVE_DIR) or "memory" (ffmpeg PUTs
+    # to the API's /ingest/live, served from RAM; needs a single API worker).
+    LIVE_STORE: str = "disk"
+    LIVE_STORE_ROLE_MAX_MB: int = 48   # RAM ring size per camera role
+    API_PORT: int = 8091               # used by ffmpeg to reach /ingest/live
 
     # NEW: debug/ops switch for how many outputs we spawn
     #   - "all": low + high + recordings (default)
@@ -33,5 +154,11 @@ else:
 # Directory for user-saved clips from any camera
 CLIP_DIR = REC_DIR / "saved"
 
+# Archived (re-encoded) segments, mirroring REC_DIR's layout
+COLD_DIR = Path(settings.COLD_ROOT) if settings.COLD_ROOT else None
+
 DB_PATH = Path(settings.DB_PATH)
 
+# Finished exports waiting to be downloaded (not under MEDIA_ROOT: never served statically)
+EXPORT_DIR = Path(settings.EXPORT_TMP_DIR) if settings.EXPORT_TMP_DIR else Path(tempfile.gettempdir()) / "homecam_exports"
+
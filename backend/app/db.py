@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import DB_PATH
 
@@ -13,3 +13,20 @@ def get_session():
         yield db
     finally:
         db.close()
+
+def add_missing_columns(bind=engine):
+    """
+    create_all() never alters existing tables; add columns introduced after a
+    table was first created (nullable, no server default) so older DBs keep working.
+    """
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in have:
+                    continue
+                ddl = col.type.compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}"))
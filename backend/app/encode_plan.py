@@ -0,0 +1,70 @@
+# backend/app/encode_plan.py
+from typing import Optional
+from .config import settings
+
+# Codecs we can pass through untouched per output container.
+# HLS here is MPEG-TS segments consumed by browsers (hls.js / Safari): H.264 only.
+HLS_VIDEO_COPY = {"h264"}
+MP4_VIDEO_COPY = {"h264", "hevc"}
+AUDIO_COPY = {"aac"}
+
+def _video_copy_ok(role: str, meta: Optional[dict], scaled: bool, seg_sec: float) -> bool:
+    if not settings.ENCODE_PASSTHROUGH or scaled or not meta:
+        return False
+    codec = meta.get("codec")
+    if role == "recording":
+        return codec in MP4_VIDEO_COPY
+    if codec not in HLS_VIDEO_COPY:
+        return False
+    # HLS can only cut on source keyframes: a long camera GOP means long,
+    # late segments, so only copy when the GOP is known and short enough.
+    gop, fps = meta.get("gop"), meta.get("fps")
+    if not gop or not fps:
+        return False
+    return gop / fps <= max(seg_sec, settings.HLS_COPY_MAX_GOP_SEC)
+
+def plan_encode(
+    role: str,
+    meta: Optional[dict],
+    crf: int,
+    scale_w: Optional[int] = None,
+    scale_h: Optional[int] = None,
+    seg_sec: float = 2,
+) -> dict:
+    """
+    Decide copy vs transcode for one role's output.
+    meta is the probed CameraStream info (codec/gop/fps/audio_codec); None means unknown -> transcode.
+    Returns {"video": [...], "audio": [...], "copy_video": bool, "copy_audio": bool}
+    where video/audio are ffmpeg output args (video args include -vf when scaling).
+    """
+    scaled = bool(scale_w and scale_h)
+    copy_video = _video_copy_ok(role, meta, scaled, seg_sec)
+
+    if copy_video:
+        video = ["-c:v", "copy"]
+    elif role == "recording":
+        video = ["-c:v", "libx264", "-preset", "veryfast", "-crf", str(max(18, min(28, crf)))]
+    else:
+        rate = "4000k" if role != "grid" else "1200k"
+        video = [
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+            "-g", "48", "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{seg_sec})",
+            "-maxrate", rate,
+            "-bufsize", rate,
+        ]
+        if scaled:
+            video = ["-vf", f"scale={scale_w}:{scale_h}", *video]  # only used for grid/auto
+
+    copy_audio = False
+    if role == "grid":
+        audio = ["-an"]
+    elif settings.ENCODE_PASSTHROUGH and meta and meta.get("audio_codec") in AUDIO_COPY:
+        audio = ["-c:a", "copy"]
+        copy_audio = True
+    elif role == "recording":
+        audio = ["-c:a", "aac", "-b:a", "128k"]
+    else:
+        audio = ["-c:a", "aac", "-ar", "44100", "-ac", "1"]
+
+    return {"video": video, "audio": audio, "copy_video": copy_video, "copy_audio": copy_audio}
@@ -0,0 +1,236 @@
+# backend/app/export.py
+"""
+Wall-clock clip export across recording segments.
+
+A clip [start, end) is assembled from the indexed segments that overlap it with
+the concat demuxer: each segment gets inpoint/outpoint directives, so ffmpeg
+seeks on the input side and stream-copies (the clip starts on the keyframe at or
+before `start`). Accurate mode re-encodes only the head: from `start` up to the
+first keyframe after it, with the recording's own codec (H.264 or HEVC, read from
+the file); the rest is still copied. The two parts are joined as MPEG-TS
+(parameter sets in-band) and remuxed to MP4. Sources in any other codec are
+exported in copy mode.
+
+A clip can also cross from hot into archived (cold) footage, which has another
+codec or size. The pieces are split into runs of one format; runs in the clip's
+main format (the longest) are copied, the others re-encoded to match, and all of
+them joined the same way. Formats we cannot encode to are refused (ExportError).
+
+Single-step plans also offer stream_cmd: the same copy written as fragmented
+MP4 to stdout, so a download can start before the export has finished.
+"""
+import math
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from .recordings import segment_index, segment_end, segment_path
+from . import mp4frag
+
+# Below this a cut already sits on a keyframe: nothing to re-encode
+KEYFRAME_EPS = 0.05
+
+# Re-encoding a piece to match copied footage, per source codec
+ENCODERS = {
+    "h264": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18"],
+    "hevc": ["-c:v", "libx265", "-preset", "veryfast", "-crf", "20", "-x265-params", "log-level=error"],
+}
+# A joined clip mixes our encodes with copied camera video, each with its own
+# SPS/PPS (and VPS). avc1/hvc1 allow one out-of-band set in the sample entry (and
+# ffmpeg strips the in-band ones for hvc1), so strict decoders break at the join;
+# avc3/hev1 decode from the parameter sets the TS parts carry before each keyframe.
+JOIN_TAGS = {"h264": ["-tag:v", "avc3"], "hevc": ["-tag:v", "hev1"]}
+
+# Fragmented MP4 needs no seekable output (moov up front, a fragment per keyframe)
+PIPE_OUTPUT = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", "pipe:1"]
+
+
+class ExportError(Exception):
+    pass
+
+
+class NoFootage(ExportError):
+    pass
+
+
+def plan_pieces(camera: str, start: float, end: float) -> List[dict]:
+    """[{path, inpoint, outpoint}] (seconds into each file) covering [start, end)."""
+    if end <= start:
+        raise ExportError("end must be after start")
+    pieces = []
+    for r in segment_index.between(camera, start, end):
+        seg_end = segment_end(r)
+        if seg_end is None or seg_end <= start:
+            continue
+        inpoint = max(0.0, start - r.start_ts)
+        outpoint = min(seg_end, end) - r.start_ts
+        if outpoint <= inpoint:
+            continue
+        pieces.append({
+            "path": str(segment_path(r)),
+            "inpoint": inpoint,
+            "outpoint": None if seg_end <= end else outpoint,  # None: to the end of the file
+            "length": outpoint - inpoint,
+        })
+    if not pieces:
+        raise NoFootage("no recordings in that range")
+    return pieces
+
+
+def concat_list(pieces: List[dict]) -> str:
+    lines = ["ffconcat version 1.0"]
+    for p in pieces:
+        escaped = p["path"].replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        if p["inpoint"] > 0:
+            # round up: written just before a keyframe, the demuxer would start a GOP early
+            lines.append(f"inpoint {math.ceil(p['inpoint'] * 1000) / 1000:.3f}")
+        if p["outpoint"] is not None:
+            lines.append(f"outpoint {p['outpoint']:.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def _same(a, b) -> bool:
+    """Formats that can be stream-copied into one file (unknown matches anything)."""
+    return a is None or b is None or a == b
+
+
+def _runs(pieces: List[dict]) -> List[List[dict]]:
+    """Split pieces where the video format changes (e.g. hot -> cold tier)."""
+    runs: List[List[dict]] = []
+    fmt = None
+    for p in pieces:
+        if runs and _same(p["format"], fmt):
+            runs[-1].append(p)
+        else:
+            runs.append([p])
+        fmt = p["format"] or fmt
+    return runs
+
+
+def _run_format(run: List[dict]):
+    return next((p["format"] for p in run if p["format"]), None)
+
+
+def _describe(runs: List[List[dict]]) -> str:
+    return " -> ".join(f"{f[0]} {f[1]}x{f[2]}" for f in map(_run_format, runs) if f)
+
+
+class ExportPlan:
+    """ffmpeg commands (run in order) producing out_path, plus their scratch dir."""
+
+    def __init__(self, camera: str, start: float, end: float, out_path: Path, accurate: bool = False):
+        self.out_path = Path(out_path)
+        self.pieces = plan_pieces(camera, start, end)
+        self.duration = sum(p["length"] for p in self.pieces)
+        for p in self.pieces:
+            p["format"] = mp4frag.video_format(p["path"])  # (codec, w, h) or None
+        runs = _runs(self.pieces)
+        target = _run_format(max(runs, key=lambda run: sum(p["length"] for p in run)))
+        codec = target[0] if target else "h264"  # unreadable: what our encodes produce
+        if len(runs) > 1 and codec not in ENCODERS:
+            raise ExportError(f"recordings in this range change format ({_describe(runs)}) and cannot be joined")
+        self.workdir = Path(tempfile.mkdtemp(prefix="homecam_export_"))
+        self.steps: List[List[str]] = []
+        self.stream_cmd: Optional[List[str]] = None
+        head_end = self._head_keyframe() if accurate and codec in ENCODERS else None
+        if len(runs) == 1 and head_end is None:
+            self.steps.append(self._copy_cmd(self.pieces, self.out_path, mp4=True))
+            self.stream_cmd = self.steps[0][:-3] + PIPE_OUTPUT
+            return
+
+        parts = []
+        rest = self.pieces
+        if head_end is not None:
+            first = rest[0]
+            if not _same(first["format"], target):
+                head_end = first["inpoint"] + first["length"]  # re-encoded anyway: all of it, exactly
+            head_ts = self.workdir / "head.ts"
+            self.steps.append([
+                "ffmpeg", "-y", "-v", "error",
+                "-ss", f"{first['inpoint']:.3f}", "-i", first["path"],
+                "-t", f"{head_end - first['inpoint']:.3f}",
+                "-map", "0:v", "-map", "0:a?",
+                *self._encode_args(first["format"], target, codec),
+                "-f", "mpegts", str(head_ts),
+            ])
+            parts.append(head_ts)
+            rest = rest[1:]
+            if head_end < first["inpoint"] + first["length"] - KEYFRAME_EPS:
+                rest.insert(0, dict(first, inpoint=head_end))
+        # Hot and cold footage differ in codec and size: copy the runs that match the
+        # clip's main format, re-encode the others to it, and join them all as TS
+        for i, run in enumerate(_runs(rest) if rest else []):
+            part_ts = self.workdir / f"part{i}.ts"
+            cmd = self._copy_cmd(run, part_ts, mp4=False)
+            if not _same(_run_format(run), target):
+                at = cmd.index("-c")
+                cmd[at:at + 2] = self._encode_args(_run_format(run), target, codec)
+            self.steps.append(cmd)
+            parts.append(part_ts)
+        # concat: with one part is just that file (the whole clip fit inside the first GOP)
+        self.steps.append([
+            "ffmpeg", "-y", "-v", "error", "-i", "concat:" + "|".join(map(str, parts)),
+            "-map", "0", "-c", "copy", "-bsf:a", "aac_adtstoasc", *JOIN_TAGS.get(codec, []),
+            "-movflags", "+faststart", str(self.out_path),
+        ])
+
+    @staticmethod
+    def _encode_args(fmt, target, codec: str) -> List[str]:
+        args = [*ENCODERS[codec], "-c:a", "aac"]
+        if not _same(fmt, target):
+            args += ["-vf", f"scale={target[1]}:{target[2]},setsar=1"]
+        return args
+
+    def _head_keyframe(self) -> Optional[float]:
+        """First keyframe after the requested start, if the start isn't on one (fMP4 only)."""
+        first = self.pieces[0]
+        try:
+            size = Path(first["path"]).stat().st_size
+            kf = mp4frag.next_fragment(first["path"], size, first["inpoint"])
+        except (OSError, ValueError, IndexError):
+            return None
+        if kf is None:
+            # no keyframe left in this file: re-encode the rest of it
+            return first["inpoint"] + first["length"]
+        if kf - first["inpoint"] < KEYFRAME_EPS:
+            return None
+        return kf
+
+    def _copy_cmd(self, pieces: List[dict], out: Path, mp4: bool) -> List[str]:
+        list_path = self.workdir / f"{out.stem}.ffconcat"
+        list_path.write_text(concat_list(pieces))
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "concat", "-safe", "0", "-i", str(list_path),
+            "-map", "0:v", "-map", "0:a?", "-c", "copy",
+        ]
+        if mp4:
+            cmd += ["-movflags", "+faststart", str(out)]
+        else:
+            cmd += ["-f", "mpegts", str(out)]
+        return cmd
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class FilePlan:
+    """Cut [start, end) seconds out of one recording file (same interface as ExportPlan)."""
+
+    def __init__(self, path: Path, start: float, end: float, out_path: Path):
+        self.out_path = Path(out_path)
+        self.duration = end - start
+        # -ss before -i: seek on the input instead of decoding up to the cut point
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-ss", f"{start:.3f}", "-i", str(path), "-t", f"{end - start:.3f}",
+            "-c", "copy",
+        ]
+        self.steps = [cmd + [str(self.out_path)]]
+        self.stream_cmd = cmd + PIPE_OUTPUT
+
+    def cleanup(self):
+        pass
+
@@ -0,0 +1,334 @@
+# backend/app/export_jobs.py
+"""
+Clip export jobs.
+
+submit() queues an export plan (export.ExportPlan / FilePlan) and returns at
+once; EXPORT_WORKERS threads each run one job's ffmpeg steps at a time, niced
+by EXPORT_NICE so exports never compete with live transcodes for CPU. Progress
+comes from ffmpeg's -progress output. Jobs can be cancelled while queued or
+running. Saved clips are moved into CLIP_DIR when done; downloads wait in
+EXPORT_DIR and, like finished jobs, are dropped after EXPORT_TTL_SEC.
+
+stream_clip() is the disk-free alternative for downloads: it runs a plan's
+stream_cmd and yields ffmpeg's fragmented-MP4 stdout as it is produced. A stream
+holds one of the same EXPORT_WORKERS slots as a running job for as long as it
+lasts; when none is free it raises ExportBusy at once instead of waiting.
+"""
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from . import metrics
+from .config import CLIP_DIR, EXPORT_DIR, settings
+
+logger = logging.getLogger("homecam.export")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+REAP_INTERVAL_SEC = 60
+STREAM_CHUNK = 256 * 1024
+
+
+def clip_filename(name: Optional[str]) -> str:
+    name = name or f"clip_{int(time.time())}.mp4"
+    safe = re.sub(r"[^\w\-]+", "_", name[:-4] if name.endswith(".mp4") else name)
+    return safe + ".mp4"
+
+
+def download_name(name: Optional[str]) -> str:
+    name = name or "clip.mp4"
+    return name if name.endswith(".mp4") else name + ".mp4"
+
+
+def parse_progress(line: str) -> Optional[float]:
+    """Seconds of output written, from one `-progress` line (None for other keys)."""
+    key, _, value = line.strip().partition("=")
+    if key in ("out_time_us", "out_time_ms"):  # both are microseconds
+        try:
+            return int(value) / 1_000_000
+        except ValueError:
+            return None
+    return None
+
+
+class ExportJob:
+    def __init__(self, plan, save: bool, name: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.plan = plan
+        self.save = save
+        self.name = name
+        self.status = QUEUED
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.result_path: Optional[Path] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._cancel = False
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        out = {
+            "id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "duration": self.plan.duration,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "path": None,
+        }
+        if self.status == DONE and self.result_path is not None:
+            out["path"] = f"/api/saved/{self.result_path.name}" if self.save else f"/api/export/jobs/{self.id}/download"
+        return out
+
+
+class ExportQueue:
+    def __init__(self, workers: int):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ExportJob] = {}
+        self._queue: "queue.Queue[ExportJob]" = queue.Queue()
+        self._workers = workers
+        # one per ffmpeg allowed to run: taken by workers and by streamed downloads
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._started = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(max(1, self._workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._reaper, daemon=True).start()
+
+    # ---------- public ----------
+
+    def submit(self, plan, save: bool = False, name: Optional[str] = None) -> ExportJob:
+        job = ExportJob(plan, save, name)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._ensure_started()
+        self._queue.put(job)
+        return job
+
+    def try_slot(self) -> bool:
+        """Take an export slot without waiting (streamed downloads); release_slot() gives it back."""
+        return self._slots.acquire(blocking=False)
+
+    def release_slot(self):
+        self._slots.release()
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[ExportJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created)
+
+    def cancel(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (QUEUED, RUNNING):
+                return job
+            job._cancel = True
+            proc = job._proc
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+        return job
+
+    # ---------- workers ----------
+
+    def _finish(self, job: ExportJob, status: str, error: Optional[str] = None):
+        # tidy up before waking waiters
+        job.plan.cleanup()
+        if status != DONE:
+            _unlink(job.plan.out_path)
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        if job.started is not None:
+            metrics.EXPORT_DURATION.observe(job.finished - job.started, status=status)
+        job._done.set()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._slots:  # wait out streamed downloads holding the slots
+                with self._lock:
+                    cancelled = job._cancel
+                    if not cancelled:
+                        job.status = RUNNING
+                        job.started = time.time()
+                if cancelled:
+                    continue  # already finished by cancel()
+                try:
+                    self._run(job)
+                except Exception as e:  # pragma: no cover - unexpected failure
+                    logger.exception("Export job %s failed", job.id)
+                    with self._lock:
+                        self._finish(job, FAILED, str(e))
+
+    def _run(self, job: ExportJob):
+        steps = job.plan.steps
+        for i, cmd in enumerate(steps):
+            cmd = [cmd[0], "-nostats", "-progress", "pipe:1", *cmd[1:]]
+            with self._lock:
+                if job._cancel:
+                    self._finish(job, CANCELLED)
+                    return
+                job._proc = proc = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    preexec_fn=_lower_priority,
+                )
+            err_buf: List[bytes] = []
+            drain = threading.Thread(target=_read_all, args=(proc.stderr, err_buf), daemon=True)
+            drain.start()
+            for raw in proc.stdout:
+                t = parse_progress(raw.decode("utf-8", "ignore"))
+                if t is not None and job.plan.duration > 0:
+                    frac = min(1.0, t / job.plan.duration)
+                    job.progress = (i + frac) / len(steps)
+            rc = proc.wait()
+            drain.join()
+            err = b"".join(err_buf)
+            with self._lock:
+                job._proc = None
+                if job._cancel:
+                    self._finish(job, CANCELLED)
+                    return
+                if rc != 0:
+                    self._finish(job, FAILED, f"ffmpeg failed: {err.decode('utf-8', 'ignore')[-2000:]}")
+                    return
+
+        out = job.plan.out_path
+        if job.save:
+            CLIP_DIR.mkdir(parents=True, exist_ok=True)
+            dest = CLIP_DIR / clip_filename(job.name)
+            shutil.move(str(out), dest)
+            out = dest
+        with self._lock:
+            job.result_path = out
+            job.progress = 1.0
+            self._finish(job, DONE)
+
+    def _reaper(self):
+        """Drop finished jobs (and their unsaved downloads) after EXPORT_TTL_SEC."""
+        while True:
+            time.sleep(REAP_INTERVAL_SEC)
+            self.reap()
+
+    def reap(self, now: Optional[float] = None):
+        now = now or time.time()
+        ttl = settings.EXPORT_TTL_SEC
+        with self._lock:
+            expired = [j for j in self._jobs.values() if j.finished and now - j.finished > ttl]
+            for j in expired:
+                self._jobs.pop(j.id, None)
+        for j in expired:
+            if not j.save and j.result_path is not None:
+                _unlink(j.result_path)
+
+
+class StreamError(Exception):
+    pass
+
+
+class ExportBusy(Exception):
+    pass
+
+
+def stream_clip(plan) -> Iterator[bytes]:
+    """
+    Start plan.stream_cmd and return an iterator over its output.
+
+    The first chunk is read before returning, so an ffmpeg that fails up front
+    raises StreamError instead of producing an empty 200. Closing the iterator
+    (client went away) kills ffmpeg and frees the export slot.
+    """
+    if not export_queue.try_slot():
+        plan.cleanup()
+        raise ExportBusy("all export slots are busy; try again shortly or submit an export job")
+    try:
+        proc = subprocess.Popen(
+            plan.stream_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=_lower_priority,
+        )
+    except OSError as e:
+        export_queue.release_slot()
+        plan.cleanup()
+        raise StreamError(f"ffmpeg failed to start: {e}")
+    err_buf: List[bytes] = []
+    threading.Thread(target=_read_all, args=(proc.stderr, err_buf), daemon=True).start()
+    first = proc.stdout.read(STREAM_CHUNK)
+    if not first:
+        rc = proc.wait()
+        export_queue.release_slot()
+        plan.cleanup()
+        raise StreamError(f"ffmpeg failed ({rc}): {b''.join(err_buf).decode('utf-8', 'ignore')[-2000:]}")
+
+    def chunks():
+        try:
+            yield b""  # primed below, so closing an unread response still runs the finally
+            yield first
+            for chunk in iter(lambda: proc.stdout.read(STREAM_CHUNK), b""):
+                yield chunk
+            if proc.wait() != 0:
+                logger.warning("Streamed export ended with ffmpeg exit %s", proc.returncode)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            plan.cleanup()
+            export_queue.release_slot()
+
+    gen = chunks()
+    next(gen)
+    return gen
+
+
+def _lower_priority():
+    try:
+        os.nice(settings.EXPORT_NICE)
+    except OSError:
+        pass
+
+
+def _read_all(stream, sink: List[bytes]):
+    for chunk in iter(lambda: stream.read(65536), b""):
+        sink.append(chunk)
+
+
+def _unlink(p: Optional[Path]):
+    try:
+        if p is not None:
+            Path(p).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def new_output_path() -> Path:
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    return EXPORT_DIR / f"{uuid.uuid4().hex}.mp4"
+
+
+export_queue = ExportQueue(settings.EXPORT_WORKERS)
@@ -1,13 +1,27 @@
 # backend/app/ffmpeg_manager.py
+import heapq
+import itertools
 import logging
 import shutil
 import signal
 import subprocess
 import threading
 import time
+import uuid
+from functools import partial
 from pathlib import Path
 from typing import Dict, Optional, Tuple
-from .roles import resolve_role
+from urllib.parse import quote
+from .roles import resolve_role, stream_meta
+from .encode_plan import plan_encode
+from .llhls import ll_roles, PARTS_PLAYLIST
+from . import live_store
+from . import metrics
+from .relay import IngestRelay
+from .recordings import SEGMENT_LIST_NAME
+from .recording_policy import recording_policy
+from .supervisor import ProcessSupervisor, backoff_delay
+from .progress import PROGRESS_ARGS, RoleProgress
 
 from .config import LIVE_DIR, REC_DIR, settings
 
@@ -23,14 +37,46 @@ if not logger.handlers:
 def _alive(p: Optional[subprocess.Popen]) -> bool:
     return p is not None and p.poll() is None
 
-def _spawn(cmd: list[str], log_path: Path) -> subprocess.Popen:
+def _spawn(cmd: list[str], log_path: Path, stdin=None, stdout=subprocess.DEVNULL) -> subprocess.Popen:
     log_path.parent.mkdir(parents=True, exist_ok=True)
     logf = open(log_path, "ab", buffering=0)
     logger.debug("FFmpeg cmd: %s", " ".join(str(x) for x in cmd))
     logger.info("FFmpeg stderr log: %s", log_path)
-    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=logf)
+    return subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=logf)
+
+def _input_args(src: str, relay: Optional[IngestRelay]) -> list[str]:
+    """Read from the camera's ingest relay when there is one, else pull RTSP directly."""
+    if relay is not None:
+        return ["-f", "mpegts", "-i", "pipe:0"]
+    timeout = ["-timeout", str(int(settings.RTSP_TIMEOUT_SEC * 1e6))] if settings.RTSP_TIMEOUT_SEC > 0 else []
+    return ["-rtsp_transport", "tcp", *timeout, "-i", src]
+
+def _recording_movflags() -> list[str]:
+    """Options for the mp4 muxer inside the recording segmenter."""
+    if settings.RECORDING_FORMAT == "mp4":
+        # moov moved to the front on close: rewrites the whole segment file
+        opts = "movflags=+faststart"
+    else:
+        # moov written up front, then moof/mdat fragments appended at each keyframe
+        # and every 2 s within long GOPs: playable while growing, crash-safe, nothing
+        # to rewrite. Those extra fragments start mid-GOP; mp4frag only seeks to the
+        # ones whose first sample is a sync sample.
+        opts = "movflags=+frag_keyframe+empty_moov+default_base_moof:frag_duration=2000000"
+    return ["-segment_format", "mp4", "-segment_format_options", opts]
 
 def _hls_opts(seg_dur="2", list_size="12"):
+    if live_store.memory_enabled():
+        # PUT to the API's in-memory store; expired segments are DELETEd
+        return [
+            "-f", "hls",
+            "-hls_time", seg_dur,
+            "-hls_list_size", list_size,
+            "-hls_allow_cache", "0",
+            "-hls_flags", "delete_segments+independent_segments",
+            "-method", "PUT",
+            "-http_persistent", "1",
+            "-ignore_io_errors", "1",
+        ]
     return [
         "-f", "hls",
         "-hls_time", seg_dur,
@@ -39,6 +85,46 @@ def _hls_opts(seg_dur="2", list_size="12"):
         "-hls_flags", "delete_segments+independent_segments+append_list+temp_file",
     ]
 
+def _live_out(cam_name: str, *parts: str) -> str:
+    """Where ffmpeg writes live output: a file under LIVE_DIR or the API's ingest URL."""
+    if live_store.memory_enabled():
+        rel = "/".join(quote(p) for p in (cam_name, *parts))
+        return f"http://127.0.0.1:{settings.API_PORT}/ingest/live/{rel}"
+    return str(LIVE_DIR.joinpath(cam_name, *parts))
+
+# ABR ladder rungs, lowest first (names double as the live/<cam>/<rung>/ dirs)
+ABR_RUNGS = ("grid", "medium", "high")
+
+def _abr_ladder(grid_w: int, grid_h: int, meta: dict) -> list[dict]:
+    """grid at the grid target, medium at twice that, high at source size."""
+    src_w, src_h = meta.get("width"), meta.get("height")
+    med_w, med_h = grid_w * 2, grid_h * 2
+    if src_w and src_h and (med_w >= src_w or med_h >= src_h):
+        med_w, med_h = src_w, src_h
+    return [
+        {"name": "grid", "width": grid_w, "height": grid_h, "scale": True, "maxrate": "1200k", "audio": False},
+        {"name": "medium", "width": med_w, "height": med_h, "scale": (med_w, med_h) != (src_w, src_h),
+         "maxrate": "2500k", "audio": True},
+        {"name": "high", "width": src_w, "height": src_h, "scale": False, "maxrate": "4000k", "audio": True},
+    ]
+
+def _write_master_playlist(cam_name: str, ladder: list[dict], with_audio: bool):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for r in ladder:
+        bw = int(r["maxrate"].rstrip("k")) * 1000 + (64000 if with_audio and r["audio"] else 0)
+        attrs = f"BANDWIDTH={bw}"
+        if r["width"] and r["height"]:
+            attrs += f",RESOLUTION={r['width']}x{r['height']}"
+        lines += [f"#EXT-X-STREAM-INF:{attrs}", f"{r['name']}/index.m3u8"]
+    body = "\n".join(lines) + "\n"
+    if live_store.memory_enabled():
+        live_store.live_store.put(f"{cam_name}/master.m3u8", body.encode())
+        return
+    path = LIVE_DIR / cam_name / "master.m3u8"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(body)
+    tmp.replace(path)
+
 
 # ----------------------------- Lease Tracker -----------------------------
 
@@ -49,16 +135,38 @@ class LeaseTracker:
     - renew()   -> bump last-seen
     - release() -> drop; when no leases remain, we remember the 'idle_since' time
     Also exposes counts and last_seen/idle_since for reaper logic.
+
+    Expiry is event-driven: a deadline heap holds one 'expire' entry per lease and
+    one 'idle' entry per role that went idle. renew() only bumps a timestamp (no
+    heap work, no logging); a stale 'expire' entry is re-queued when it comes due.
+    run() sleeps until the earliest deadline and calls on_idle(cam_id, role) once
+    a role has had no leases for idle_timeout seconds.
     """
-    def __init__(self):
+    def __init__(self, idle_timeout: Optional[float] = None):
         self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
         self._leases: Dict[Tuple[int, str], Dict[str, float]] = {}
         self._idle_since: Dict[Tuple[int, str], float] = {}
         self._last_seen: Dict[Tuple[int, str], float] = {}
         self._ttl = getattr(settings, "LEASE_TIMEOUT_SEC", 60)
+        self._idle_timeout = (
+            idle_timeout if idle_timeout is not None else getattr(settings, "ROLE_IDLE_TIMEOUT_SEC", 120)
+        )
+        # (deadline, seq, kind, key, lease_id|None); kind is "expire" or "idle"
+        self._heap: list = []
+        self._seq = 0
+
+    def _schedule(self, deadline: float, kind: str, key: Tuple[int, str], lid: Optional[str] = None):
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, kind, key, lid))
+        if self._heap[0][1] == self._seq:
+            self._cond.notify()
+
+    def _became_idle(self, key: Tuple[int, str], now: float):
+        self._idle_since[key] = now
+        self._schedule(now + self._idle_timeout, "idle", key)
 
     def acquire(self, cam_id: int, role: str) -> str:
-        import uuid
         lid = uuid.uuid4().hex
         now = time.time()
         with self._lock:
@@ -66,27 +174,30 @@ class LeaseTracker:
             self._last_seen[(cam_id, role)] = now
             # while leased, clear idle_since
             self._idle_since.pop((cam_id, role), None)
+            self._schedule(now + self._ttl, "expire", (cam_id, role), lid)
+        metrics.LEASE_OPS.inc(role=role, op="acquire")
         return lid
 
     def renew(self, cam_id: int, role: str, lease_id: str) -> bool:
         now = time.time()
-        success = False
         with self._lock:
             leases = self._leases.get((cam_id, role))
             if leases and lease_id in leases:
                 leases[lease_id] = now
                 self._last_seen[(cam_id, role)] = now
-                success = True
-        logger.info("lease renew cam_id %s role %s leases %s", cam_id, role, str(leases))
-        return success
-        
+                metrics.LEASE_OPS.inc(role=role, op="renew")
+                return True
+        metrics.LEASE_OPS.inc(role=role, op="renew_unknown")
+        return False
+
     def release(self, cam_id: int, role: str, lease_id: str):
         with self._lock:
             leases = self._leases.get((cam_id, role))
             if leases and leases.pop(lease_id, None) is not None:
+                metrics.LEASE_OPS.inc(role=role, op="release")
                 if not leases:
                     # became idle now
-                    self._idle_since[(cam_id, role)] = time.time()
+                    self._became_idle((cam_id, role), time.time())
 
     def _prune_expired(self, key: Tuple[int, str]):
         leases = self._leases.get(key)
@@ -96,11 +207,12 @@ class LeaseTracker:
         expired = [lid for lid, ts in leases.items() if now - ts > self._ttl]
         for lid in expired:
             leases.pop(lid, None)
+            metrics.LEASE_OPS.inc(role=key[1], op="expire")
         if expired:
             if leases:
                 self._last_seen[key] = max(leases.values())
             else:
-                self._idle_since[key] = now
+                self._became_idle(key, now)
 
     def snap_count(self, cam_id: int, role: str) -> int:
         key = (cam_id, role)
@@ -125,6 +237,13 @@ class LeaseTracker:
             t = self._idle_since.get((cam_id, role))
             return time.time() - t if t else 0.0
 
+    def all_counts(self) -> Dict[Tuple[int, str], int]:
+        """Live lease count for every (cam_id, role) that has leases."""
+        with self._lock:
+            for key in list(self._leases):
+                self._prune_expired(key)
+            return {key: len(leases) for key, leases in self._leases.items() if leases}
+
     def snapshot_counts(self, cam_id: int) -> Dict[str, int]:
         with self._lock:
             out: Dict[str, int] = {}
@@ -134,6 +253,75 @@ class LeaseTracker:
                 out[r] = len(self._leases.get(key, {}))
             return out
 
+    # ---------- scheduling ----------
+
+    def _pop_due(self, now: float) -> list[Tuple[int, str]]:
+        """Process every heap entry due by now; return roles whose idle timer fired."""
+        fired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, key, lid = heapq.heappop(self._heap)
+            if kind == "expire":
+                leases = self._leases.get(key)
+                ts = leases.get(lid) if leases else None
+                if ts is None:
+                    continue  # released or already pruned
+                if ts + self._ttl > now:
+                    self._schedule(ts + self._ttl, "expire", key, lid)  # renewed since
+                    continue
+                leases.pop(lid, None)
+                metrics.LEASE_OPS.inc(role=key[1], op="expire")
+                if not leases:
+                    self._became_idle(key, now)
+            else:
+                t = self._idle_since.get(key)
+                if t is not None and not self._leases.get(key) and now - t >= self._idle_timeout:
+                    self._idle_since.pop(key, None)
+                    fired.append(key)
+        return fired
+
+    def run(self, on_idle):
+        """Scheduler loop (run in a daemon thread)."""
+        while True:
+            with self._cond:
+                now = time.time()
+                fired = self._pop_due(now)
+                if not fired:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            for cam_id, role in fired:
+                try:
+                    on_idle(cam_id, role)
+                except Exception:
+                    logger.exception("idle handler error cam_id=%s role=%s", cam_id, role)
+
+
+class CamNameIndex(dict):
+    """cam_id -> cam_name with an O(1) reverse lookup (id_for)."""
+
+    def __init__(self):
+        super().__init__()
+        self._ids: Dict[str, int] = {}
+
+    def __setitem__(self, cam_id: int, name: str):
+        old = self.get(cam_id)
+        if old is not None and self._ids.get(old) == cam_id:
+            del self._ids[old]
+        super().__setitem__(cam_id, name)
+        self._ids[name] = cam_id
+
+    def __delitem__(self, cam_id: int):
+        self.pop(cam_id)
+
+    def pop(self, cam_id: int, *default):
+        name = super().pop(cam_id, *default)
+        if name is not None and self._ids.get(name) == cam_id:
+            del self._ids[name]
+        return name
+
+    def id_for(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
 
 # ----------------------------- Manager -----------------------------
 
@@ -141,8 +329,12 @@ class FFmpegManager:
     """
     Role-based process manager:
       - Roles: grid (HLS), medium (HLS), high (HLS), recording (MP4 segments)
+        or, with LIVE_ABR, abr (one decode -> grid/medium/high ladder + master.m3u8)
       - One ffmpeg per (cam_id, role) max; start is idempotent & race-safe
+      - One RTSP pull per source URL (IngestRelay), fanned out to every role using it
       - Leases for medium/high auto-stop when idle > timeout
+      - Exits are seen by one ProcessSupervisor thread; restarts back off exponentially
+        (with jitter) and a role that keeps dying is reported as crash-looping
       - Cleans HLS files on stop
     """
 
@@ -150,12 +342,19 @@ class FFmpegManager:
         self._lock = threading.Lock()
         self._procs: Dict[int, Dict[str, subprocess.Popen]] = {}
         self._inflight: set[Tuple[int, str]] = set()
-        self._cam_names: Dict[int, str] = {}  # cam_id -> cam_name
+        self._cam_names = CamNameIndex()  # cam_id -> cam_name (+ reverse index)
         self._leases = LeaseTracker()
         self._configs: Dict[int, Dict[str, dict]] = {}
+        self._relays: Dict[str, IngestRelay] = {}  # src url -> relay
+        self._stream_meta: Dict[str, dict] = {}  # src url -> probed codec info (for encode planning)
+        self._rec_runs = itertools.count(1)  # per recording process: keeps segment names unique
+        self._restarts: Dict[Tuple[int, str], dict] = {}  # backoff state per (cam_id, role)
         self._shutting_down = False
+        self._progress: Dict[Tuple[int, str], RoleProgress] = {}  # -progress telemetry per role
+        self._supervisor = ProcessSupervisor("ffmpeg-supervisor")
+        self._supervisor.call_later(self._stall_check_sec(), self._check_stalls)
 
-        threading.Thread(target=self._idle_reaper, daemon=True).start()
+        threading.Thread(target=self._leases.run, args=(self._on_role_idle,), daemon=True).start()
 
     # ---------- public: leases ----------
 
@@ -179,9 +378,11 @@ class FFmpegManager:
         crf: int,
         scale_w: Optional[int] = None,
         scale_h: Optional[int] = None,
+        meta: Optional[dict] = None,
     ):
         """
         Safe, idempotent start. Only one ffmpeg per (cam_id, role).
+        meta: probed stream info for src (see roles.stream_meta); enables stream-copy when compatible.
         """
         key = (cam_id, role)
 
@@ -202,10 +403,15 @@ class FFmpegManager:
             if existing and not _alive(existing):
                 self._procs[cam_id].pop(role, None)
 
+            if meta is not None:
+                self._stream_meta[src] = meta
+
         # build/spawn outside lock
         try:
             if role == "recording":
                 new_proc = self._start_recording_proc(cam_name, src, crf)
+            elif role == "abr":
+                new_proc = self._start_abr_proc(cam_name, src, crf, scale_w, scale_h)
             else:
                 new_proc = self._start_hls_proc(cam_name, role, src, crf, scale_w, scale_h)
         except Exception:
@@ -239,18 +445,25 @@ class FFmpegManager:
                 "crf": crf,
                 "scale_w": scale_w,
                 "scale_h": scale_h,
+                "meta": meta,
             }
-            threading.Thread(
-                target=self._wait_and_restart,
-                args=(cam_id, role, new_proc),
-                daemon=True,
-            ).start()
+            st = self._restarts.setdefault(key, {"failures": 0, "last_rc": None})
+            st["started"] = time.time()
+            st["next_at"] = None
+            prog = RoleProgress() if new_proc.stdout is not None else None
+            if prog:
+                self._progress[key] = prog
+            else:
+                self._progress.pop(key, None)
+            self._supervisor.watch(new_proc, partial(self._on_exit, cam_id, role), prog.feed if prog else None)
             logger.info("Started cam_id=%s role=%s", cam_id, role)
             return {"ok": True}
 
     def stop_role(self, cam_id: int, cam_name: str, role: str):
         with self._lock:
             p = (self._procs.get(cam_id) or {}).pop(role, None)
+            self._restarts.pop((cam_id, role), None)
+            self._progress.pop((cam_id, role), None)
             cfgs = self._configs.get(cam_id)
             if cfgs:
                 cfgs.pop(role, None)
@@ -275,6 +488,10 @@ class FFmpegManager:
             procs_by_role = self._procs.pop(cam_id, {}) or {}
             self._cam_names.pop(cam_id, None)
             self._configs.pop(cam_id, None)
+            for key in [k for k in self._restarts if k[0] == cam_id]:
+                self._restarts.pop(key)
+            for key in [k for k in self._progress if k[0] == cam_id]:
+                self._progress.pop(key)
         for role, p in procs_by_role.items():
             try:
                 if _alive(p):
@@ -285,6 +502,7 @@ class FFmpegManager:
                     if _alive(p): p.kill()
                 except Exception:
                     pass
+        self._stop_relays(cam_name)
         self._cleanup_live_all(cam_name)
         logger.info("Stopped camera %s cam_id=%s", cam_name, cam_id)
 
@@ -297,14 +515,200 @@ class FFmpegManager:
         for cam_id in cam_ids:
             cam_name = self._cam_names.get(cam_id) or str(cam_id)
             self.stop_camera(cam_id, cam_name)
+        self._stop_relays()
+
+    def role_src(self, cam_id: int, role: str) -> Optional[str]:
+        """Source the role's running process was started from (None if not running)."""
+        with self._lock:
+            p = (self._procs.get(cam_id) or {}).get(role)
+            cfg = (self._configs.get(cam_id) or {}).get(role)
+        return cfg["src"] if cfg and _alive(p) else None
 
     def status(self, cam_id: int) -> dict:
         with self._lock:
             procs_by_role = self._procs.get(cam_id) or {}
             roles = {r: _alive(p) for r, p in procs_by_role.items()}
+            restarts = {
+                role: self._restart_state(st, roles.get(role, False))
+                for (cid, role), st in self._restarts.items() if cid == cam_id
+            }
+            progress = {
+                role: prog.as_dict()
+                for (cid, role), prog in self._progress.items() if cid == cam_id and roles.get(role)
+            }
+            cam_name = self._cam_names.get(cam_id)
+            relays = [
+                {"alive": r.alive, "subscribers": r.subscriber_count(), "detached_slow": r.detached_slow()}
+                for r in self._relays.values() if r.cam_name == cam_name
+            ]
         lease_counts = self._leases.snapshot_counts(cam_id)
-        return {"running": any(roles.values()), "roles": roles, "leases": lease_counts}
-        
+        for role, info in progress.items():
+            info["last_segment_at"] = self._last_segment_at(cam_name, role) if cam_name else None
+        return {
+            "running": any(roles.values()),
+            "roles": roles,
+            "leases": lease_counts,
+            "relays": relays,
+            "progress": progress,
+            "restarts": {r: st for r, st in restarts.items() if st["failures"] or st["stalls"]},
+            "crash_looping": sorted(r for r, st in restarts.items() if st["crash_looping"]),
+        }
+
+    @staticmethod
+    def _restart_state(st: dict, alive: bool) -> dict:
+        now = time.time()
+        failures = st["failures"]
+        if alive and now - st.get("started", now) >= settings.RESTART_HEALTHY_SEC:
+            failures = 0  # back on its feet; the count resets at its next exit
+        next_at = st.get("next_at")
+        return {
+            "failures": failures,
+            "last_rc": st.get("last_rc"),
+            "next_restart_in": round(max(0.0, next_at - now), 1) if next_at and not alive else None,
+            "crash_looping": failures >= settings.RESTART_CRASHLOOP_COUNT,
+            "stalls": st.get("stalls", 0),
+        }
+
+    @staticmethod
+    def _last_segment_at(cam_name: str, role: str) -> Optional[float]:
+        """When the role last finished an output segment (its playlist/segment list was rewritten)."""
+        if role == "recording":
+            try:
+                return (REC_DIR / cam_name / SEGMENT_LIST_NAME).stat().st_mtime
+            except FileNotFoundError:
+                return None
+        if role == "abr":
+            role = "grid"
+        playlist = PARTS_PLAYLIST if role in ll_roles() else "index.m3u8"
+        return live_store.mtime(LIVE_DIR, f"{cam_name}/{role}/{playlist}")
+
+    # ---------- metrics ----------
+
+    def collect_metrics(self) -> list:
+        """Scrape-time families: processes, uptime, /proc CPU and RSS, restart state, encoder progress, leases."""
+        now = time.time()
+        with self._lock:
+            names = dict(self._cam_names)
+            procs = [
+                (names.get(cam_id) or str(cam_id), role, p, self._restarts.get((cam_id, role)) or {},
+                 self._progress.get((cam_id, role)))
+                for cam_id, by_role in self._procs.items() for role, p in by_role.items()
+            ]
+            relays = [(r.cam_name, r.pid) for r in self._relays.values()]
+        F = metrics.Family
+        running = F("homecam_ffmpeg_processes", "gauge", "Running ffmpeg processes per role.")
+        up = F("homecam_ffmpeg_up", "gauge", "1 if the role's ffmpeg is running, 0 while it waits for a restart.")
+        uptime = F("homecam_ffmpeg_uptime_seconds", "gauge", "Seconds since the role's ffmpeg was started.")
+        cpu = F("homecam_ffmpeg_cpu_seconds", "counter", "CPU time used by the process (from /proc).")
+        rss = F("homecam_ffmpeg_rss_bytes", "gauge", "Resident memory of the process (from /proc).")
+        failures = F("homecam_ffmpeg_restart_failures", "gauge", "Quick exits in a row (restart backoff level).")
+        fps = F("homecam_ffmpeg_fps", "gauge", "Encoder frames per second (ffmpeg -progress).")
+        speed = F("homecam_ffmpeg_speed", "gauge", "Encoder speed relative to real time (ffmpeg -progress).")
+        drops = F("homecam_ffmpeg_dropped_frames", "counter", "Frames dropped by the encoder since its start.")
+        per_role: Dict[str, int] = {}
+        for cam_name, role, p, st, prog in procs:
+            alive = _alive(p)
+            per_role[role] = per_role.get(role, 0) + alive
+            up.add(int(alive), camera=cam_name, role=role)
+            failures.add(st.get("failures", 0), camera=cam_name, role=role)
+            if not alive:
+                continue
+            if st.get("started"):
+                uptime.add(round(now - st["started"], 1), camera=cam_name, role=role)
+            sample = metrics.proc_stats(p.pid)
+            if sample:
+                cpu.add(sample[0], camera=cam_name, role=role)
+                rss.add(sample[1], camera=cam_name, role=role)
+            if prog is not None:
+                fps.add(prog.fps, camera=cam_name, role=role)
+                speed.add(prog.speed, camera=cam_name, role=role)
+                drops.add(prog.drop_frames, camera=cam_name, role=role)
+        for cam_name, pid in relays:
+            sample = metrics.proc_stats(pid) if pid else None
+            if sample:
+                per_role["relay"] = per_role.get("relay", 0) + 1
+                cpu.add(sample[0], camera=cam_name, role="relay")
+                rss.add(sample[1], camera=cam_name, role="relay")
+        for role, n in sorted(per_role.items()):
+            running.add(n, role=role)
+        leases = F("homecam_leases", "gauge", "Active viewer leases per camera and role.")
+        for (cam_id, role), n in sorted(self._leases.all_counts().items()):
+            leases.add(n, camera=names.get(cam_id) or str(cam_id), role=role)
+        watched = F("homecam_supervised_processes", "gauge", "Processes watched by the ffmpeg supervisor.")
+        watched.add(self._supervisor.watched())
+        return [running, up, uptime, cpu, rss, failures, fps, speed, drops, leases, watched]
+
+    # ---------- ingest relays ----------
+
+    def _relay_for(self, cam_name: str, src: str) -> Optional[IngestRelay]:
+        """Get (or start) the shared RTSP ingest for src. None when relaying is disabled."""
+        if not settings.INGEST_RELAY:
+            return None
+        with self._lock:
+            relay = self._relays.get(src)
+            if relay is not None and relay.alive:
+                return relay
+            relay = IngestRelay(
+                cam_name,
+                src,
+                LIVE_DIR / cam_name / "ffmpeg_relay.log",
+                linger=settings.RELAY_LINGER_SEC,
+                max_chunks=settings.RELAY_QUEUE_CHUNKS,
+                rtsp_timeout=settings.RTSP_TIMEOUT_SEC,
+            )
+            relay.start()
+            self._relays[src] = relay
+            return relay
+
+    def _stop_relays(self, cam_name: Optional[str] = None):
+        with self._lock:
+            srcs = [s for s, r in self._relays.items() if cam_name is None or r.cam_name == cam_name]
+            relays = [self._relays.pop(s) for s in srcs]
+        for r in relays:
+            r.stop()
+
+    def _spawn_from_source(
+        self,
+        cmd_tail: list[str],
+        cam_name: str,
+        src: str,
+        log: Path,
+        input_opts: Optional[list[str]] = None,
+        stdout=subprocess.DEVNULL,
+        progress: bool = False,
+    ) -> subprocess.Popen:
+        """
+        Spawn `ffmpeg [input_opts] <input> <cmd_tail>` reading src through the camera's ingest relay.
+        progress: report -progress blocks on stdout (a pipe) for the role's telemetry.
+        """
+        relay = self._relay_for(cam_name, src)
+        if progress:
+            stdout = subprocess.PIPE
+        cmd = [
+            "ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "warning",
+            *(PROGRESS_ARGS if progress else []),
+            *(input_opts or []),
+            *_input_args(src, relay),
+            *cmd_tail,
+        ]
+        if relay is None:
+            return _spawn(cmd, log, stdout=stdout)
+        proc = _spawn(cmd, log, stdin=subprocess.PIPE, stdout=stdout)
+        if not relay.attach(proc):
+            # relay went away between lookup and attach; the role's restart path retries
+            proc.stdin.close()
+        return proc
+
+    def spawn_tap(self, cam_name: str, src: str, cmd_tail: list[str], input_opts: Optional[list[str]] = None) -> subprocess.Popen:
+        """
+        An extra consumer of src's ingest relay whose output is read in-process
+        (stdout=PIPE), e.g. the motion detector. Not a role: the caller owns it.
+        """
+        return self._spawn_from_source(
+            cmd_tail, cam_name, src, LIVE_DIR / cam_name / "ffmpeg_tap.log",
+            input_opts=input_opts, stdout=subprocess.PIPE,
+        )
+
     # ---------- spawn routines (no registry writes here) ----------
 
     def _start_hls_proc(
@@ -317,87 +721,156 @@ class FFmpegManager:
         scale_h: Optional[int],
     ) -> subprocess.Popen:
         (LIVE_DIR / cam_name / role).mkdir(parents=True, exist_ok=True)
-        out_dir = LIVE_DIR / cam_name / role
         log = LIVE_DIR / cam_name / f"ffmpeg_{role}.log"
         seg = "2"
 
-        enc = [
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
-            "-g", "48", "-sc_threshold", "0",
-            "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
-            "-maxrate", "4000k" if role != "grid" else "1200k",
-            "-bufsize", "4000k" if role != "grid" else "1200k",
-        ]
-        vf = []
-        if scale_w and scale_h:
-            vf = ["-vf", f"scale={scale_w}:{scale_h}"]  # only used for grid/auto
-
         mapping = ["-map", "0:v"]
-        audio = ["-an"]
         if role != "grid":
             mapping += ["-map", "0:a?"]
-            audio = ["-c:a", "aac", "-ar", "44100", "-ac", "1"]
 
-        cmd = [
-            "ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "warning",
-            "-rtsp_transport", "tcp",
-            "-i", src,
+        if role in ll_roles():
+            # LL-HLS: every fMP4 "segment" ffmpeg writes is one keyframe-aligned part;
+            # llhls.py groups them into segments and renders index.m3u8 itself.
+            part = f"{settings.LL_HLS_PART_SEC:g}"
+            plan = plan_encode(role, None, crf, scale_w, scale_h, seg_sec=settings.LL_HLS_PART_SEC)
+            list_size = str(settings.LL_HLS_PARTS_PER_SEGMENT * 6)
+            tail = [
+                "-fflags", "+genpts",
+                *mapping,
+                *plan["video"], *plan["audio"],
+                *_hls_opts(part, list_size),
+                "-hls_segment_type", "fmp4",
+                "-hls_fmp4_init_filename", "init.mp4",
+                "-hls_segment_filename", _live_out(cam_name, role, "part_%06d.m4s"),
+                _live_out(cam_name, role, PARTS_PLAYLIST),
+            ]
+            return self._spawn_from_source(tail, cam_name, src, log, progress=True)
+
+        plan = plan_encode(role, self._stream_meta.get(src), crf, scale_w, scale_h, seg_sec=int(seg))
+
+        tail = [
             "-fflags", "+genpts",
             *mapping,
-            *vf, *enc, *audio,
+            *plan["video"], *plan["audio"],
+            *_hls_opts(seg, "12"),
+            "-hls_segment_filename", _live_out(cam_name, role, "segment_%06d.ts"),
+            _live_out(cam_name, role, "index.m3u8"),
+        ]
+        return self._spawn_from_source(tail, cam_name, src, log, progress=True)
+
+    def _start_abr_proc(
+        self,
+        cam_name: str,
+        src: str,
+        crf: int,
+        grid_w: Optional[int],
+        grid_h: Optional[int],
+    ) -> subprocess.Popen:
+        """
+        Decode once, split, and encode the grid/medium/high ladder in one ffmpeg.
+        Every rung uses the same forced-keyframe schedule so segments line up and
+        players can switch rung at any segment boundary. Variants land in the usual
+        live/<cam>/<rung>/index.m3u8 places; master.m3u8 is written next to them.
+        """
+        base = LIVE_DIR / cam_name
+        for rung in ABR_RUNGS:
+            (base / rung).mkdir(parents=True, exist_ok=True)
+        log = base / "ffmpeg_abr.log"
+        seg = "2"
+        meta = self._stream_meta.get(src) or {}
+        ladder = _abr_ladder(grid_w or 640, grid_h or 360, meta)
+        with_audio = bool(meta.get("audio_codec"))
+
+        scales = ";".join(
+            f"[v{i}]scale={r['width']}:{r['height']}[o{i}]" if r["scale"] else f"[v{i}]null[o{i}]"
+            for i, r in enumerate(ladder)
+        )
+        tail = [
+            "-fflags", "+genpts",
+            "-filter_complex", f"[0:v]split={len(ladder)}" + "".join(f"[v{i}]" for i in range(len(ladder))) + ";" + scales,
+        ]
+        stream_map = []
+        a = 0
+        for i, r in enumerate(ladder):
+            tail += ["-map", f"[o{i}]"]
+            entry = f"v:{i}"
+            if with_audio and r["audio"]:
+                tail += ["-map", "0:a:0"]
+                entry += f",a:{a}"
+                a += 1
+            stream_map.append(f"{entry},name:{r['name']}")
+        tail += [
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf),
+            "-g", "48", "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
+        ]
+        for i, r in enumerate(ladder):
+            tail += [f"-maxrate:v:{i}", r["maxrate"], f"-bufsize:v:{i}", r["maxrate"]]
+        if a:
+            tail += ["-c:a", "aac", "-ar", "44100", "-ac", "1", "-b:a", "64k"]
+        tail += [
             *_hls_opts(seg, "12"),
-            "-hls_segment_filename", str(out_dir / "segment_%06d.ts"),
-            str(out_dir / "index.m3u8"),
+            "-var_stream_map", " ".join(stream_map),
+            "-hls_segment_filename", _live_out(cam_name, "%v", "segment_%06d.ts"),
+            _live_out(cam_name, "%v", "index.m3u8"),
         ]
-        return _spawn(cmd, log)
+        _write_master_playlist(cam_name, ladder, with_audio)
+        return self._spawn_from_source(tail, cam_name, src, log, progress=True)
 
     def _start_recording_proc(self, cam_name: str, src: str, crf: int) -> subprocess.Popen:
         self._ensure_rec_date_hour(cam_name)
         rec_base = REC_DIR / cam_name
         log = LIVE_DIR / cam_name / f"ffmpeg_recording.log"
 
-        # Determine start index so we don't clobber existing files when
-        # restarting within the same period. We only care about the current
-        # date/hour since future segments will get unique names automatically.
-        now = time.localtime()
-        date_dir = time.strftime("%Y-%m-%d", now)
-        hour_dir = time.strftime("%H", now)
-        hour_path = rec_base / date_dir / hour_dir
-        base_prefix = f"{date_dir}_{hour_dir}-00-00"
-        start_num = len(list(hour_path.glob(f"{base_prefix}*.mp4")))
+        plan = plan_encode("recording", self._stream_meta.get(src), crf)
 
-        cmd = [
-            "ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "warning",
-            "-rtsp_transport", "tcp",
-            "-i", src,
+        # Files are named by their wall-clock start plus this process's run number:
+        # with -strftime the segment number is not substituted, and a restart within
+        # the same second would otherwise overwrite the segment just closed. ffmpeg
+        # appends one CSV line (name,start,end) per closed segment, which the
+        # recording index tails.
+        run = next(self._rec_runs) % 1000
+        tail = [
             "-fflags", "+genpts",
             "-map", "0:v", "-map", "0:a?",
-            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(max(18, min(28, crf))),
-            "-c:a", "aac", "-b:a", "128k",
-            # Place moov atom at the beginning so files are playable while downloading
-            "-movflags", "+faststart",
+            *plan["video"], *plan["audio"],
             "-f", "segment",
-            "-segment_time", str(settings.RECORDING_SEGMENT_SEC),
+            *_recording_movflags(),
+            "-segment_time", str(recording_policy.segment_sec(cam_name)),
             "-segment_atclocktime", "1",
             "-segment_clocktime_offset", "0",
-            "-segment_start_number", str(start_num),
+            "-segment_list", str(rec_base / SEGMENT_LIST_NAME),
+            "-segment_list_type", "csv",
             "-reset_timestamps", "1",
             "-strftime", "1",
-            str(rec_base / "%Y-%m-%d/%H/%Y-%m-%d_%H-00-00_%03d.mp4"),
+            str(rec_base / f"%Y-%m-%d/%H/%Y-%m-%d_%H-%M-%S_{run:03d}.mp4"),
         ]
-        return _spawn(cmd, log)
+        return self._spawn_from_source(tail, cam_name, src, log, progress=True)
 
     def start_by_config(self, cam):
         """
         Start roles that should always be on based on current config:
           - grid: always on (according to auto/manual selection & optional scaling)
+          - abr: with LIVE_ABR, the grid/medium/high ladder instead of grid
           - recording: only if retention > 0 and role not disabled
         This method intentionally takes a 'resolver' callable (cam, role) -> (src, scale_w, scale_h, run)
         so ffmpeg_manager stays model-agnostic.
         """
+        # ABR ladder replaces the separate grid/medium/high processes
+        src, sw, sh, run = resolve_role(cam, "abr")
+        if run and src:
+            self.start_role(
+                cam_id=cam.id,
+                cam_name=cam.name,
+                role="abr",
+                src=src,
+                crf=cam.high_crf,
+                scale_w=sw, scale_h=sh,
+                meta=stream_meta(cam, src),
+            )
         # Grid
         src, sw, sh, run = resolve_role(cam, "grid")
-        if run and src:
+        if run and src and not settings.LIVE_ABR:
             self.start_role(
                 cam_id=cam.id,
                 cam_name=cam.name,
@@ -405,6 +878,7 @@ class FFmpegManager:
                 src=src,
                 crf=cam.low_crf,
                 scale_w=sw, scale_h=sh,
+                meta=stream_meta(cam, src),
             )
     
         # Recording (honor retention inside resolver)
@@ -417,6 +891,7 @@ class FFmpegManager:
                 src=src,
                 crf=cam.high_crf,
                 # no scaling for recording; sw/sh ignored
+                meta=stream_meta(cam, src),
             )
         
     # ---------- filesystem helpers ----------
@@ -428,7 +903,15 @@ class FFmpegManager:
         hour_dir.mkdir(parents=True, exist_ok=True)
 
     def _cleanup_live_role(self, cam_name: str, role: str):
+        if role != "abr":
+            live_store.live_store.clear(f"{cam_name}/{role}")
         try:
+            if role == "abr":
+                live_store.live_store.delete(f"{cam_name}/master.m3u8")
+                for rung in ABR_RUNGS:
+                    self._cleanup_live_role(cam_name, rung)
+                (LIVE_DIR / cam_name / "master.m3u8").unlink(missing_ok=True)
+                return
             d = LIVE_DIR / cam_name / role
             if d.exists():
                 shutil.rmtree(d)
@@ -436,6 +919,7 @@ class FFmpegManager:
             pass
 
     def _cleanup_live_all(self, cam_name: str):
+        live_store.live_store.clear(cam_name)
         try:
             base = LIVE_DIR / cam_name
             if base.exists():
@@ -443,63 +927,102 @@ class FFmpegManager:
         except Exception:
             pass
 
-    # ---------- idle reaper ----------
+    # ---------- idle stop ----------
 
-    def _idle_reaper(self):
-        interval = getattr(settings, "IDLE_REAPER_INTERVAL_SEC", 10)
-        timeout = getattr(settings, "ROLE_IDLE_TIMEOUT_SEC", 120)
-        logger.info("Idle reaper started: interval=%ss timeout=%ss", interval, timeout)
-        while True:
-            time.sleep(interval)
+    def _on_role_idle(self, cam_id: int, role: str):
+        """Called by the lease scheduler once a role has had no viewers for ROLE_IDLE_TIMEOUT_SEC."""
+        if role not in {"medium", "high"}:
+            return
+        with self._lock:
+            p = (self._procs.get(cam_id) or {}).get(role)
+            cam_name = self._cam_names.get(cam_id)
+        if not _alive(p):
+            return
+        logger.info("Auto-stopping idle cam_id=%s role=%s", cam_id, role)
+        # prefer full stop with cleanup if we have cam_name
+        if cam_name:
+            self.stop_role(cam_id, cam_name, role)
+        else:
+            self._stop_role_internal(cam_id, role)
+
+    # ---------- stall watchdog ----------
+
+    @staticmethod
+    def _stall_check_sec() -> float:
+        return min(5.0, max(0.2, settings.STALL_TIMEOUT_SEC / 4)) if settings.STALL_TIMEOUT_SEC > 0 else 5.0
+
+    def _check_stalls(self):
+        """
+        Kill roles whose output has not advanced for STALL_TIMEOUT_SEC; the exit path restarts them.
+        A stall usually sits upstream in the ingest relay's RTSP session: a relay that has sent
+        nothing for that long (or half of it, when one of its roles stalled) is stopped too, or
+        the restarted roles would just attach to the same dead session.
+        """
+        self._supervisor.call_later(self._stall_check_sec(), self._check_stalls)
+        if settings.STALL_TIMEOUT_SEC <= 0 or self._shutting_down:
+            return
+        now = time.time()
+        stalled = []
+        with self._lock:
+            for (cam_id, role), prog in self._progress.items():
+                p = (self._procs.get(cam_id) or {}).get(role)
+                if _alive(p) and not prog.ended and prog.stalled_for(now) > settings.STALL_TIMEOUT_SEC:
+                    st = self._restarts.setdefault((cam_id, role), {"failures": 0, "last_rc": None})
+                    st["stalls"] = st.get("stalls", 0) + 1
+                    stalled.append((cam_id, role, p, prog.stalled_for(now)))
+            dead_relays = []
+            for src, relay in list(self._relays.items()):
+                limit = settings.STALL_TIMEOUT_SEC
+                if any(relay.feeds(p) for _, _, p, _ in stalled):
+                    limit /= 2
+                if relay.idle_for() > limit:
+                    dead_relays.append(self._relays.pop(src))
+        for relay in dead_relays:
+            metrics.FFMPEG_STALLS.inc(camera=relay.cam_name, role="relay")
+            logger.warning("Ingest relay for %s sent nothing for %.0fs; stopping it", relay.cam_name, relay.idle_for())
+            relay.stop()  # its roles get EOF and restart on a fresh RTSP session
+        for cam_id, role, p, idle in stalled:
+            metrics.FFMPEG_STALLS.inc(camera=self._cam_names.get(cam_id) or str(cam_id), role=role)
+            logger.warning("FFmpeg output stalled for %.0fs; killing cam_id=%s role=%s", idle, cam_id, role)
             try:
-                # snapshot keys to avoid holding lock during stops
-                with self._lock:
-                    cam_ids = list(self._procs.keys())
-                for cam_id in cam_ids:
-                    cam_name = None
-                    with self._lock:
-                        roles_map = dict(self._procs.get(cam_id, {}))
-                        cam_name = self._cam_names.get(cam_id)
-                    for role in ("medium", "high"):
-                        p = roles_map.get(role)
-                        if not _alive(p):
-                            # not running anyway; continue
-                            continue
-                        # if anyone is watching, keep it
-                        lease_count = self._leases.snap_count(cam_id, role)
-                        logger.info(
-                            "Reaper keep cam_id=%s role=%s active_leases=%s",
-                            cam_id,
-                            role,
-                            lease_count,
-                        )
-                        if lease_count > 0:
-                            continue
-                        # no leases: check idle duration
-                        idle_s = self._leases.idle_for(cam_id, role)
-                        logger.info(
-                            "Reaper idle cam_id=%s role=%s idle=%ss", cam_id, role, int(idle_s)
-                        )
-                        if idle_s and idle_s > timeout:
-                            logger.info(
-                                "Auto-stopping cam_id=%s role=%s after idle %ss",
-                                cam_id,
-                                role,
-                                int(idle_s),
-                            )
-                            # prefer full stop with cleanup if we have cam_name
-                            if cam_name:
-                                self.stop_role(cam_id, cam_name, role)
-                            else:
-                                # fallback: just stop the proc
-                                self._stop_role_internal(cam_id, role)
+                p.kill()
             except Exception:
-                logger.exception("Idle reaper error")
+                pass
 
-    def _wait_and_restart(self, cam_id: int, role: str, proc: subprocess.Popen):
-        rc = proc.wait()
+    def _on_exit(self, cam_id: int, role: str, proc: subprocess.Popen, rc: Optional[int]):
+        """Supervisor callback: a role's ffmpeg exited; schedule its restart with backoff."""
+        key = (cam_id, role)
+        now = time.time()
+        with self._lock:
+            current = (self._procs.get(cam_id) or {}).get(role)
+            if current is not proc or self._shutting_down:
+                return  # stopped or replaced on purpose
+            st = self._restarts.setdefault(key, {"failures": 0, "last_rc": None})
+            if now - st.get("started", now) >= settings.RESTART_HEALTHY_SEC:
+                st["failures"] = 0
+            st["failures"] += 1
+            st["last_rc"] = rc
+            failures = st["failures"]
+            delay = backoff_delay(failures)
+            st["next_at"] = now + delay
+            cam_name = self._cam_names.get(cam_id) or str(cam_id)
+        metrics.FFMPEG_EXITS.inc(camera=cam_name, role=role)
+        if failures == settings.RESTART_CRASHLOOP_COUNT:
+            logger.error("cam_id=%s role=%s is crash-looping (%s quick exits in a row)", cam_id, role, failures)
+        logger.warning(
+            "FFmpeg process exited rc=%s; restarting cam_id=%s role=%s in %.1fs",
+            rc,
+            cam_id,
+            role,
+            delay,
+        )
+        self._supervisor.call_later(delay, self._restart, cam_id, role, proc)
+
+    def _restart(self, cam_id: int, role: str, proc: subprocess.Popen):
+        """Restart a role whose ffmpeg exited, unless it was stopped or should no longer run."""
         with self._lock:
             current = (self._procs.get(cam_id) or {}).get(role)
+            state = self._restarts.get((cam_id, role))
             cfg = (self._configs.get(cam_id) or {}).get(role)
             lease_count = self._leases.snap_count(cam_id, role)
         cam_obj = None
@@ -521,6 +1044,7 @@ class FFmpegManager:
                         "crf": cam_obj.low_crf if role in {"grid", "medium"} else cam_obj.high_crf,
                         "scale_w": sw,
                         "scale_h": sh,
+                        "meta": stream_meta(cam_obj, src),
                     }
                 else:
                     cfg = None
@@ -534,8 +1058,11 @@ class FFmpegManager:
             should_run = False
 
         if not should_run:
-            # Remove stale bookkeeping; thread exits without restart
+            # Remove stale bookkeeping; no restart
             with self._lock:
+                if current is proc:
+                    self._restarts.pop((cam_id, role), None)
+                    self._progress.pop((cam_id, role), None)
                 procs = self._procs.get(cam_id)
                 if procs and procs.get(role) is proc:
                     procs.pop(role, None)
@@ -549,12 +1076,6 @@ class FFmpegManager:
             return
 
         if current is proc:
-            logger.warning(
-                "FFmpeg process exited rc=%s; restarting cam_id=%s role=%s",
-                rc,
-                cam_id,
-                role,
-            )
             self.start_role(
                 cam_id=cam_id,
                 cam_name=cfg["cam_name"],
@@ -563,11 +1084,19 @@ class FFmpegManager:
                 crf=cfg["crf"],
                 scale_w=cfg.get("scale_w"),
                 scale_h=cfg.get("scale_h"),
+                meta=cfg.get("meta"),
             )
+            with self._lock:
+                stopped = self._restarts.get((cam_id, role)) is not state
+            if stopped:
+                # stop_role ran while we were spawning; don't leave an orphan behind
+                self._stop_role_internal(cam_id, role)
 
     def _stop_role_internal(self, cam_id: int, role: str):
         with self._lock:
             p = (self._procs.get(cam_id) or {}).pop(role, None)
+            self._restarts.pop((cam_id, role), None)
+            self._progress.pop((cam_id, role), None)
             cfgs = self._configs.get(cam_id)
             if cfgs:
                 cfgs.pop(role, None)
@@ -586,3 +1115,4 @@ class FFmpegManager:
         # (no cleanup here; used only when cam_name is unknown)
 
 ffmpeg_manager = FFmpegManager()
+metrics.registry.collector("ffmpeg", ffmpeg_manager.collect_metrics)
@@ -1,28 +1,72 @@
 import json, subprocess, shlex, datetime as dt
+from typing import Optional
+
+# How much of the live stream to sample when measuring the GOP
+GOP_SAMPLE_SEC = 6
+
+def _parse_fps(afr) -> Optional[int]:
+    # avg_frame_rate like "30/1"
+    if afr and isinstance(afr, str) and "/" in afr:
+        num, den = afr.split("/")
+        try:
+            return int(round(float(num) / float(den)))
+        except Exception:
+            return None
+    return None
+
+def _gop_from_frames(frames: list, video_index) -> Optional[int]:
+    """Median distance (in frames) between keyframes of the sampled video frames."""
+    keys = []
+    n = 0
+    for fr in frames:
+        if fr.get("stream_index") != video_index:
+            continue
+        if int(fr.get("key_frame") or 0):
+            keys.append(n)
+        n += 1
+    gaps = sorted(b - a for a, b in zip(keys, keys[1:]))
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
 
 def probe_rtsp(rtsp_url: str) -> dict:
     """
-    Returns: dict(width, height, fps, bitrate_kbps)
+    Returns: dict(width, height, fps, bitrate_kbps, codec, profile, gop, audio_codec)
+    gop is in frames (None if fewer than two keyframes were seen in the sample);
+    audio_codec is None when the stream has no audio.
     """
     # -rtsp_transport tcp improves reliability
-    cmd = f'ffprobe -v error -select_streams v:0 -show_entries stream=width,height,avg_frame_rate,bit_rate ' \
+    cmd = f'ffprobe -v error -read_intervals %+{GOP_SAMPLE_SEC} ' \
+          f'-show_entries stream=index,codec_type,codec_name,profile,width,height,avg_frame_rate,bit_rate' \
+          f':frame=stream_index,key_frame ' \
           f'-of json -rtsp_transport tcp "{rtsp_url}"'
-    p = subprocess.run(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=15)
+    p = subprocess.run(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=15 + GOP_SAMPLE_SEC)
     if p.returncode != 0:
         raise RuntimeError(p.stderr.decode("utf-8", "ignore"))
     data = json.loads(p.stdout.decode())
-    st = (data.get("streams") or [{}])[0]
+    streams = data.get("streams") or []
+    st = next((s for s in streams if s.get("codec_type") == "video"), {})
+    au = next((s for s in streams if s.get("codec_type") == "audio"), {})
     width = st.get("width")
     height = st.get("height")
-    # avg_frame_rate like "30/1"
-    afr = st.get("avg_frame_rate")
-    fps = None
-    if afr and isinstance(afr, str) and "/" in afr:
-        num, den = afr.split("/")
-        try:
-            fps = int(round(float(num) / float(den)))
-        except Exception:
-            fps = None
+    fps = _parse_fps(st.get("avg_frame_rate"))
     bitrate = st.get("bit_rate")
     kbps = int(round(int(bitrate)/1000)) if bitrate else None
-    return {"width": width, "height": height, "fps": fps, "bitrate_kbps": kbps, "probed_at": dt.datetime.utcnow()}
+    return {
+        "width": width, "height": height, "fps": fps, "bitrate_kbps": kbps,
+        "codec": st.get("codec_name"),
+        "profile": st.get("profile"),
+        "gop": _gop_from_frames(data.get("frames") or [], st.get("index")),
+        "audio_codec": au.get("codec_name"),
+        "probed_at": dt.datetime.utcnow(),
+    }
+
+def probe_duration(path: str) -> Optional[float]:
+    """Container duration of a media file in seconds (None if ffprobe can't tell)."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path]
+    try:
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+        dur = json.loads(p.stdout or b"{}").get("format", {}).get("duration")
+        return float(dur) if dur not in (None, "N/A") else None
+    except Exception:
+        return None
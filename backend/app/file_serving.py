@@ -0,0 +1,226 @@
+# backend/app/file_serving.py
+"""
+Serving recorded MP4 files (recording segments, saved clips).
+
+serve_file() is the one range server both endpoints use: conditional requests,
+single/suffix/multipart ranges, file bytes read with pread() in a worker thread.
+uvicorn has no ASGI zero-copy send, so the zero-copy path is ACCEL_REDIRECT: the
+API only validates the request and answers with an X-Accel-Redirect to an
+internal nginx location (see deploy/nginx/nginx.conf); nginx then serves the
+bytes with sendfile.
+"""
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+
+def safe_path(root: Path, *parts: str) -> Path:
+    """root/parts, refusing anything that would escape root (404 like a missing file)."""
+    path = root.joinpath(*parts)
+    try:
+        path.resolve().relative_to(root.resolve())
+    except ValueError:
+        raise HTTPException(404, "Not found")
+    return path
+
+
+def accel_redirect(location: str, root: Path, path: Path, media_type: str, headers: Optional[dict] = None) -> Response:
+    """Hand the file off to nginx: `location` is the internal prefix aliased to `root`."""
+    rel = path.relative_to(root).as_posix()
+    out = dict(headers or {})
+    out["X-Accel-Redirect"] = location.rstrip("/") + "/" + quote(rel)
+    return Response(status_code=200, media_type=media_type, headers=out)
+
+
+# ----------------------------- native range server -----------------------------
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16          # more than this and we just send the whole file
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a Range header into sorted, merged (start, end) pairs (end inclusive).
+    None if the header is malformed or not bytes (serve the whole file);
+    [] if no range is satisfiable (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                n = int(last)  # suffix range: the last n bytes
+                if n <= 0:
+                    continue
+                start, end = max(size - n, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _etag_listed(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class FileRangeResponse(Response):
+    """
+    Sends byte spans of a file without loading it: pread() in a worker thread, one
+    chunk at a time (for kernel sendfile, put nginx in front: ACCEL_REDIRECT).
+    Each chunk is only read after the previous send() returned, so a slow client
+    holds back the reads (the server's flow control is the backpressure).
+    """
+
+    def __init__(self, path: Path, spans: List[Tuple[bytes, int, int]], trailer: bytes,
+                 status_code: int, media_type: str, headers: dict, send_body: bool = True):
+        # spans: (bytes to send first, start, end inclusive); trailer goes last
+        self.path = path
+        self.spans = spans
+        self.trailer = trailer
+        self.send_body = send_body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        length = sum(len(p) + e - s + 1 for p, s, e in spans) + len(trailer)
+        self.init_headers({**headers, "Content-Length": str(length)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        fd = await anyio.to_thread.run_sync(os.open, str(self.path), os.O_RDONLY)
+        try:
+            for prefix, start, end in self.spans:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                await self._send_span(send, fd, start, end - start + 1)
+            await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    async def _send_span(send, fd: int, offset: int, count: int):
+        while count > 0:
+            data = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, count), offset)
+            if not data:
+                break  # file shrank under us; nothing more to send
+            offset += len(data)
+            count -= len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+
+
+def serve_file(request: Request, path: Path, media_type: str = "video/mp4", cacheable: bool = True) -> Response:
+    """
+    GET/HEAD a file with conditional requests (ETag / Last-Modified, If-None-Match,
+    If-Modified-Since -> 304, If-Range) and single, suffix and multipart byte ranges.
+    cacheable=False (a segment still being written) drops the validators, marks the
+    response no-store and serves the bytes present at request time.
+    """
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        raise HTTPException(404, "Not found")
+    size = st.st_size
+    headers = {"Accept-Ranges": "bytes"}
+    etag = None
+    if cacheable:
+        etag = _etag(st)
+        headers["ETag"] = etag
+        headers["Last-Modified"] = formatdate(st.st_mtime, usegmt=True)
+    else:
+        headers["Cache-Control"] = "no-store"
+
+    send_body = request.method != "HEAD"
+    if etag:
+        inm = request.headers.get("if-none-match")
+        ims = request.headers.get("if-modified-since")
+        if inm is not None:
+            not_modified = _etag_listed(inm, etag)
+        else:
+            since = _parse_http_date(ims) if ims else None
+            not_modified = since is not None and int(st.st_mtime) <= since
+        if not_modified:
+            return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Accept-Ranges"})
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is not None:
+            if if_range.strip().startswith(('"', "W/")):
+                fresh = etag is not None and if_range.strip() == etag
+            else:
+                fresh = etag is not None and if_range.strip() == headers["Last-Modified"]
+            if not fresh:
+                range_header = None  # representation changed: send all of it
+        if range_header:
+            ranges = parse_range(range_header, size)
+    if ranges == []:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+    if ranges and len(ranges) > MAX_RANGES:
+        ranges = None
+
+    if not ranges:
+        spans = [(b"", 0, size - 1)] if size else []
+        return FileRangeResponse(path, spans, b"", 200, media_type, headers, send_body)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileRangeResponse(path, [(b"", start, end)], b"", 206, media_type, headers, send_body)
+
+    boundary = uuid.uuid4().hex
+    spans = [
+        (
+            (f"\r\n--{boundary}\r\nContent-Type: {media_type}\r\n"
+             f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode(),
+            start,
+            end,
+        )
+        for start, end in ranges
+    ]
+    trailer = f"\r\n--{boundary}--\r\n".encode()
+    return FileRangeResponse(
+        path, spans, trailer, 206, f"multipart/byteranges; boundary={boundary}", headers, send_body
+    )
@@ -1,9 +1,16 @@
 import logging
-from typing import Optional, Dict, Tuple
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
 
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
 from starlette.staticfiles import StaticFiles
 
+from .config import settings
 from .ffmpeg_manager import ffmpeg_manager
+from . import llhls, live_store
 
 logger = logging.getLogger(__name__)
 
@@ -13,38 +20,118 @@ class LeaseRenewStaticFiles(StaticFiles):
     For medium and high quality streams, the first request will automatically
     acquire a lease for the stream.  Subsequent requests will renew that lease
     so the underlying ffmpeg process remains active while content is served.
+    Leases are per viewer: the `session` query parameter or `homecam_session`
+    cookie when the player sends one, otherwise the client address + user agent.
+    Session ids are client-chosen, so one address + user agent gets at most
+    LEASE_SESSIONS_PER_CLIENT of them per stream; further new ids share the
+    client's own lease instead of acquiring more (rotating ids can't pile up leases).
+
+    Roles listed in LL_HLS_ROLES are answered by llhls (rendered LL-HLS playlist,
+    blocking reload, virtual segments) before falling back to plain files. With
+    LIVE_STORE=memory live files come from the in-memory segment store instead
+    of the disk. Live playlists are sent no-cache, segments immutable.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._leases: Dict[Tuple[int, str], str] = {}
+        # (cam_id, role, viewer) -> (lease_id, last request, client if a session); least recently seen first
+        self._leases: "OrderedDict[Tuple[int, str, str], Tuple[str, float, Optional[str]]]" = OrderedDict()
+        self._sessions: Dict[Tuple[int, str, str], int] = {}  # (cam_id, role, client) -> live session keys
 
     async def get_response(self, path: str, scope):  # type: ignore[override]
-        # Serve the actual file first
-        response = await super().get_response(path, scope)
+        # Serve the actual file first (LL-HLS roles render playlists/segments themselves)
+        response = await self._live_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+            if path.startswith("live/"):
+                response.headers.update(live_store.cache_headers(path))
 
         try:
             parts = path.split("/")
-            if len(parts) >= 3 and parts[0] == "live":
-                cam_name = parts[1]
-                role = parts[2]
-                if role in {"medium", "high"}:
-                    cam_id = _cam_id_by_name(cam_name)
-                    if cam_id is not None:
-                        key = (cam_id, role)
-                        lease_id = self._leases.get(key)
-                        if lease_id is None or not ffmpeg_manager.renew_lease(cam_id, role, lease_id):
-                            lease_id = ffmpeg_manager.acquire_lease(cam_id, role)
-                            self._leases[key] = lease_id
+            if len(parts) >= 3 and parts[0] == "live" and parts[2] in {"medium", "high"}:
+                cam_id = _cam_id_by_name(parts[1])
+                if cam_id is not None:
+                    self._touch(cam_id, parts[2], *_viewer_key(scope))
         except Exception:  # pragma: no cover - best effort logging
             logger.exception("lease renew error")
 
         return response
 
+    def _touch(self, cam_id: int, role: str, session: Optional[str], client: str):
+        now = time.time()
+        # forget viewers that stopped requesting (their leases have expired anyway)
+        ttl = settings.LEASE_TIMEOUT_SEC
+        while self._leases:
+            oldest = next(iter(self._leases.values()))
+            if now - oldest[1] <= ttl:
+                break
+            self._forget(*self._leases.popitem(last=False))
+
+        owner = None
+        key = (cam_id, role, client)
+        if session is not None:
+            skey = (cam_id, role, "s:" + session)
+            if skey in self._leases or self._sessions.get(key, 0) < settings.LEASE_SESSIONS_PER_CLIENT:
+                key, owner = skey, client
+            # else: past the cap, a new session id shares the client's own lease
+        entry = self._leases.get(key)
+        if entry is None:
+            if owner is not None:
+                self._sessions[(cam_id, role, owner)] = self._sessions.get((cam_id, role, owner), 0) + 1
+        elif not ffmpeg_manager.renew_lease(cam_id, role, entry[0]):
+            entry = None
+        lease_id = entry[0] if entry is not None else ffmpeg_manager.acquire_lease(cam_id, role)
+        self._leases[key] = (lease_id, now, owner)
+        self._leases.move_to_end(key)
+
+    def _forget(self, key: Tuple[int, str, str], entry: Tuple[str, float, Optional[str]]):
+        owner = entry[2]
+        if owner is None:
+            return
+        counted = (key[0], key[1], owner)
+        left = self._sessions.get(counted, 0) - 1
+        if left > 0:
+            self._sessions[counted] = left
+        else:
+            self._sessions.pop(counted, None)
+
+    async def _live_response(self, path: str, scope):
+        parts = path.split("/")
+        if len(parts) < 3 or parts[0] != "live":
+            return None
+        if ".." in parts or scope["method"] not in ("GET", "HEAD"):
+            return None
+        live_dir = Path(self.directory) / "live"
+        if len(parts) == 4 and parts[2] in llhls.ll_roles():
+            response = await llhls.get_response(live_dir, f"{parts[1]}/{parts[2]}", parts[3], scope)
+            if response is not None:
+                return response
+        if not live_store.memory_enabled():
+            return None
+        name = parts[-1]
+        data = live_store.read(live_dir, "/".join(parts[1:]))
+        if data is None:
+            raise HTTPException(status_code=404)
+        headers = {**live_store.cache_headers(name), "Content-Length": str(len(data))}
+        body = data if scope["method"] == "GET" else b""
+        return Response(body, media_type=live_store.media_type(name), headers=headers)
+
+
+def _viewer_key(scope) -> Tuple[Optional[str], str]:
+    """(session token if the player sends one, client address + user agent)."""
+    headers = dict(scope.get("headers") or [])
+    client = scope.get("client") or ("", 0)
+    address = f"{client[0]}|{headers.get(b'user-agent', b'').decode('latin-1')}"
+    for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+        if part.startswith("session=") and len(part) > 8:
+            return part[8:], address
+    for c in headers.get(b"cookie", b"").decode("latin-1").split(";"):
+        name, _, value = c.strip().partition("=")
+        if name == "homecam_session" and value:
+            return value, address
+    return None, address
+
 
 def _cam_id_by_name(name: str) -> Optional[int]:
     """Helper to resolve cam_id from name using ffmpeg_manager state."""
-    for cid, cname in ffmpeg_manager._cam_names.items():  # type: ignore[attr-defined]
-        if cname == name:
-            return cid
-    return None
+    return ffmpeg_manager._cam_names.id_for(name)  # type: ignore[attr-defined]
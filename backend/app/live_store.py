@@ -0,0 +1,151 @@
+# backend/app/live_store.py
+"""
+RAM-backed store for live HLS output (LIVE_STORE=memory).
+
+ffmpeg's HLS muxer PUTs playlists/segments to /ingest/live/<cam>/<role>/<file>
+on the API itself (and DELETEs expired segments); the /media mount serves them
+straight from here, so live video never touches the disk. Each <cam>/<role>
+directory is a ring bounded by LIVE_STORE_ROLE_MAX_MB: when full, the oldest
+media files are evicted (playlists and init segments are kept).
+
+read()/version() hide the backend so callers work the same with LIVE_STORE=disk.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .config import settings
+
+PLAYLIST_HEADERS = {"Cache-Control": "no-cache"}
+SEGMENT_HEADERS = {"Cache-Control": "public, max-age=60, immutable"}
+
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+def cache_headers(name: str) -> dict:
+    """Playlists change constantly; segment names are never reused."""
+    return PLAYLIST_HEADERS if name.endswith(".m3u8") else SEGMENT_HEADERS
+
+
+def media_type(name: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+def memory_enabled() -> bool:
+    return settings.LIVE_STORE == "memory"
+
+
+def _evictable(name: str) -> bool:
+    return not (name.endswith(".m3u8") or name.startswith("init"))
+
+
+class LiveSegmentStore:
+    """Files keyed by their path relative to the live dir, e.g. 'cam1/grid/segment_000001.ts'."""
+
+    def __init__(self, role_max_bytes: int):
+        self._lock = threading.Lock()
+        self._max = role_max_bytes
+        # parent dir ('cam1/grid') -> name -> (data, mtime, version); insertion order = age
+        self._dirs: dict[str, "OrderedDict[str, Tuple[bytes, float, int]]"] = {}
+        self._bytes: dict[str, int] = {}
+        self._seq = 0
+
+    @staticmethod
+    def _split(rel: str) -> Tuple[str, str]:
+        parent, _, name = rel.strip("/").rpartition("/")
+        return parent, name
+
+    def put(self, rel: str, data: bytes):
+        parent, name = self._split(rel)
+        with self._lock:
+            files = self._dirs.setdefault(parent, OrderedDict())
+            old = files.pop(name, None)
+            used = self._bytes.get(parent, 0) - (len(old[0]) if old else 0) + len(data)
+            self._seq += 1
+            files[name] = (data, time.time(), self._seq)
+            for victim in [n for n in files if _evictable(n)]:
+                if used <= self._max or victim == name:
+                    break
+                used -= len(files.pop(victim)[0])
+            self._bytes[parent] = used
+
+    def get(self, rel: str) -> Optional[Tuple[bytes, float, int]]:
+        parent, name = self._split(rel)
+        with self._lock:
+            return (self._dirs.get(parent) or {}).get(name)
+
+    def delete(self, rel: str):
+        parent, name = self._split(rel)
+        with self._lock:
+            files = self._dirs.get(parent)
+            old = files.pop(name, None) if files else None
+            if old:
+                self._bytes[parent] -= len(old[0])
+
+    def clear(self, prefix: str):
+        """Drop everything under prefix ('cam1' or 'cam1/grid')."""
+        prefix = prefix.strip("/")
+        with self._lock:
+            for parent in [p for p in self._dirs if p == prefix or p.startswith(prefix + "/")]:
+                self._dirs.pop(parent, None)
+                self._bytes.pop(parent, None)
+
+    def newest(self, parent: str, suffix: str) -> Optional[str]:
+        """Name of the most recently written file in parent ending with suffix."""
+        with self._lock:
+            files = self._dirs.get(parent.strip("/")) or {}
+            names = [n for n in files if n.endswith(suffix)]
+            return max(names, key=lambda n: files[n][2]) if names else None
+
+    def usage(self) -> dict:
+        with self._lock:
+            return dict(self._bytes)
+
+
+live_store = LiveSegmentStore(settings.LIVE_STORE_ROLE_MAX_MB * 1024 * 1024)
+
+
+# ---------- backend-agnostic access (rel is relative to the live dir) ----------
+
+def read(live_dir: Path, rel: str) -> Optional[bytes]:
+    if memory_enabled():
+        e = live_store.get(rel)
+        return e[0] if e else None
+    try:
+        return (live_dir / rel).read_bytes()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def version(live_dir: Path, rel: str) -> Optional[int]:
+    """Changes whenever rel is rewritten; None if it doesn't exist."""
+    if memory_enabled():
+        e = live_store.get(rel)
+        return e[2] if e else None
+    try:
+        return os.stat(live_dir / rel).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def mtime(live_dir: Path, rel: str) -> Optional[float]:
+    """Wall-clock time rel was last written; None if it doesn't exist."""
+    if memory_enabled():
+        e = live_store.get(rel)
+        return e[1] if e else None
+    try:
+        return os.stat(live_dir / rel).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def exists(live_dir: Path, rel: str) -> bool:
+    return version(live_dir, rel) is not None
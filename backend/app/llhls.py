@@ -0,0 +1,268 @@
+# backend/app/llhls.py
+"""
+Low-Latency HLS on top of ffmpeg's plain fMP4 HLS output.
+
+ffmpeg can't emit EXT-X-PART playlists, so LL roles run ffmpeg with very short
+fMP4 segments (one keyframe each) written to parts.m3u8 / part_NNNNNN.m4s.
+Here those short segments become LL-HLS *parts*: every LL_HLS_PARTS_PER_SEGMENT
+of them form one media segment, served as the virtual seg_<msn>.m4s (the parts
+concatenated - fMP4 fragments concatenate cleanly). index.m3u8 is rendered on
+request and supports blocking playlist reload (_HLS_msn/_HLS_part) and blocking
+preload-hint part requests, so players long-poll instead of re-polling.
+"""
+import asyncio
+import math
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import Response
+
+from .config import settings
+from . import live_store
+from .live_store import PLAYLIST_HEADERS, SEGMENT_HEADERS as MEDIA_HEADERS
+
+PARTS_PLAYLIST = "parts.m3u8"
+PART_RE = re.compile(r"part_(\d+)\.m4s$")
+SEG_RE = re.compile(r"seg_(\d+)\.m4s$")
+POLL_SEC = 0.05
+MAX_ROLES = 256  # cached LLRole readers (LRU)
+
+
+def ll_roles() -> set[str]:
+    return {r.strip() for r in settings.LL_HLS_ROLES.split(",") if r.strip()}
+
+
+def part_name(n: int) -> str:
+    return f"part_{n:06d}.m4s"
+
+
+# ----------------------------- parsing -----------------------------
+
+def parse_parts_playlist(text: str) -> dict:
+    """
+    Parse ffmpeg's fMP4 playlist into {"init": str|None, "parts": [(n, dur), ...]}
+    where n is the part number taken from part_NNNNNN.m4s.
+    """
+    init = None
+    parts = []
+    dur = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MAP:"):
+            m = re.search(r'URI="([^"]+)"', line)
+            init = m.group(1) if m else None
+        elif line.startswith("#EXTINF:"):
+            try:
+                dur = float(line[8:].split(",")[0])
+            except ValueError:
+                dur = None
+        elif line and not line.startswith("#"):
+            m = PART_RE.search(line)
+            if m and dur is not None:
+                parts.append((int(m.group(1)), dur))
+            dur = None
+    return {"init": init, "parts": parts}
+
+
+class PartsState:
+    """Snapshot of one LL role's parts, grouped into media segments."""
+
+    def __init__(self, parsed: dict, per_seg: int):
+        self.init = parsed["init"]
+        self.per_seg = per_seg
+        self.durs = dict(parsed["parts"])
+        self.last = max(self.durs) if self.durs else -1
+
+    def has(self, msn: int, part: Optional[int] = None) -> bool:
+        """True once the playlist would contain segment msn (or its part `part`)."""
+        if part is None:
+            need = (msn + 1) * self.per_seg - 1
+        else:
+            need = msn * self.per_seg + part
+        return self.last >= need
+
+    @property
+    def last_msn(self) -> int:
+        """msn of the segment currently being filled (may be incomplete)."""
+        return self.last // self.per_seg if self.last >= 0 else -1
+
+    def segment_parts(self, msn: int) -> Optional[list[int]]:
+        nums = list(range(msn * self.per_seg, (msn + 1) * self.per_seg))
+        if all(n in self.durs for n in nums):
+            return nums
+        return None
+
+
+# ----------------------------- rendering -----------------------------
+
+def render_playlist(state: PartsState, part_target: float, keep_part_segments: int = 3) -> str:
+    per_seg = state.per_seg
+    target = math.ceil(part_target * per_seg)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:9",
+        f"#EXT-X-TARGETDURATION:{target}",
+        f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}",
+        f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * part_target:.3f}",
+    ]
+    if state.last < 0:
+        return "\n".join(lines) + "\n"
+
+    first = min(state.durs)
+    first_msn = math.ceil(first / per_seg)
+    last_msn = state.last_msn
+    complete = [m for m in range(first_msn, last_msn + 1) if state.segment_parts(m)]
+    if not complete and first_msn > last_msn:
+        return "\n".join(lines) + "\n"
+
+    lines.append(f"#EXT-X-MEDIA-SEQUENCE:{first_msn}")
+    if state.init:
+        lines.append(f'#EXT-X-MAP:URI="{state.init}"')
+
+    def part_lines(nums):
+        return [
+            f'#EXT-X-PART:DURATION={state.durs[n]:.3f},URI="{part_name(n)}",INDEPENDENT=YES'
+            for n in nums
+        ]
+
+    recent = set(complete[-keep_part_segments:])
+    for msn in range(first_msn, last_msn + 1):
+        nums = state.segment_parts(msn)
+        if nums is None:
+            break
+        if msn in recent:
+            lines += part_lines(nums)
+        lines.append(f"#EXTINF:{sum(state.durs[n] for n in nums):.3f},")
+        lines.append(f"seg_{msn}.m4s")
+
+    # parts of the segment still being filled, then the hint for the next one
+    open_msn = state.last // per_seg if state.segment_parts(state.last // per_seg) is None else None
+    if open_msn is not None:
+        lines += part_lines([n for n in range(open_msn * per_seg, state.last + 1) if n in state.durs])
+    lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{part_name(state.last + 1)}"')
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------- serving -----------------------------
+
+class LLRole:
+    """Reads one role (live/<cam>/<role>), re-parsing parts.m3u8 only when it changes."""
+
+    def __init__(self, live_dir: Path, prefix: str):
+        self.live_dir = live_dir
+        self.prefix = prefix
+        self._version = None
+        self._state: Optional[PartsState] = None
+
+    def read(self, name: str) -> Optional[bytes]:
+        return live_store.read(self.live_dir, f"{self.prefix}/{name}")
+
+    def state(self) -> Optional[PartsState]:
+        ver = live_store.version(self.live_dir, f"{self.prefix}/{PARTS_PLAYLIST}")
+        if ver is None:
+            return None
+        if ver != self._version:
+            data = self.read(PARTS_PLAYLIST)
+            if data is None:
+                return None
+            self._state = PartsState(parse_parts_playlist(data.decode()), settings.LL_HLS_PARTS_PER_SEGMENT)
+            self._version = ver
+        return self._state
+
+    async def wait(self, pred, timeout: float) -> Optional[PartsState]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            st = self.state()
+            if st is not None and pred(st):
+                return st
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(POLL_SEC)
+
+
+_roles: "OrderedDict[tuple, LLRole]" = OrderedDict()
+
+
+def _role(live_dir: Path, prefix: str) -> LLRole:
+    """
+    Cached reader for a role. Only roles that have a parts playlist are cached
+    (URLs can name any camera), and the cache is an LRU of MAX_ROLES.
+    """
+    key = (live_dir, prefix)
+    r = _roles.get(key)
+    if r is not None:
+        _roles.move_to_end(key)
+        return r
+    r = LLRole(live_dir, prefix)
+    if r.state() is not None:
+        _roles[key] = r
+        while len(_roles) > MAX_ROLES:
+            _roles.popitem(last=False)
+    return r
+
+
+def _int_param(q: dict, name: str) -> Optional[int]:
+    v = q.get(name)
+    if not v:
+        return None
+    try:
+        return int(v[0])
+    except ValueError:
+        return None
+
+
+async def get_response(live_dir: Path, prefix: str, filename: str, scope) -> Optional[Response]:
+    """
+    Serve an LL role's (prefix = '<cam>/<role>') playlist, virtual segments and
+    (blocking) preload parts. Returns None for anything the plain live handler
+    should serve (init.mp4, parts that already exist).
+    """
+    part_target = settings.LL_HLS_PART_SEC
+    role = _role(live_dir, prefix)
+    block = 3 * part_target * settings.LL_HLS_PARTS_PER_SEGMENT
+
+    if filename == "index.m3u8":
+        q = parse_qs(scope.get("query_string", b"").decode())
+        msn, part = _int_param(q, "_HLS_msn"), _int_param(q, "_HLS_part")
+        st = role.state()
+        if msn is not None:
+            if st is not None and msn > st.last_msn + 2:
+                return Response("msn too far ahead", status_code=400)
+            st = await role.wait(lambda s: s.has(msn, part), block)
+            if st is None:
+                return Response("playlist not updated in time", status_code=503)
+        if st is None:
+            return Response("not ready", status_code=404)
+        body = render_playlist(st, part_target)
+        return Response(body, media_type="application/vnd.apple.mpegurl", headers=PLAYLIST_HEADERS)
+
+    m = SEG_RE.match(filename)
+    if m:
+        msn = int(m.group(1))
+        st = role.state()
+        nums = st.segment_parts(msn) if st else None
+        if nums is None:
+            return Response("segment not available", status_code=404)
+        chunks = [role.read(part_name(n)) for n in nums]
+        if any(c is None for c in chunks):
+            return Response("segment expired", status_code=404)
+        return Response(b"".join(chunks), media_type="video/mp4", headers=MEDIA_HEADERS)
+
+    m = PART_RE.match(filename)
+    if m and role.read(filename) is None:
+        # preload hint: hold the request until ffmpeg finishes this part
+        n = int(m.group(1))
+        st = role.state()
+        if st is None or n > st.last + 1:
+            return Response("part not available", status_code=404)
+        st = await role.wait(lambda s: s.last >= n, block)
+        data = role.read(filename) if st is not None else None
+        if data is None:
+            return Response("part not available", status_code=404)
+        return Response(data, media_type="video/mp4", headers=MEDIA_HEADERS)
+
+    return None
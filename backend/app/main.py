@@ -1,41 +1,56 @@
 # backend/app/main.py
 from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import os
-import re
 from pathlib import Path
 import logging
 import time
-import subprocess
-import tempfile
-import shutil
 from sqlalchemy.orm import Session
 import threading
-from typing import List
+from typing import List, Optional
 from .models import CameraStream
 from .schemas import CameraStreamCreate, CameraStreamOut
 from .ffprobe_utils import probe_rtsp
-from .roles import resolve_role
+from .roles import resolve_role, stream_meta
 import datetime as dt
 
 
-from .db import Base, engine, get_session, SessionLocal
-from .models import RoleMode, CameraStream, Camera
+from .db import Base, engine, get_session, SessionLocal, add_missing_columns
+from .models import RoleMode, CameraStream, Camera, MotionEvent, MotionHour, MotionSourceOutage
 from .schemas import (
     CameraCreate, CameraUpdate,
     CameraStreamCreate, CameraStreamOut,
     CameraRoleUpdate, CameraAdminOut,
+    RetentionStatusOut,
     CameraClientItem, CameraClientList,
     RecordingFile,
+    TimelineOut,
+    RecordingLookup,
+    MotionEventsOut,
+    MotionHistogramOut,
+    CameraExportRequest,
+    ExportJobOut,
     ClipExportRequest,
     SavedVideo,
 )
 from .ffmpeg_manager import ffmpeg_manager
 from .lease_static import LeaseRenewStaticFiles
-from .recordings import list_recordings
-from .config import settings, MEDIA_ROOT, LIVE_DIR, REC_DIR, CLIP_DIR
-from .retention import run_retention_loop
+from .file_serving import safe_path, accel_redirect, serve_file
+from .export import ExportError, ExportPlan, FilePlan, NoFootage
+from .export_jobs import export_queue, new_output_path, download_name, stream_clip, ExportBusy, StreamError, DONE
+from .live_store import live_store
+from .recordings import list_recordings, is_growing, run_index_loop, timeline, lookup, TIMELINE_MAX_SEC
+from .config import settings, MEDIA_ROOT, LIVE_DIR, REC_DIR, CLIP_DIR, COLD_DIR
+from .retention import retention_engine, run_policy_loop
+from .recording_policy import recording_policy, has_motion_source, is_motion_policy, POLICIES as RECORDING_POLICIES
+from .snapshots import snapshot_cache
+from .onvif_events import onvif_events
+from .motion_detect import motion_detector, parse_mask
+from . import motion_index
+from . import metrics
+from .thumbnails import asset_paths, start_workers as start_thumbnail_workers
+from .archive import start_workers as start_archive_workers
 
 app = FastAPI(title="HomeCam API", version="0.2.0")
 
@@ -44,11 +59,24 @@ logging.getLogger("uvicorn.access").disabled = True
 access_logger = logging.getLogger("homecam.access")
 
 
+def _route_label(request: Request) -> str:
+    """Route template (/api/cameras/{cam_id}/...) so metrics don't get a series per id."""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    mount = request.scope.get("root_path") or ""
+    return f"{mount}/*" if mount else "unmatched"
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start = time.time()
     response = await call_next(request)
-    duration = (time.time() - start) * 1000
+    elapsed = time.time() - start
+    duration = elapsed * 1000
+    route = _route_label(request)
+    metrics.HTTP_LATENCY.observe(elapsed, method=request.method, route=route)
+    metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
     client = request.client
     access_logger.debug(
         "%s - \"%s %s\" %d %.2fms",
@@ -77,23 +105,39 @@ CLIP_DIR.mkdir(parents=True, exist_ok=True)
 
 # DB schema
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
 
 # Serve /media (used by both dev and docker)
 app.mount("/media", LeaseRenewStaticFiles(directory=str(MEDIA_ROOT)), name="media")
 
-# Background retention loop (daily)
-threading.Thread(target=run_retention_loop, args=(get_session,), daemon=True).start()
-
-def ensure_stream_probed(session: Session, s: CameraStream) -> CameraStream:
-    """If stream has no width/height, run ffprobe and persist metadata."""
-    if s.width and s.height:
-        return s
-    meta = probe_rtsp(s.rtsp_url)
+# Retention: age limits and the disk watermark, every RETENTION_INTERVAL_SEC
+threading.Thread(target=retention_engine.run, name="retention", daemon=True).start()
+# Motion-aware recording tiers: drop / re-encode quiet segments
+threading.Thread(target=run_policy_loop, daemon=True).start()
+# Recording segment index (startup scan + ffmpeg segment lists)
+threading.Thread(target=run_index_loop, daemon=True).start()
+# Scrub-preview sprite sheets for closed segments (low priority)
+start_thumbnail_workers()
+# Cold tier: re-encode aged segments into COLD_ROOT (only with COLD_ROOT set)
+start_archive_workers()
+
+def apply_probe(s: CameraStream, meta: dict):
+    """Copy probe_rtsp() results onto the stream row (caller commits)."""
     s.width = meta.get("width")
     s.height = meta.get("height")
     s.fps = meta.get("fps")
     s.bitrate_kbps = meta.get("bitrate_kbps")
+    s.codec = meta.get("codec")
+    s.profile = meta.get("profile")
+    s.gop = meta.get("gop")
+    s.audio_codec = meta.get("audio_codec")
     s.probed_at = meta.get("probed_at") or dt.datetime.utcnow()
+
+def ensure_stream_probed(session: Session, s: CameraStream) -> CameraStream:
+    """If stream has no width/height, run ffprobe and persist metadata."""
+    if s.width and s.height:
+        return s
+    apply_probe(s, probe_rtsp(s.rtsp_url))
     session.commit()
     session.refresh(s)
     return s
@@ -124,17 +168,24 @@ def pick_best_stream(cam: Camera, want_w: int, want_h: int):
 def autostart():
     s = SessionLocal()
     try:
+        motion_index.backfill(s)  # before event sources start writing
         cams = s.query(Camera).all()
         for cam in cams:
+            recording_policy.watch(cam)
             ffmpeg_manager.start_by_config(cam)
             if cam.retention_days > 0:
                 src, sw, sh, run = resolve_role(cam,"recording")
-                if run and src: ffmpeg_manager.start_role(cam.id, cam.name, "recording", src, cam.high_crf)
+                if run and src: ffmpeg_manager.start_role(cam.id, cam.name, "recording", src, cam.high_crf, meta=stream_meta(cam, src))
+            if settings.ONVIF_EVENTS:
+                onvif_events.watch(cam)
+            motion_detector.watch(cam)
     finally: s.close()
 
 @app.on_event("shutdown")
 def shutdown_event():
+    motion_detector.shutdown()
     ffmpeg_manager.shutdown()
+    onvif_events.shutdown()
 
 @app.put("/api/admin/cameras/{cam_id}/roles", response_model=CameraAdminOut)
 def admin_update_roles(cam_id: int, body: CameraRoleUpdate, session: Session = Depends(get_session)):
@@ -169,37 +220,51 @@ def admin_update_roles(cam_id: int, body: CameraRoleUpdate, session: Session = D
 
     return cam    
 
+def start_abr_ladder(cam: Camera) -> dict:
+    """LIVE_ABR: grid/medium/high all come from the one always-on ladder process."""
+    src, sw, sh, run = resolve_role(cam, "abr")
+    if not run or not src:
+        return {"ok": False, "reason": "disabled"}
+    res = ffmpeg_manager.start_role(cam.id, cam.name, "abr", src, cam.high_crf, sw, sh, meta=stream_meta(cam, src))
+    return {"ok": True, "abr": True, **(res if isinstance(res, dict) else {})}
+
 # Medium/high on-demand controls
 @app.post("/api/admin/cameras/{cam_id}/medium/start")
 def start_medium(cam_id:int, session:Session=Depends(get_session)):
     cam = session.get(Camera, cam_id);  assert cam
+    if settings.LIVE_ABR: return start_abr_ladder(cam)
     src, sw, sh, run = resolve_role(cam,"medium")
     if not run or not src: return {"ok": False, "reason":"disabled"}
-    ffmpeg_manager.start_role(cam.id, cam.name, "medium", src, cam.low_crf)
+    ffmpeg_manager.start_role(cam.id, cam.name, "medium", src, cam.low_crf, meta=stream_meta(cam, src))
     return {"ok": True}
 
 @app.post("/api/admin/cameras/{cam_id}/medium/stop")
 def stop_medium(cam_id: int, session: Session = Depends(get_session)):
     cam = session.get(Camera, cam_id); assert cam
+    if settings.LIVE_ABR: return {"ok": True, "abr": True}  # rung belongs to the always-on ladder
     ffmpeg_manager.stop_role(cam.id, cam.name, "medium")
     return {"ok": True}
 
 @app.post("/api/admin/cameras/{cam_id}/high/start")
 def start_high(cam_id:int, session:Session=Depends(get_session)):
     cam = session.get(Camera, cam_id);  assert cam
+    if settings.LIVE_ABR: return start_abr_ladder(cam)
     src, sw, sh, run = resolve_role(cam,"high")
     if not run or not src: return {"ok": False, "reason":"disabled"}
-    ffmpeg_manager.start_role(cam.id, cam.name, "high", src, cam.high_crf)
+    ffmpeg_manager.start_role(cam.id, cam.name, "high", src, cam.high_crf, meta=stream_meta(cam, src))
     return {"ok": True}
 
 @app.post("/api/admin/cameras/{cam_id}/high/stop")
 def stop_high(cam_id: int, session: Session = Depends(get_session)):
     cam = session.get(Camera, cam_id); assert cam
+    if settings.LIVE_ABR: return {"ok": True, "abr": True}  # rung belongs to the always-on ladder
     ffmpeg_manager.stop_role(cam.id, cam.name, "high")
     return {"ok": True}
 
 # ----------------------------- Admin API (with RTSP) ------------------------------
 
+NO_MOTION_SOURCE = "a motion recording_policy needs a motion source: onvif_port (with ONVIF_EVENTS on) or motion_detect"
+
 @app.get("/api/admin/cameras", response_model=list[CameraAdminOut])
 def admin_list_cameras(session: Session = Depends(get_session)):
     return session.query(Camera).order_by(Camera.id.asc()).all()
@@ -208,17 +273,33 @@ def admin_list_cameras(session: Session = Depends(get_session)):
 @app.post("/api/admin/cameras", response_model=CameraAdminOut)
 def admin_create_camera(body: CameraCreate, session: Session = Depends(get_session)):
     # backend/app/main.py (inside admin_create_camera)
+    if body.retention_priority is not None and body.retention_priority < 1:
+        raise HTTPException(400, "retention_priority must be at least 1")
+    if body.recording_policy is not None and body.recording_policy not in RECORDING_POLICIES:
+        raise HTTPException(400, f"recording_policy must be one of {', '.join(RECORDING_POLICIES)}")
     cam = Camera(
         name=body.name,
         rtsp_url=body.rtsp_url,
         retention_days=body.retention_days or settings.DEFAULT_RETENTION_DAYS,
+        onvif_port=body.onvif_port,
+        motion_detect=body.motion_detect,
+        recording_policy=body.recording_policy,
+        retention_priority=body.retention_priority,
     )
+    if is_motion_policy(cam.recording_policy):
+        if not has_motion_source(cam):
+            raise HTTPException(400, NO_MOTION_SOURCE)
+        cam.recording_policy_since = time.time()
     session.add(cam); session.commit(); session.refresh(cam)
+    recording_policy.watch(cam)
+    if settings.ONVIF_EVENTS:
+        onvif_events.watch(cam)
     
     # seed master stream
     from .models import CameraStream
     master = CameraStream(camera_id=cam.id, name="master", rtsp_url=cam.rtsp_url, enabled=True, is_master=True)
     session.add(master); session.commit(); session.refresh(cam)
+    motion_detector.watch(cam)
     return cam
 
 @app.put("/api/admin/cameras/{cam_id}", response_model=CameraAdminOut)
@@ -228,13 +309,35 @@ def admin_update_camera(cam_id: int, body: CameraUpdate, session: Session = Depe
         raise HTTPException(404, "Not found")
 
     old_ret = cam.retention_days or 0
-
+    if body.motion_mask:
+        try:
+            parse_mask(body.motion_mask, settings.MOTION_WIDTH, settings.MOTION_HEIGHT)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    if body.recording_policy is not None and body.recording_policy not in RECORDING_POLICIES:
+        raise HTTPException(400, f"recording_policy must be one of {', '.join(RECORDING_POLICIES)}")
+    if body.retention_priority is not None and body.retention_priority < 1:
+        raise HTTPException(400, "retention_priority must be at least 1")
+
+    old_policy = cam.recording_policy
     for f, v in body.dict(exclude_unset=True).items():
         setattr(cam, f, v)
+    if is_motion_policy(cam.recording_policy):
+        if not has_motion_source(cam):
+            session.rollback()
+            raise HTTPException(400, NO_MOTION_SOURCE)
+        if not is_motion_policy(old_policy):
+            cam.recording_policy_since = time.time()
+    else:
+        cam.recording_policy_since = None
     session.commit()
     session.refresh(cam)
 
     new_ret = cam.retention_days or 0
+    recording_policy.watch(cam)
+    if settings.ONVIF_EVENTS:
+        onvif_events.watch(cam)
+    motion_detector.watch(cam)
 
     # If recordings were enabled and are now disabled:
     if old_ret > 0 and new_ret <= 0:
@@ -270,12 +373,27 @@ def admin_update_camera(cam_id: int, body: CameraUpdate, session: Session = Depe
 
     return cam
 
+@app.get("/api/admin/retention", response_model=RetentionStatusOut)
+def admin_retention_status():
+    report = retention_engine.last_report
+    return {"last_pass": report.as_dict() if report else None, "usage": retention_engine.usage}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.delete("/api/admin/cameras/{cam_id}")
 def admin_delete_camera(cam_id: int, session: Session = Depends(get_session)):
     cam = session.get(Camera, cam_id)
     if not cam:
         return {"ok": True}
     ffmpeg_manager.stop_camera(cam_id, cam.name)
+    onvif_events.unwatch(cam_id)
+    motion_detector.unwatch(cam_id)
+    recording_policy.unwatch(cam_id)
+    session.query(MotionEvent).filter_by(camera_id=cam_id).delete()
+    session.query(MotionHour).filter_by(camera_id=cam_id).delete()
+    session.query(MotionSourceOutage).filter_by(camera_id=cam_id).delete()
     session.delete(cam)
     session.commit()
     return {"ok": True}
@@ -330,6 +448,9 @@ def start_grid(cam_id: int, session: Session = Depends(get_session)):
     if not cam:
         raise HTTPException(404, "Not found")
 
+    if settings.LIVE_ABR:
+        return start_abr_ladder(cam)
+
     # Resolve the grid role (uses auto/manual + grid_target_*)
     # If you moved the resolver to roles.py, import resolve_role and use it here.
     src, sw, sh, run = resolve_role(cam, "grid")  # returns (rtsp_url, scale_w, scale_h, should_run)
@@ -337,10 +458,31 @@ def start_grid(cam_id: int, session: Session = Depends(get_session)):
         return {"ok": False, "reason": "grid_disabled_or_unavailable"}
 
     # Grid always uses low_crf; scaling only if sw/sh provided (auto mode)
-    res = ffmpeg_manager.start_role(cam.id, cam.name, "grid", src, cam.low_crf, sw, sh)
+    res = ffmpeg_manager.start_role(cam.id, cam.name, "grid", src, cam.low_crf, sw, sh, meta=stream_meta(cam, src))
     return {"ok": True, **(res if isinstance(res, dict) else {})}
 
 
+# ----------------------------- Live ingest (LIVE_STORE=memory) ---------------------
+# ffmpeg's HLS muxer PUTs playlists/segments here and DELETEs expired segments.
+
+def _require_loopback(request: Request):
+    host = request.client.host if request.client else None
+    if host not in {"127.0.0.1", "::1", "localhost"}:
+        raise HTTPException(403, "ingest is local-only")
+
+@app.put("/ingest/live/{rel:path}")
+async def ingest_live_put(rel: str, request: Request):
+    _require_loopback(request)
+    live_store.put(rel, await request.body())
+    return Response(status_code=204)
+
+@app.delete("/ingest/live/{rel:path}")
+def ingest_live_delete(rel: str, request: Request):
+    _require_loopback(request)
+    live_store.delete(rel)
+    return Response(status_code=204)
+
+
 # ----------------------------- Client API (no RTSP) -------------------------------
 
 @app.get("/api/cameras", response_model=CameraClientList)
@@ -355,7 +497,8 @@ def client_list_cameras(session: Session = Depends(get_session)):
           "urls": {
             "grid":   "/media/live/<camera>/grid/index.m3u8",
             "medium": "/media/live/<camera>/medium/index.m3u8",
-            "high":   "/media/live/<camera>/high/index.m3u8"
+            "high":   "/media/live/<camera>/high/index.m3u8",
+            "master": "/media/live/<camera>/master.m3u8"   (LIVE_ABR only)
           }
         },
         ...
@@ -369,6 +512,8 @@ def client_list_cameras(session: Session = Depends(get_session)):
             role: f"/media/live/{cam.name}/{role}/index.m3u8"
             for role in ("grid", "medium", "high")
         }
+        if settings.LIVE_ABR:
+            urls["master"] = f"/media/live/{cam.name}/master.m3u8"
         items.append(CameraClientItem(
             id=str(cam.id),
             name=cam.name,
@@ -385,64 +530,172 @@ def recordings_for_date(cam_id: int, date: str, session: Session = Depends(get_s
     if not cam:
         raise HTTPException(404, "Not found")
 
-    rows = list_recordings(cam.name, date)
-    out = []
-    for it in rows:
-        parts = it.get("rel_parts")
-        if not parts or len(parts) < 4:
-            # fallback: parse from legacy "path"
-            p = Path(it["path"].lstrip("/"))
-            parts = list(p.parts)  # ["camera","YYYY-MM-DD","HH","file.mp4"]
-        camera, date_part, hour_part, filename = parts[0], parts[1], parts[2], parts[3]
-        api_path = f"/api/recordings/{camera}/{date_part}/{hour_part}/{filename}"
-        out.append({
-            "path": api_path,
-            "start_ts": it["start_ts"],
-            "size_bytes": it["size_bytes"],
-        })
-    return out
+    return [_recording_out(it) for it in list_recordings(cam.name, date)]
+
+def _recording_out(it: dict) -> dict:
+    parts = it.get("rel_parts")
+    if not parts or len(parts) < 4:
+        # fallback: parse from legacy "path"
+        p = Path(it["path"].lstrip("/"))
+        parts = list(p.parts)  # ["camera","YYYY-MM-DD","HH","file.mp4"]
+    camera, date_part, hour_part, filename = parts[0], parts[1], parts[2], parts[3]
+    api_path = f"/api/recordings/{camera}/{date_part}/{hour_part}/{filename}"
+    return {
+        "path": api_path,
+        "start_ts": it["start_ts"],
+        "size_bytes": it["size_bytes"],
+        "duration": it.get("duration"),
+        "in_progress": it.get("in_progress", False),
+        "thumbnails": f"{api_path}/thumbnails.vtt" if it.get("thumbs") else None,
+        "cold": it.get("cold", False),
+    }
 
-@app.get("/api/recordings/{camera}/{date}/{hour}/{filename}")
-def get_recording_file(camera: str, date: str, hour: str, filename: str, request: Request):
-    """Return MP4 content with basic Range support for seeking."""
-    file_path = REC_DIR / camera / date / hour / filename
+# Live still image: keyframe of the newest grid segment, cached and shared by all callers
+@app.get("/api/cameras/{cam_id}/snapshot.jpg")
+def camera_snapshot(cam_id: int, request: Request, session: Session = Depends(get_session)):
+    cam = session.get(Camera, cam_id)
+    if not cam:
+        raise HTTPException(404, "Not found")
+    snap = snapshot_cache.get(cam.name)
+    if snap is None:
+        raise HTTPException(404, "No live video")
+    headers = {
+        "Cache-Control": f"public, max-age={int(settings.SNAPSHOT_TTL_SEC)}",
+        "ETag": snap.etag,
+    }
+    if request.headers.get("if-none-match") == snap.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(snap.jpeg, media_type="image/jpeg", headers=headers)
+
+# Timeline: recorded intervals and gaps over any window (may span days)
+@app.get("/api/cameras/{cam_id}/timeline", response_model=TimelineOut)
+def camera_timeline(
+    cam_id: int,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    session: Session = Depends(get_session),
+):
+    cam = session.get(Camera, cam_id)
+    if not cam:
+        raise HTTPException(404, "Not found")
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 86400
+    if end <= start:
+        raise HTTPException(400, "end must be after start")
+    if end - start > TIMELINE_MAX_SEC:
+        raise HTTPException(400, f"window too large (max {TIMELINE_MAX_SEC // 86400} days)")
+    return timeline(cam.name, start, end)
+
+# Point-in-time lookup: which segment holds `at`, and where inside it
+@app.get("/api/cameras/{cam_id}/timeline/lookup", response_model=RecordingLookup)
+def camera_timeline_lookup(cam_id: int, at: float, session: Session = Depends(get_session)):
+    cam = session.get(Camera, cam_id)
+    if not cam:
+        raise HTTPException(404, "Not found")
+    hit = lookup(cam.name, at)
+    if hit is None:
+        raise HTTPException(404, "No recording at that time")
+    return {
+        "segment": _recording_out(hit),
+        "offset_sec": hit["offset_sec"],
+        "byte_offset": hit["byte_offset"],
+        "fragment_offset_sec": hit["fragment_offset_sec"],
+    }
+
+# Motion: raw events (paged) and the per-hour activity histogram
+@app.get("/api/cameras/{cam_id}/motion", response_model=MotionEventsOut)
+def camera_motion_events(
+    cam_id: int,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    limit: int = 100,
+    after: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    if not session.get(Camera, cam_id):
+        raise HTTPException(404, "Not found")
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 86400
+    if end <= start:
+        raise HTTPException(400, "end must be after start")
+    cursor = None
+    if after:
+        try:
+            ts, eid = after.rsplit(":", 1)
+            cursor = (float(ts), int(eid))
+        except ValueError:
+            raise HTTPException(400, "bad cursor")
+    limit = max(1, min(limit, motion_index.PAGE_MAX))
+    events, nxt = motion_index.search(session, cam_id, start, end, limit, cursor)
+    return {"events": events, "next": f"{nxt[0]!r}:{nxt[1]}" if nxt else None}
+
+@app.get("/api/motion/histogram", response_model=MotionHistogramOut)
+def motion_histogram(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    cameras: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 30 * 86400
+    if end <= start:
+        raise HTTPException(400, "end must be after start")
+    if end - start > motion_index.HISTOGRAM_MAX_SEC:
+        raise HTTPException(400, f"window too large (max {motion_index.HISTOGRAM_MAX_SEC // 86400} days)")
+    try:
+        ids = [int(c) for c in cameras.split(",") if c.strip()] if cameras else None
+    except ValueError:
+        raise HTTPException(400, "cameras must be a comma-separated list of ids")
+    by_cam = motion_index.histogram(session, start, end, ids)
+    return {
+        "start": start,
+        "end": end,
+        "bucket_sec": motion_index.HOUR,
+        "cameras": [
+            {"camera_id": cid, "hours": [{"ts": h.hour_ts, "events": h.events, "seconds": h.seconds} for h in hours]}
+            for cid, hours in by_cam.items()
+        ],
+    }
+
+def _recording_path(camera: str, date: str, hour: str, filename: str) -> Path:
+    """A recording's file in REC_DIR, else in the cold tier (404 if in neither)."""
+    file_path = safe_path(REC_DIR, camera, date, hour, filename)
+    if not file_path.exists() and COLD_DIR is not None:
+        file_path = safe_path(COLD_DIR, camera, date, hour, filename)
     if not file_path.exists():
         raise HTTPException(404, "Recording not found")
+    return file_path
 
-    file_size = file_path.stat().st_size
-    range_header = request.headers.get("range")
-    if range_header:
-        m = re.match(r"bytes=(\d+)-(\d+)?", range_header)
-        if m:
-            start = int(m.group(1))
-            end = int(m.group(2)) if m.group(2) else file_size - 1
-            end = min(end, file_size - 1)
-        else:
-            start, end = 0, file_size - 1
-
-        chunk_size = 1024 * 1024
-
-        def iter_file():
-            with open(file_path, "rb") as f:
-                f.seek(start)
-                remaining = end - start + 1
-                while remaining > 0:
-                    read_len = min(chunk_size, remaining)
-                    data = f.read(read_len)
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(end - start + 1),
-        }
-        return StreamingResponse(iter_file(), status_code=206, headers=headers, media_type="video/mp4")
+@app.get("/api/recordings/{camera}/{date}/{hour}/{filename}")
+def get_recording_file(camera: str, date: str, hour: str, filename: str, request: Request):
+    """Return MP4 content with Range/conditional support for seeking.
 
-    headers = {"Accept-Ranges": "bytes"}
-    return FileResponse(file_path, media_type="video/mp4", headers=headers)
+    The segment currently being recorded (fragmented MP4) can be served too: its
+    length is snapshotted at request time and it is marked non-cacheable.
+    Archived segments are served from the cold tier under the same URL.
+    """
+    file_path = _recording_path(camera, date, hour, filename)
+
+    growing = is_growing(file_path.stat())
+    if settings.ACCEL_REDIRECT:
+        headers = {"Cache-Control": "no-store"} if growing else {}
+        if COLD_DIR is not None and file_path.is_relative_to(COLD_DIR):
+            return accel_redirect(settings.ACCEL_COLD_LOCATION, COLD_DIR, file_path, "video/mp4", headers)
+        return accel_redirect(settings.ACCEL_REC_LOCATION, REC_DIR, file_path, "video/mp4", headers)
+    return serve_file(request, file_path, "video/mp4", cacheable=not growing)
+
+
+@app.get("/api/recordings/{camera}/{date}/{hour}/{filename}/thumbnails.{ext}")
+def get_recording_thumbnails(camera: str, date: str, hour: str, filename: str, ext: str, request: Request):
+    """Sprite sheet (jpg) or its WebVTT track (vtt) for one segment; 404 until generated."""
+    media_types = {"vtt": "text/vtt", "jpg": "image/jpeg"}
+    if ext not in media_types:
+        raise HTTPException(404, "Not found")
+    sprite, vtt = asset_paths(_recording_path(camera, date, hour, filename))
+    path = vtt if ext == "vtt" else sprite
+    if not path.exists():
+        raise HTTPException(404, "Thumbnails not available")
+    return serve_file(request, path, media_types[ext])
 
 
 @app.post("/api/recordings/{camera}/{date}/{hour}/{filename}/export")
@@ -454,52 +707,107 @@ def export_recording_segment(
     body: ClipExportRequest,
     background: BackgroundTasks,
 ):
-    """Export a time range from a recording. If save is True, store on server; otherwise return file."""
-    file_path = REC_DIR / camera / date / hour / filename
-    if not file_path.exists():
-        raise HTTPException(404, "Recording not found")
+    """
+    Export a time range from a recording. If save is True, store on server; otherwise return file.
+    Legacy when not streamed: the request holds a server thread until the export ends.
+    """
+    file_path = _recording_path(camera, date, hour, filename)
 
     start = max(0.0, body.start)
     end = max(start, body.end)
+    return _export(FilePlan(file_path, start, end, new_output_path()), body, background)
+
+
+def _camera_plan(cam_id: int, body: CameraExportRequest, session: Session) -> ExportPlan:
+    cam = session.get(Camera, cam_id)
+    if not cam:
+        raise HTTPException(404, "Not found")
+    if body.end <= body.start:
+        raise HTTPException(400, "end must be after start")
+    try:
+        return ExportPlan(cam.name, body.start, body.end, new_output_path(), accurate=body.accurate)
+    except NoFootage as e:
+        raise HTTPException(404, str(e))
+    except ExportError as e:
+        raise HTTPException(400, str(e))
 
-    tmp = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-    tmp_path = Path(tmp.name)
-    tmp.close()
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        str(file_path),
-        "-ss",
-        str(start),
-        "-to",
-        str(end),
-        "-c",
-        "copy",
-        str(tmp_path),
-    ]
-    proc = subprocess.run(cmd, capture_output=True)
-    if proc.returncode != 0:
-        raise HTTPException(500, f"ffmpeg failed: {proc.stderr.decode('utf-8', 'ignore')}")
-
-    if body.save:
-        name = body.name or f"clip_{int(time.time())}.mp4"
-        safe = re.sub(r"[^\w\-]+", "_", name)
-        if not safe.endswith(".mp4"):
-            safe += ".mp4"
-        dest = CLIP_DIR / safe
+
+@app.post("/api/cameras/{cam_id}/export")
+def export_camera_clip(
+    cam_id: int,
+    body: CameraExportRequest,
+    background: BackgroundTasks,
+    session: Session = Depends(get_session),
+):
+    """
+    Export wall-clock [start, end) across recording segments. Legacy when not streamed:
+    the request holds a server thread until the export ends; prefer /export/jobs.
+    """
+    return _export(_camera_plan(cam_id, body, session), body, background)
+
+
+def _export(plan, body, background: BackgroundTasks):
+    """Stream the clip straight from ffmpeg when possible, else run it as a queued job and wait."""
+    if not body.save and body.stream and plan.stream_cmd:
         try:
-            shutil.move(str(tmp_path), dest)
-        except Exception as e:
-            raise HTTPException(500, f"Failed to save clip: {e}")
-        return {"path": f"/api/saved/{dest.name}", "name": dest.name}
+            chunks = stream_clip(plan)
+        except ExportBusy as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": "5"})
+        except StreamError as e:
+            raise HTTPException(500, str(e))
+        disposition = f'attachment; filename="{download_name(body.name)}"'
+        return StreamingResponse(chunks, media_type="video/mp4", headers={"Content-Disposition": disposition})
+    return _await_clip(export_queue.submit(plan, body.save, body.name), body.name, background)
+
+
+def _await_clip(job, name: Optional[str], background: BackgroundTasks):
+    """
+    Block until an export job ends; return the saved clip's path or the file itself.
+    Kept for existing clients: this pins a threadpool worker for the whole export,
+    which /export/jobs (submit, poll, download) does not.
+    """
+    job.wait()
+    if job.status != DONE:
+        raise HTTPException(500, job.error or f"export {job.status}")
+    if job.save:
+        return {"path": f"/api/saved/{job.result_path.name}", "name": job.result_path.name}
+
+    background.add_task(lambda p: os.remove(p), job.result_path)
+    return FileResponse(job.result_path, media_type="video/mp4", filename=download_name(name))
+
+
+# Export jobs: submit returns immediately; poll for progress, then download
+@app.post("/api/cameras/{cam_id}/export/jobs", response_model=ExportJobOut)
+def submit_export_job(cam_id: int, body: CameraExportRequest, session: Session = Depends(get_session)):
+    job = export_queue.submit(_camera_plan(cam_id, body, session), body.save, body.name)
+    return job.to_dict()
+
+@app.get("/api/export/jobs", response_model=list[ExportJobOut])
+def list_export_jobs():
+    return [j.to_dict() for j in export_queue.list()]
+
+@app.get("/api/export/jobs/{job_id}", response_model=ExportJobOut)
+def get_export_job(job_id: str):
+    job = export_queue.get(job_id)
+    if not job:
+        raise HTTPException(404, "Not found")
+    return job.to_dict()
 
-    download_name = body.name or "clip.mp4"
-    if not download_name.endswith(".mp4"):
-        download_name += ".mp4"
-    background.add_task(lambda p: os.remove(p), tmp_path)
-    return FileResponse(tmp_path, media_type="video/mp4", filename=download_name)
+@app.delete("/api/export/jobs/{job_id}", response_model=ExportJobOut)
+def cancel_export_job(job_id: str):
+    job = export_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(404, "Not found")
+    return job.to_dict()
+
+@app.get("/api/export/jobs/{job_id}/download")
+def download_export_job(job_id: str, request: Request):
+    job = export_queue.get(job_id)
+    if not job or job.status != DONE or job.save or not job.result_path.exists():
+        raise HTTPException(404, "Not found")
+    response = serve_file(request, job.result_path, "video/mp4")
+    response.headers["Content-Disposition"] = f'attachment; filename="{download_name(job.name)}"'
+    return response
 
 
 @app.get("/api/saved", response_model=list[SavedVideo])
@@ -516,46 +824,12 @@ def list_saved_videos():
 
 @app.get("/api/saved/{filename}")
 def get_saved_video(filename: str, request: Request):
-    file_path = CLIP_DIR / filename
+    file_path = safe_path(CLIP_DIR, filename)
     if not file_path.exists():
         raise HTTPException(404, "Not found")
-
-    file_size = file_path.stat().st_size
-    range_header = request.headers.get("range")
-    if range_header:
-        m = re.match(r"bytes=(\d+)-(\d+)?", range_header)
-        if m:
-            start = int(m.group(1))
-            end = int(m.group(2)) if m.group(2) else file_size - 1
-            end = min(end, file_size - 1)
-        else:
-            start, end = 0, file_size - 1
-
-        chunk_size = 1024 * 1024
-
-        def iter_file():
-            with open(file_path, "rb") as f:
-                f.seek(start)
-                remaining = end - start + 1
-                while remaining > 0:
-                    read_len = min(chunk_size, remaining)
-                    data = f.read(read_len)
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(end - start + 1),
-        }
-        return StreamingResponse(
-            iter_file(), status_code=206, headers=headers, media_type="video/mp4"
-        )
-
-    headers = {"Accept-Ranges": "bytes"}
-    return FileResponse(file_path, media_type="video/mp4", headers=headers)
+    if settings.ACCEL_REDIRECT:
+        return accel_redirect(settings.ACCEL_CLIP_LOCATION, CLIP_DIR, file_path, "video/mp4")
+    return serve_file(request, file_path, "video/mp4")
 
 @app.get("/api/admin/cameras/{cam_id}/streams", response_model=list[CameraStreamOut])
 def admin_list_streams(cam_id: int, session: Session = Depends(get_session)):
@@ -577,9 +851,7 @@ def admin_add_stream(cam_id: int, body: CameraStreamCreate, session: Session = D
     session.refresh(s)
     # probe (best-effort)
     try:
-        meta = probe_rtsp(s.rtsp_url)
-        s.width = meta["width"]; s.height = meta["height"]
-        s.fps = meta["fps"]; s.bitrate_kbps = meta["bitrate_kbps"]; s.probed_at = meta["probed_at"]
+        apply_probe(s, probe_rtsp(s.rtsp_url))
         session.commit(); session.refresh(s)
     except Exception as e:
         # leave as enabled but without metadata; admin can re-probe later
@@ -592,13 +864,11 @@ def admin_probe_stream(cam_id: int, stream_id: int, session: Session = Depends(g
     s = session.get(CameraStream, stream_id)
     if not s or s.camera_id != cam_id:
         raise HTTPException(404, "Not found")
-    meta = probe_rtsp(s.rtsp_url)
-    s.width = meta["width"]; s.height = meta["height"]
-    s.fps = meta["fps"]; s.bitrate_kbps = meta["bitrate_kbps"]; s.probed_at = meta["probed_at"]
+    apply_probe(s, probe_rtsp(s.rtsp_url))
     session.commit(); session.refresh(s)
     return s
 
 @app.get("/api/admin/cameras/{cam_id}/status")
 def admin_camera_status(cam_id: int):
-    # returns: {"running": bool, "roles": {"grid": bool, "medium": bool, "high": bool, "recording": bool}}
+    # returns: {"running": bool, "roles": {"grid": bool, ...}, "leases", "relays", "progress", "restarts", "crash_looping"}
     return ffmpeg_manager.status(cam_id)
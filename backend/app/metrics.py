@@ -0,0 +1,232 @@
+# backend/app/metrics.py
+"""
+Prometheus metrics (GET /metrics, text exposition format 0.0.4).
+
+Counters and histograms are updated where things happen: request latency in the
+HTTP middleware, lease operations in LeaseTracker, ffmpeg exits and stall kills in
+FFmpegManager, closed recording bytes in the segment index, retention passes and
+export jobs. Point-in-time values (running processes, their uptime, CPU and RSS
+read from /proc, lease counts, disk usage) come from collectors that run at scrape
+time, so nothing is sampled in the background.
+
+Kept dependency-free on purpose: a handful of metric types is all we need.
+"""
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("homecam.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]  # (suffix, labels, value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple((k, str(labels[k])) for k in self.labels)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [("_total", dict(k), v) for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            v = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            v = self._values.get(self._key(labels))
+            return v[-1] if v else 0
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        with self._lock:
+            for key, v in self._values.items():
+                labels = dict(key)
+                for b, n in zip(self.buckets, v):
+                    out.append(("_bucket", {**labels, "le": _fmt_value(b)}, n))
+                out.append(("_bucket", {**labels, "le": "+Inf"}, v[-1]))
+                out.append(("_sum", labels, v[-2]))
+                out.append(("_count", labels, v[-1]))
+        return out
+
+
+class Family:
+    """A metric built at scrape time by a collector (gauge or counter read from elsewhere)."""
+
+    def __init__(self, name: str, kind: str, doc: str):
+        self.name = name
+        self.kind = kind
+        self.doc = doc
+        self._samples: List[Sample] = []
+
+    def add(self, value: Optional[float], **labels):
+        if value is not None:
+            self._samples.append(("_total" if self.kind == "counter" else "", labels, value))
+        return self
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Family]]] = {}
+
+    def _add(self, metric):
+        with self._lock:
+            # re-registering (module reloads in tests) returns the existing metric
+            existing = self._metrics.setdefault(metric.name, metric)
+        return existing
+
+    def counter(self, name: str, doc: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, doc, labels))
+
+    def histogram(self, name: str, doc: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def collector(self, name: str, fn: Callable[[], Iterable[Family]]):
+        """Call fn on every scrape; registering a name again replaces the old collector."""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        families = list(metrics)
+        for name, fn in collectors:
+            try:
+                families.extend(fn())
+            except Exception:  # a broken collector must not take /metrics down
+                logger.exception("Metrics collector %s failed", name)
+        lines = []
+        for fam in families:
+            samples = fam.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {fam.name} {fam.doc}")
+            lines.append(f"# TYPE {fam.name} {fam.kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{fam.name}{suffix}{_fmt_labels(labels)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ---------- /proc sampling ----------
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def proc_stats(pid: int) -> Optional[Tuple[float, int]]:
+    """(CPU seconds used, resident bytes) of a live process, from /proc; None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # comm may contain spaces or parens: fields start after the last ')'
+    fields = data[data.rfind(b")") + 2:].split()
+    try:
+        utime, stime, rss = int(fields[11]), int(fields[12]), int(fields[21])
+    except (IndexError, ValueError):
+        return None
+    return (utime + stime) / _CLK_TCK, rss * _PAGE
+
+
+# ---------- metrics updated in place ----------
+
+HTTP_REQUESTS = registry.counter(
+    "homecam_http_requests", "HTTP requests by route template and status code.", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram(
+    "homecam_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+LEASE_OPS = registry.counter(
+    "homecam_lease_operations", "Viewer lease operations (acquire, renew, renew_unknown, release, expire).",
+    ("role", "op"))
+FFMPEG_EXITS = registry.counter(
+    "homecam_ffmpeg_exits", "Unexpected ffmpeg exits (each is followed by a restart attempt).", ("camera", "role"))
+FFMPEG_STALLS = registry.counter(
+    "homecam_ffmpeg_stalls", "ffmpeg processes killed by the stall watchdog.", ("camera", "role"))
+RECORDING_BYTES = registry.counter(
+    "homecam_recording_bytes_written", "Bytes of closed recording segments.", ("camera",))
+RECORDING_SEGMENTS = registry.counter(
+    "homecam_recording_segments_written", "Closed recording segments.", ("camera",))
+RETENTION_PASS = registry.histogram(
+    "homecam_retention_pass_duration_seconds", "Duration of retention passes.", buckets=DURATION_BUCKETS)
+RETENTION_EVICTED = registry.counter(
+    "homecam_retention_evicted_bytes", "Bytes deleted by retention, by reason.", ("reason",))
+EXPORT_DURATION = registry.histogram(
+    "homecam_export_duration_seconds", "Run time of export jobs by final status.", ("status",), buckets=DURATION_BUCKETS)
@@ -1,5 +1,5 @@
 # backend/app/models.py
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Enum, Float, Index
 from sqlalchemy.orm import relationship
 from .db import Base
 import enum, datetime as dt
@@ -17,6 +17,7 @@ class Camera(Base):
     rtsp_url = Column(String, nullable=False)
     enabled = Column(Boolean, default=True)
     retention_days = Column(Integer, default=7)
+    retention_priority = Column(Integer, nullable=True)  # weight when evicting for disk space; None = 1
 
     # ---- ROLE CONFIG ----
     # Grid (always running) – modes: auto | manual   (no disabled)
@@ -41,6 +42,16 @@ class Camera(Base):
     low_crf  = Column(Integer, default=26)
     high_crf = Column(Integer, default=20)
 
+    # ONVIF events (PullPoint) on the camera's RTSP host and credentials; None = off
+    onvif_port = Column(Integer, nullable=True)
+    # Software motion detection on the grid source (motion_detect.py)
+    motion_detect = Column(Boolean, nullable=True)
+    motion_mask = Column(String, nullable=True)       # "x,y,w,h;..." zones to ignore, fractions
+    motion_threshold = Column(Float, nullable=True)   # None = MOTION_THRESHOLD
+    # continuous | motion_drop | motion_compact | motion_substream (recording_policy.py); None = continuous
+    recording_policy = Column(String, nullable=True)
+    recording_policy_since = Column(Float, nullable=True)  # when the motion policy took effect; older footage is left alone
+
     # relations
     streams = relationship(
         "CameraStream",
@@ -67,6 +78,68 @@ class CameraStream(Base):
     height = Column(Integer, nullable=True)
     fps    = Column(Integer, nullable=True)
     bitrate_kbps = Column(Integer, nullable=True)
+    codec   = Column(String, nullable=True)   # e.g. h264 / hevc
+    profile = Column(String, nullable=True)   # e.g. High / Main
+    gop     = Column(Integer, nullable=True)  # keyframe interval in frames
+    audio_codec = Column(String, nullable=True)  # None = no audio track
     probed_at = Column(DateTime, nullable=True)
 
     camera = relationship("Camera", back_populates="streams", foreign_keys=[camera_id])
+
+class RecordingSegment(Base):
+    """One recorded file, indexed so listings/lookups never walk the recordings tree."""
+    __tablename__ = "recording_segments"
+    id = Column(Integer, primary_key=True)
+    camera = Column(String, nullable=False)      # camera name (= directory under REC_DIR)
+    date = Column(String, nullable=False)        # YYYY-MM-DD directory
+    hour = Column(String, nullable=False)        # HH directory
+    filename = Column(String, nullable=False)
+    start_ts = Column(Float, nullable=False)
+    duration = Column(Float, nullable=True)      # None until the segment is closed/measured
+    size_bytes = Column(Integer, nullable=False, default=0)
+    thumbs = Column(Boolean, nullable=True)      # sprite sheet: None pending, True ready, False failed
+    tier = Column(String, nullable=True)         # motion policy: None unclassified, motion / quiet / compact
+    cold = Column(Boolean, nullable=True)        # archive: None hot, True moved to COLD_DIR, False failed (stays hot)
+
+    __table_args__ = (
+        Index("ix_recseg_camera_start", "camera", "start_ts"),
+        Index("ix_recseg_dir", "camera", "date", "hour", "filename", unique=True),
+    )
+
+    @property
+    def rel_path(self) -> str:
+        return f"{self.camera}/{self.date}/{self.hour}/{self.filename}"
+
+
+class MotionEvent(Base):
+    """A normalized motion state change from ONVIF or the detector (active = motion started, else ended)."""
+    __tablename__ = "motion_events"
+    id = Column(Integer, primary_key=True)
+    camera_id = Column(Integer, ForeignKey("cameras.id"), nullable=False)
+    ts = Column(Float, nullable=False)           # epoch seconds, server clock
+    active = Column(Boolean, nullable=False)
+    topic = Column(String, nullable=False)       # e.g. RuleEngine/CellMotionDetector/Motion
+    source = Column(String, nullable=True)       # source SimpleItems, "Name=Value;..."
+
+    __table_args__ = (
+        Index("ix_motion_camera_ts", "camera_id", "ts"),
+    )
+
+
+class MotionSourceOutage(Base):
+    """A span in which a camera's motion source (onvif / detector) was not delivering events; end_ts None = still down."""
+    __tablename__ = "motion_outages"
+    id = Column(Integer, primary_key=True)
+    camera_id = Column(Integer, ForeignKey("cameras.id"), nullable=False, index=True)
+    source = Column(String, nullable=False)
+    start_ts = Column(Float, nullable=False)
+    end_ts = Column(Float, nullable=True)
+
+
+class MotionHour(Base):
+    """Motion activity per camera and hour, kept up to date as events are stored (motion_index.py)."""
+    __tablename__ = "motion_hours"
+    camera_id = Column(Integer, ForeignKey("cameras.id"), primary_key=True)
+    hour_ts = Column(Integer, primary_key=True)              # epoch seconds at the start of the hour
+    events = Column(Integer, nullable=False, default=0)      # motion starts in this hour
+    seconds = Column(Float, nullable=False, default=0.0)     # motion time inside this hour, summed over sources
@@ -0,0 +1,267 @@
+# backend/app/motion_detect.py
+"""
+Software motion detection for cameras without ONVIF events.
+
+Each camera with motion_detect on gets one small ffmpeg "tap" on its grid
+source, fed by the ingest relay, so the camera is not pulled again. The tap
+decodes cheaply (loop filter skipped, one thread), drops to MOTION_FPS and
+area-scales to MOTION_WIDTH x MOTION_HEIGHT grayscale. It writes raw frames
+to our pipe. FrameDiffDetector compares each frame with the previous one
+using in-place NumPy operations on preallocated buffers:
+
+    changed = |frame - prev| > pixel_delta, minus the camera's masked zones
+    motion starts after start_frames frames with changed/area >= threshold,
+    and ends after hold_sec without one.
+
+At 160x90 and 4 fps, the NumPy side is a few microseconds per frame; the cost
+is the decode (see motion/bench_detector.py). Start/end transitions are
+stored as motion_events with topic DETECTOR_TOPIC, next to ONVIF events.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from . import db, motion_index
+from .config import settings
+from .models import MotionEvent
+from .recording_policy import note_source, recording_policy
+from .roles import resolve_role
+
+logger = logging.getLogger("homecam.motion")
+
+DETECTOR_TOPIC = "homecam/FrameDiff"
+RESTART_BACKOFF_MAX_SEC = 60.0
+
+
+def parse_mask(spec: Optional[str], width: int, height: int) -> Optional[np.ndarray]:
+    """
+    Pixels to watch (bool array), from "x,y,w,h;..." zones to ignore, each given
+    as fractions of the frame (0..1). None when nothing is masked.
+    """
+    if not spec or not spec.strip():
+        return None
+    mask = np.ones((height, width), dtype=bool)
+    for zone in spec.split(";"):
+        if not zone.strip():
+            continue
+        try:
+            x, y, w, h = (float(v) for v in zone.split(","))
+        except ValueError:
+            raise ValueError(f"bad mask zone {zone!r} (want x,y,w,h fractions)")
+        x0, y0 = int(round(x * width)), int(round(y * height))
+        x1, y1 = int(round((x + w) * width)), int(round((y + h) * height))
+        mask[max(0, y0):max(0, y1), max(0, x0):max(0, x1)] = False
+    return mask
+
+
+class FrameDiffDetector:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        mask: Optional[np.ndarray] = None,
+        pixel_delta: int = 25,
+        threshold: float = 0.01,
+        start_frames: int = 2,
+        hold_sec: float = 5.0,
+    ):
+        self.width, self.height = width, height
+        self.mask = mask
+        self.pixel_delta = pixel_delta
+        self.threshold = threshold
+        self.start_frames = start_frames
+        self.hold_sec = hold_sec
+        self.active = False
+        self._watched = int(mask.sum()) if mask is not None else width * height
+        self._prev = np.empty((height, width), dtype=np.uint8)
+        self._have_prev = False
+        self._hi = np.empty((height, width), dtype=np.uint8)
+        self._lo = np.empty((height, width), dtype=np.uint8)
+        self._changed = np.empty((height, width), dtype=bool)
+        self._above = 0
+        self._last_motion = 0.0
+
+    def score(self, frame: np.ndarray) -> float:
+        """Fraction of watched pixels that changed since the previous frame."""
+        prev = self._prev
+        if not self._have_prev or self._watched == 0:
+            np.copyto(prev, frame)
+            self._have_prev = True
+            return 0.0
+        # |a - b| without widening: max(a, b) - min(a, b) stays in uint8
+        np.maximum(frame, prev, out=self._hi)
+        np.minimum(frame, prev, out=self._lo)
+        np.subtract(self._hi, self._lo, out=self._hi)
+        np.greater(self._hi, self.pixel_delta, out=self._changed)
+        if self.mask is not None:
+            np.logical_and(self._changed, self.mask, out=self._changed)
+        np.copyto(prev, frame)
+        return np.count_nonzero(self._changed) / self._watched
+
+    def feed(self, frame: np.ndarray, ts: float) -> Optional[bool]:
+        """True when motion starts, False when it ends, else None."""
+        if self.score(frame) >= self.threshold:
+            self._above += 1
+            self._last_motion = ts
+        else:
+            self._above = 0
+        if not self.active and self._above >= self.start_frames:
+            self.active = True
+            return True
+        if self.active and ts - self._last_motion >= self.hold_sec:
+            self.active = False
+            return False
+        return None
+
+
+def run_frames(
+    stream,
+    detector: FrameDiffDetector,
+    on_event: Callable[[float, bool], None],
+    clock=time.time,
+    on_start: Optional[Callable[[], None]] = None,
+) -> int:
+    """Feed raw gray frames from a binary stream until EOF; returns frames read. on_start runs after the first frame."""
+    size = detector.width * detector.height
+    buf = bytearray(size)
+    view = memoryview(buf)
+    frame = np.frombuffer(buf, dtype=np.uint8).reshape(detector.height, detector.width)
+    frames = 0
+    while True:
+        got = 0
+        while got < size:
+            n = stream.readinto(view[got:])
+            if not n:
+                return frames
+            got += n
+        frames += 1
+        if frames == 1 and on_start is not None:
+            on_start()
+        ts = clock()
+        state = detector.feed(frame, ts)
+        if state is not None:
+            on_event(ts, state)
+
+
+def tap_args() -> Tuple[list, list]:
+    """(input options, output tail) for the detector's ffmpeg tap."""
+    w, h = settings.MOTION_WIDTH, settings.MOTION_HEIGHT
+    input_opts = ["-skip_loop_filter", "all", "-threads", "1"]
+    tail = [
+        "-an", "-sn",
+        "-vf", f"fps={settings.MOTION_FPS},scale={w}:{h}:flags=area,format=gray",
+        "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1",
+    ]
+    return input_opts, tail
+
+
+def store_event(camera_id: int, ts: float, active: bool):
+    row = {"camera_id": camera_id, "ts": ts, "active": active, "topic": DETECTOR_TOPIC, "source": "detector"}
+    with db.SessionLocal() as session:
+        session.add(MotionEvent(**row))
+        motion_index.record(session, [row])
+        session.commit()
+    recording_policy.note_motion(camera_id, DETECTOR_TOPIC, active)
+
+
+class _CameraTap:
+    def __init__(self, cam_id: int, cam_name: str, src: str, config: tuple):
+        self.cam_id, self.cam_name, self.src = cam_id, cam_name, src
+        self.config = config
+        self.proc = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"motion-{cam_name}", daemon=True)
+
+    def _detector(self) -> FrameDiffDetector:
+        mask_spec, threshold = self.config
+        w, h = settings.MOTION_WIDTH, settings.MOTION_HEIGHT
+        return FrameDiffDetector(
+            w, h,
+            mask=parse_mask(mask_spec, w, h),
+            pixel_delta=settings.MOTION_PIXEL_DELTA,
+            threshold=threshold if threshold is not None else settings.MOTION_THRESHOLD,
+            start_frames=settings.MOTION_START_FRAMES,
+            hold_sec=settings.MOTION_HOLD_SEC,
+        )
+
+    def _run(self):
+        from .ffmpeg_manager import ffmpeg_manager
+
+        failures = 0
+        note_source(self.cam_id, "detector", False)  # until frames flow, quiet is not known to be quiet
+        while not self.stopped.is_set():
+            detector = self._detector()
+            input_opts, tail = tap_args()
+            started = time.time()
+            try:
+                self.proc = ffmpeg_manager.spawn_tap(self.cam_name, self.src, tail, input_opts=input_opts)
+                run_frames(
+                    self.proc.stdout, detector,
+                    lambda ts, active: store_event(self.cam_id, ts, active),
+                    on_start=lambda: note_source(self.cam_id, "detector", True),
+                )
+            except Exception:
+                logger.exception("Motion tap for %s failed", self.cam_name)
+            finally:
+                self._kill()
+            note_source(self.cam_id, "detector", False)
+            if detector.active:
+                store_event(self.cam_id, time.time(), False)  # don't leave motion open across restarts
+            failures = 0 if time.time() - started > RESTART_BACKOFF_MAX_SEC else failures + 1
+            self.stopped.wait(min(RESTART_BACKOFF_MAX_SEC, 2 ** failures))
+
+    def _kill(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            proc.kill()
+        try:
+            proc.wait(timeout=5)
+            proc.stdout.close()
+        except Exception:
+            pass
+
+    def stop(self):
+        self.stopped.set()
+        self._kill()
+
+
+class MotionDetectService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._taps: Dict[int, _CameraTap] = {}
+
+    def watch(self, cam):
+        """Start, restart (config changed) or stop the camera's detector to match its settings."""
+        src, _, _, run = resolve_role(cam, "grid")
+        want = bool(cam.motion_detect) and bool(src) and run
+        config = (cam.motion_mask, cam.motion_threshold)
+        with self._lock:
+            tap = self._taps.get(cam.id)
+            if tap and want and tap.src == src and tap.config == config:
+                return
+            if tap:
+                self._taps.pop(cam.id).stop()
+            if want:
+                tap = self._taps[cam.id] = _CameraTap(cam.id, cam.name, src, config)
+                tap.thread.start()
+
+    def unwatch(self, cam_id: int):
+        with self._lock:
+            tap = self._taps.pop(cam_id, None)
+        if tap:
+            tap.stop()
+
+    def shutdown(self):
+        with self._lock:
+            taps = list(self._taps.values())
+            self._taps.clear()
+        for tap in taps:
+            tap.stop()
+
+
+motion_detector = MotionDetectService()
@@ -0,0 +1,126 @@
+# backend/app/motion_index.py
+"""
+Motion event search and the per-hour activity histogram.
+
+motion_events holds raw state changes. Whoever stores them (the ONVIF sink, the
+detector) calls record() in the same transaction, which keeps motion_hours up to
+date: one row per camera and hour with the number of motion starts and the
+seconds of motion inside that hour. A span is added when its end arrives, split
+over the hours it covers, so motion that is still going on is not counted yet.
+A 30-day heatmap for every camera is then one range scan over at most 720 rows
+per camera instead of a pass over raw events.
+"""
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from .models import MotionEvent, MotionHour
+
+HOUR = 3600
+# a lost "motion ended" must not paint days of activity
+MAX_SPAN_SEC = 6 * HOUR
+HISTOGRAM_MAX_SEC = 92 * 86400
+PAGE_MAX = 1000
+
+
+def hour_of(ts: float) -> int:
+    return int(math.floor(ts / HOUR)) * HOUR
+
+
+def split_hours(start: float, end: float) -> Iterator[Tuple[int, float]]:
+    """(hour_ts, seconds) pieces of [start, end)."""
+    t = start
+    while t < end:
+        h = hour_of(t)
+        nxt = min(end, h + HOUR)
+        yield h, nxt - t
+        t = nxt
+
+
+def _previous(session, row: dict) -> Optional[MotionEvent]:
+    """The event before row from the same camera, topic and source."""
+    return (
+        session.query(MotionEvent)
+        .filter(
+            MotionEvent.camera_id == row["camera_id"],
+            MotionEvent.topic == row["topic"],
+            MotionEvent.source.is_(None) if row.get("source") is None else MotionEvent.source == row["source"],
+            MotionEvent.ts < row["ts"],
+        )
+        .order_by(MotionEvent.ts.desc(), MotionEvent.id.desc())
+        .first()
+    )
+
+
+def record(session, rows: Iterable[dict]):
+    """Fold newly inserted motion_events rows into motion_hours (caller commits)."""
+    session.flush()
+    deltas: Dict[Tuple[int, int], List[float]] = {}
+    for row in sorted(rows, key=lambda r: r["ts"]):
+        cam = row["camera_id"]
+        if row["active"]:
+            deltas.setdefault((cam, hour_of(row["ts"])), [0, 0.0])[0] += 1
+            continue
+        prev = _previous(session, row)
+        if prev is None or not prev.active:
+            continue
+        for h, sec in split_hours(max(prev.ts, row["ts"] - MAX_SPAN_SEC), row["ts"]):
+            deltas.setdefault((cam, h), [0, 0.0])[1] += sec
+    for (cam, h), (events, seconds) in deltas.items():
+        stmt = insert(MotionHour).values(camera_id=cam, hour_ts=h, events=events, seconds=seconds)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[MotionHour.camera_id, MotionHour.hour_ts],
+            set_={"events": MotionHour.events + events, "seconds": MotionHour.seconds + seconds},
+        ))
+
+
+def rebuild(session):
+    """Recompute motion_hours from every stored event (events that predate the histogram)."""
+    session.query(MotionHour).delete()
+    rows = [
+        {"camera_id": e.camera_id, "ts": e.ts, "active": e.active, "topic": e.topic, "source": e.source}
+        for e in session.query(MotionEvent).order_by(MotionEvent.ts)
+    ]
+    record(session, rows)
+    session.commit()
+
+
+def backfill(session):
+    """rebuild() once, when there are events but no histogram yet."""
+    if session.query(MotionHour).first() is None and session.query(MotionEvent).first() is not None:
+        rebuild(session)
+
+
+def search(
+    session,
+    camera_id: int,
+    start: float,
+    end: float,
+    limit: int = 100,
+    after: Optional[Tuple[float, int]] = None,
+) -> Tuple[List[MotionEvent], Optional[Tuple[float, int]]]:
+    """One page of events in [start, end) ordered by (ts, id), plus the cursor for the next page."""
+    q = session.query(MotionEvent).filter(
+        MotionEvent.camera_id == camera_id, MotionEvent.ts >= start, MotionEvent.ts < end,
+    )
+    if after is not None:
+        ts, eid = after
+        q = q.filter(or_(MotionEvent.ts > ts, and_(MotionEvent.ts == ts, MotionEvent.id > eid)))
+    rows = q.order_by(MotionEvent.ts, MotionEvent.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1].ts, rows[-1].id)
+    return rows, None
+
+
+def histogram(session, start: float, end: float, camera_ids: Optional[List[int]] = None) -> Dict[int, List[MotionHour]]:
+    """Hour buckets overlapping [start, end) per camera (hours without motion are absent)."""
+    q = session.query(MotionHour).filter(MotionHour.hour_ts >= hour_of(start), MotionHour.hour_ts < end)
+    if camera_ids is not None:
+        q = q.filter(MotionHour.camera_id.in_(camera_ids))
+    out: Dict[int, List[MotionHour]] = {}
+    for row in q.order_by(MotionHour.camera_id, MotionHour.hour_ts):
+        out.setdefault(row.camera_id, []).append(row)
+    return out
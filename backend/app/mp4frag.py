@@ -0,0 +1,234 @@
+# backend/app/mp4frag.py
+"""
+Minimal fragmented-MP4 box walker.
+
+Recordings are written as fMP4 (RECORDING_FORMAT=fmp4): a fragment starts at
+every keyframe, and at least every frag_duration in between, so a fragment may
+begin mid-GOP. Seeking inside a segment only needs the table of (moof byte
+offset, decode time) pairs for the fragments whose first sample is a sync sample
+(trun/tfhd/trex sample flags): read box headers, skip mdat payloads.
+"""
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+CACHE_SIZE = 64
+
+
+def _boxes(f, start: int, end: int):
+    """Yield (type, box_start, payload_start, box_end) for boxes in [start, end)."""
+    pos = start
+    while end is None or pos + 8 <= end:
+        f.seek(pos)
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return
+        size, typ = struct.unpack(">I4s", hdr)
+        payload = pos + 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            payload += 8
+        elif size == 0:
+            f.seek(0, 2)
+            size = f.tell() - pos
+        if size < 8:
+            return
+        yield typ.decode("latin-1"), pos, payload, pos + size
+        pos += size
+
+
+def _children(f, payload: int, end: int, typ: str):
+    return [b for b in _boxes(f, payload, end) if b[0] == typ]
+
+
+def _full_box(f, payload: int) -> Tuple[int, int]:
+    """Read a FullBox header; return (version, offset of the body)."""
+    f.seek(payload)
+    version = f.read(4)[0]
+    return version, payload + 4
+
+
+def _video_traks(f, moov):
+    """Yield (trak payload, trak end, mdia payload, mdia end) for video tracks."""
+    for _, _, tp, te in _children(f, moov[2], moov[3], "trak"):
+        mdia = _children(f, tp, te, "mdia")
+        if not mdia:
+            continue
+        _, mp, me = mdia[0][1:]
+        hdlr = _children(f, mp, me, "hdlr")
+        if not hdlr:
+            continue
+        f.seek(hdlr[0][2] + 8)
+        if f.read(4) == b"vide":
+            yield tp, te, mp, me
+
+
+def _trex_flags(f, moov, track_id: int) -> int:
+    """default_sample_flags from moov/mvex/trex for the track (0 = sync)."""
+    for _, _, mp, me in _children(f, moov[2], moov[3], "mvex"):
+        for _, _, tp, _ in _children(f, mp, me, "trex"):
+            _, body = _full_box(f, tp)
+            f.seek(body)
+            tid, _, _, _, flags = struct.unpack(">5I", f.read(20))
+            if tid == track_id:
+                return flags
+    return 0
+
+
+# sample_flags: sample_is_non_sync_sample
+NON_SYNC = 0x10000
+
+
+def _starts_on_sync(f, traf_payload: int, traf_end: int, tfhd_payload: int, default_flags: int) -> bool:
+    """Whether the first sample of a track fragment is a sync sample (keyframe)."""
+    f.seek(tfhd_payload)
+    tf_flags = struct.unpack(">I", f.read(4))[0] & 0xFFFFFF
+    f.seek(tfhd_payload + 8)  # after track_ID
+    flags = default_flags
+    for bit, size in ((0x1, 8), (0x2, 4), (0x8, 4), (0x10, 4)):
+        if tf_flags & bit:
+            f.seek(size, 1)
+    if tf_flags & 0x20:
+        flags = struct.unpack(">I", f.read(4))[0]
+    for _, _, rp, _ in _children(f, traf_payload, traf_end, "trun"):
+        f.seek(rp)
+        tr_flags, count = struct.unpack(">II", f.read(8))
+        tr_flags &= 0xFFFFFF
+        if not count:
+            continue
+        if tr_flags & 0x1:
+            f.seek(4, 1)  # data_offset
+        if tr_flags & 0x4:
+            flags = struct.unpack(">I", f.read(4))[0]  # first_sample_flags
+        elif tr_flags & 0x400:
+            # per-sample flags: skip the first sample's duration/size
+            f.seek(4 * bool(tr_flags & 0x100) + 4 * bool(tr_flags & 0x200), 1)
+            flags = struct.unpack(">I", f.read(4))[0]
+        break
+    return not flags & NON_SYNC
+
+
+def _video_track(f, moov) -> Tuple[Optional[int], Optional[int]]:
+    """(track_ID, timescale) of the first video track."""
+    for tp, te, mp, me in _video_traks(f, moov):
+        tkhd = _children(f, tp, te, "tkhd")
+        mdhd = _children(f, mp, me, "mdhd")
+        if not tkhd or not mdhd:
+            continue
+        v, body = _full_box(f, tkhd[0][2])
+        f.seek(body + (16 if v == 1 else 8))
+        track_id = struct.unpack(">I", f.read(4))[0]
+        v, body = _full_box(f, mdhd[0][2])
+        f.seek(body + (16 if v == 1 else 8))
+        timescale = struct.unpack(">I", f.read(4))[0]
+        return track_id, timescale
+    return None, None
+
+
+# sample entry fourcc -> ffmpeg codec name
+CODECS = {"avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc"}
+
+
+def video_format(path: str) -> Optional[Tuple[str, int, int]]:
+    """(codec, width, height) of the first video track's sample entry, or None if unreadable."""
+    try:
+        with open(path, "rb") as f:
+            for box in _boxes(f, 0, None):
+                if box[0] != "moov":
+                    continue
+                for _, _, mp, me in _video_traks(f, box):
+                    for *_, ip, ie in _children(f, mp, me, "minf"):
+                        for *_, sp, se in _children(f, ip, ie, "stbl"):
+                            for *_, dp, de in _children(f, sp, se, "stsd"):
+                                # FullBox header + entry_count, then the first sample entry
+                                for typ, _, ep, _ in _boxes(f, dp + 8, de):
+                                    f.seek(ep + 24)  # reserved(6) dref(2) pre_defined/reserved(16)
+                                    w, h = struct.unpack(">HH", f.read(4))
+                                    return CODECS.get(typ, typ), w, h
+                return None
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def fragment_table(path: str) -> Optional[List[Tuple[int, float]]]:
+    """
+    [(moof byte offset, start seconds), ...] of the fragments that start on a
+    keyframe, for the video track of an fMP4 file; None if the file isn't
+    fragmented (plain MP4) or has no video track.
+    """
+    out: List[Tuple[int, float]] = []
+    track_id = timescale = None
+    default_flags = 0
+    with open(path, "rb") as f:
+        for typ, start, payload, end in _boxes(f, 0, None):
+            if typ == "moov":
+                moov = (typ, start, payload, end)
+                track_id, timescale = _video_track(f, moov)
+                if track_id is not None:
+                    default_flags = _trex_flags(f, moov, track_id)
+            elif typ == "moof" and timescale:
+                for _, _, tp, te in _children(f, payload, end, "traf"):
+                    tfhd = _children(f, tp, te, "tfhd")
+                    tfdt = _children(f, tp, te, "tfdt")
+                    if not tfhd or not tfdt:
+                        continue
+                    f.seek(tfhd[0][2] + 4)
+                    if struct.unpack(">I", f.read(4))[0] != track_id:
+                        continue
+                    if not _starts_on_sync(f, tp, te, tfhd[0][2], default_flags):
+                        break  # cut by frag_duration mid-GOP: not a place to start decoding
+                    v, body = _full_box(f, tfdt[0][2])
+                    f.seek(body)
+                    t = struct.unpack(">Q", f.read(8))[0] if v == 1 else struct.unpack(">I", f.read(4))[0]
+                    out.append((start, t / timescale))
+                    break
+    return out or None
+
+
+class _TableCache:
+    """Small LRU of fragment tables keyed by (path, size): a grown file is re-read."""
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._size = size
+        self._items: "OrderedDict[Tuple[str, int], Optional[list]]" = OrderedDict()
+
+    def get(self, path: str, file_size: int) -> Optional[List[Tuple[int, float]]]:
+        key = (path, file_size)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        table = fragment_table(path)
+        with self._lock:
+            self._items[key] = table
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+        return table
+
+
+_cache = _TableCache(CACHE_SIZE)
+
+
+def locate(path: str, file_size: int, offset_sec: float) -> Optional[Tuple[int, float]]:
+    """(byte offset, start time) of the keyframe fragment at or before offset_sec, or None if not fMP4."""
+    table = _cache.get(path, file_size)
+    if not table:
+        return None
+    i = bisect_right(table, offset_sec, key=lambda e: e[1])
+    return table[max(i - 1, 0)]
+
+
+def next_fragment(path: str, file_size: int, offset_sec: float) -> Optional[float]:
+    """Start time of the first keyframe fragment at or after offset_sec, if any."""
+    table = _cache.get(path, file_size)
+    if not table:
+        return None
+    i = bisect_left(table, offset_sec, key=lambda e: e[1])
+    return table[i][1] if i < len(table) else None
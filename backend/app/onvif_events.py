@@ -0,0 +1,452 @@
+# backend/app/onvif_events.py
+"""
+ONVIF motion event ingestion.
+
+The service behind motion/motion.py, run in-process: every camera with an
+onvif_port gets a PullPoint subscription on its RTSP host, using the RTSP URL's
+credentials. All subscriptions are coroutines on one asyncio loop, running in a
+single background thread, and share one httpx.AsyncClient. Each camera:
+
+  GetCapabilities -> CreatePullPointSubscription -> PullMessages (long poll)
+  ... Renew before TerminationTime ... ; on any error back off (exponential,
+  jittered, capped at ONVIF_BACKOFF_MAX_SEC) and subscribe again.
+
+SOAP is built by hand (WS-Addressing + WS-Security UsernameToken digest) rather
+than through onvif-zeep, whose blocking calls would need a thread per camera.
+Motion notifications are normalized to (camera_id, ts, active, topic, source).
+Only state changes are kept: the Initialized messages that every new
+subscription replays are dropped. Events are written to motion_events in
+batches from a writer task.
+"""
+import asyncio
+import base64
+import datetime as dt
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+import httpx
+
+from . import db, motion_index
+from .config import settings
+from .models import MotionEvent
+from .recording_policy import note_source, recording_policy
+
+logger = logging.getLogger("homecam.onvif")
+
+SOAP = "http://www.w3.org/2003/05/soap-envelope"
+WSA = "http://www.w3.org/2005/08/addressing"
+WSSE = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd"
+WSU = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd"
+TDS = "http://www.onvif.org/ver10/device/wsdl"
+TEV = "http://www.onvif.org/ver10/events/wsdl"
+WSNT = "http://docs.oasis-open.org/wsn/b-2"
+TT = "http://www.onvif.org/ver10/schema"
+
+PASSWORD_DIGEST = (
+    "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0#PasswordDigest"
+)
+ACTIONS = {
+    "GetCapabilities": f"{TDS}/GetCapabilities",
+    "CreatePullPointSubscription": f"{TEV}/EventPortType/CreatePullPointSubscriptionRequest",
+    "PullMessages": f"{TEV}/PullPointSubscription/PullMessagesRequest",
+    "Renew": "http://docs.oasis-open.org/wsn/bw-2/SubscriptionManager/RenewRequest",
+    "Unsubscribe": "http://docs.oasis-open.org/wsn/bw-2/SubscriptionManager/UnsubscribeRequest",
+}
+
+# Data items that carry the motion state, by vendor/profile
+MOTION_ITEMS = ("IsMotion", "State", "Motion", "MotionActive")
+MESSAGE_LIMIT = 50
+BACKOFF_BASE_SEC = 1.0
+WRITE_BATCH = 500
+WRITE_DELAY_SEC = 0.5
+
+
+class OnvifError(Exception):
+    pass
+
+
+# ---------- SOAP ----------
+
+def _security_header(user: str, password: str) -> str:
+    nonce = os.urandom(16)
+    created = dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    digest = base64.b64encode(hashlib.sha1(nonce + created.encode() + password.encode()).digest()).decode()
+    return (
+        f'<wsse:Security s:mustUnderstand="1" xmlns:wsse="{WSSE}" xmlns:wsu="{WSU}">'
+        f"<wsse:UsernameToken><wsse:Username>{_xml_escape(user)}</wsse:Username>"
+        f'<wsse:Password Type="{PASSWORD_DIGEST}">{digest}</wsse:Password>'
+        f"<wsse:Nonce>{base64.b64encode(nonce).decode()}</wsse:Nonce>"
+        f"<wsu:Created>{created}</wsu:Created></wsse:UsernameToken></wsse:Security>"
+    )
+
+
+def _xml_escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def envelope(op: str, body: str, to: str, user: str = "", password: str = "") -> str:
+    header = (
+        f"<wsa:Action>{ACTIONS[op]}</wsa:Action>"
+        f"<wsa:MessageID>urn:uuid:{uuid.uuid4()}</wsa:MessageID>"
+        f"<wsa:To>{_xml_escape(to)}</wsa:To>"
+    )
+    if user:
+        header += _security_header(user, password)
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<s:Envelope xmlns:s="{SOAP}" xmlns:wsa="{WSA}" xmlns:tds="{TDS}" '
+        f'xmlns:tev="{TEV}" xmlns:wsnt="{WSNT}">'
+        f"<s:Header>{header}</s:Header><s:Body>{body}</s:Body></s:Envelope>"
+    )
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        t = dt.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=dt.timezone.utc)
+    return t.timestamp()
+
+
+def _strip_prefixes(topic: str) -> str:
+    """'tns1:RuleEngine/tnsaxis:CellMotionDetector/Motion' -> 'RuleEngine/CellMotionDetector/Motion'."""
+    return "/".join(p.rsplit(":", 1)[-1] for p in topic.strip().split("/"))
+
+
+def parse_notifications(root: ET.Element) -> List[dict]:
+    """NotificationMessages of a PullMessagesResponse as plain dicts."""
+    out = []
+    for nm in root.iter(f"{{{WSNT}}}NotificationMessage"):
+        msg = nm.find(f"{{{WSNT}}}Message/{{{TT}}}Message")
+        if msg is None:
+            continue
+        topic = nm.findtext(f"{{{WSNT}}}Topic") or ""
+        items = lambda part: {
+            si.get("Name"): si.get("Value") for si in msg.findall(f"{{{TT}}}{part}/{{{TT}}}SimpleItem")
+        }
+        out.append({
+            "topic": _strip_prefixes(topic),
+            "utc": parse_time(msg.get("UtcTime")),
+            "op": msg.get("PropertyOperation"),
+            "source": items("Source"),
+            "data": items("Data"),
+        })
+    return out
+
+
+def motion_state(msg: dict) -> Optional[bool]:
+    """True/False for a motion notification, None for anything else."""
+    if "motion" not in msg["topic"].lower():
+        return None
+    for name in MOTION_ITEMS:
+        value = msg["data"].get(name)
+        if value is not None:
+            return value.strip().lower() in ("true", "1")
+    return None
+
+
+# ---------- one camera ----------
+
+class Target(NamedTuple):
+    camera_id: int
+    device_url: str
+    user: str
+    password: str
+
+
+def target_for(cam) -> Optional[Target]:
+    """Where to reach a camera's ONVIF device service (None if events are off for it)."""
+    if not cam.onvif_port:
+        return None
+    u = urlsplit(cam.rtsp_url or "")
+    if not u.hostname:
+        return None
+    host = f"[{u.hostname}]" if ":" in u.hostname else u.hostname
+    return Target(
+        cam.id,
+        f"http://{host}:{cam.onvif_port}/onvif/device_service",
+        unquote(u.username or ""),
+        unquote(u.password or ""),
+    )
+
+
+class PullPointClient:
+    def __init__(self, http: httpx.AsyncClient, target: Target):
+        self.http = http
+        self.target = target
+        self.address: Optional[str] = None
+        self.clock_offset = 0.0   # server clock minus camera clock
+        self.expires = 0.0        # server time the subscription lapses
+
+    async def call(self, url: str, op: str, body: str, timeout: Optional[float] = None) -> ET.Element:
+        t = self.target
+        payload = envelope(op, body, url, t.user, t.password)
+        headers = {"Content-Type": f'application/soap+xml; charset=utf-8; action="{ACTIONS[op]}"'}
+        kwargs = {"timeout": httpx.Timeout(timeout, connect=settings.ONVIF_CONNECT_TIMEOUT_SEC)} if timeout else {}
+        auth = httpx.DigestAuth(t.user, t.password) if t.user else None
+        resp = await self.http.post(url, content=payload.encode(), headers=headers, auth=auth, **kwargs)
+        try:
+            root = ET.fromstring(resp.content)
+        except ET.ParseError:
+            raise OnvifError(f"{op}: HTTP {resp.status_code}, not SOAP")
+        fault = root.find(f"{{{SOAP}}}Body/{{{SOAP}}}Fault")
+        if fault is not None or resp.status_code >= 400:
+            reason = "".join(fault.itertext()).strip() if fault is not None else ""
+            raise OnvifError(f"{op}: HTTP {resp.status_code} {reason[:200]}")
+        return root
+
+    def _track_times(self, root: ET.Element, ns: str):
+        current = parse_time(root.findtext(f".//{{{ns}}}CurrentTime"))
+        term = parse_time(root.findtext(f".//{{{ns}}}TerminationTime"))
+        now = time.time()
+        if current is not None:
+            self.clock_offset = now - current
+        self.expires = (term + self.clock_offset) if term is not None else now + settings.ONVIF_SUBSCRIPTION_SEC
+
+    async def subscribe(self):
+        root = await self.call(
+            self.target.device_url, "GetCapabilities",
+            "<tds:GetCapabilities><tds:Category>Events</tds:Category></tds:GetCapabilities>",
+        )
+        events_url = root.findtext(f".//{{{TT}}}Events/{{{TT}}}XAddr")
+        if not events_url:
+            raise OnvifError("camera has no events service")
+        root = await self.call(
+            events_url.strip(), "CreatePullPointSubscription",
+            "<tev:CreatePullPointSubscription><tev:InitialTerminationTime>"
+            f"PT{settings.ONVIF_SUBSCRIPTION_SEC}S"
+            "</tev:InitialTerminationTime></tev:CreatePullPointSubscription>",
+        )
+        address = root.findtext(f".//{{{TEV}}}SubscriptionReference/{{{WSA}}}Address")
+        if not address:
+            raise OnvifError("no subscription address")
+        self.address = address.strip()
+        self._track_times(root, WSNT)
+
+    async def pull(self) -> List[dict]:
+        timeout = settings.ONVIF_PULL_TIMEOUT_SEC
+        root = await self.call(
+            self.address, "PullMessages",
+            f"<tev:PullMessages><tev:Timeout>PT{timeout}S</tev:Timeout>"
+            f"<tev:MessageLimit>{MESSAGE_LIMIT}</tev:MessageLimit></tev:PullMessages>",
+            timeout=timeout + 10,
+        )
+        current = parse_time(root.findtext(f".//{{{TEV}}}CurrentTime"))
+        if current is not None:
+            self.clock_offset = time.time() - current
+        return parse_notifications(root)
+
+    async def renew(self):
+        root = await self.call(
+            self.address, "Renew",
+            f"<wsnt:Renew><wsnt:TerminationTime>PT{settings.ONVIF_SUBSCRIPTION_SEC}S"
+            "</wsnt:TerminationTime></wsnt:Renew>",
+        )
+        self._track_times(root, WSNT)
+
+    async def unsubscribe(self):
+        if self.address:
+            await self.call(self.address, "Unsubscribe", "<wsnt:Unsubscribe/>", timeout=2)
+            self.address = None
+
+    def renew_due(self) -> bool:
+        # renew once less than half a subscription period is left
+        return time.time() > self.expires - settings.ONVIF_SUBSCRIPTION_SEC / 2
+
+
+# ---------- the service ----------
+
+def store_events(rows: List[dict]):
+    with db.SessionLocal() as session:
+        session.bulk_insert_mappings(MotionEvent, rows)
+        motion_index.record(session, rows)
+        session.commit()
+    for row in rows:
+        recording_policy.note_motion(row["camera_id"], f"{row['topic']}|{row['source']}", row["active"])
+
+
+class OnvifEventService:
+    def __init__(
+        self,
+        sink: Callable[[List[dict]], None] = store_events,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        health: Callable[[int, str, bool], None] = note_source,
+    ):
+        self._sink = sink
+        self._health = health  # (camera_id, "onvif", up): quiet footage only counts while subscribed
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._health_queue: Optional[asyncio.Queue] = None
+        self._tasks: Dict[int, Tuple[Target, asyncio.Task]] = {}
+        self._state: Dict[Tuple[int, str], bool] = {}   # (camera_id, topic|source) -> last active
+        self._start_lock = threading.Lock()
+
+    # ---------- thread-safe API ----------
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="onvif-events", daemon=True)
+            self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    def watch(self, cam):
+        """Subscribe to a camera's events (or stop, if it no longer has ONVIF configured)."""
+        self.watch_target(cam.id, target_for(cam))
+
+    def watch_target(self, camera_id: int, target: Optional[Target]):
+        if target is None and camera_id not in self._tasks:
+            return
+        if self._loop is None:
+            self.start()
+        self._loop.call_soon_threadsafe(self._apply, camera_id, target)
+
+    def unwatch(self, camera_id: int):
+        self.watch_target(camera_id, None)
+
+    def watching(self) -> List[int]:
+        return sorted(self._tasks)
+
+    def shutdown(self, timeout: float = 5.0):
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._teardown(), self._loop).result(timeout)
+        except Exception:
+            logger.exception("ONVIF event service shutdown failed")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+        self._loop = None
+
+    # ---------- loop side ----------
+
+    async def _setup(self):
+        self._http = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=httpx.Timeout(settings.ONVIF_CONNECT_TIMEOUT_SEC),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        )
+        self._queue = asyncio.Queue()
+        self._health_queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self._writer = loop.create_task(self._write_loop())
+        self._health_writer = loop.create_task(self._health_loop())
+
+    async def _teardown(self):
+        tasks = [t for _, t in self._tasks.values()]
+        self._tasks.clear()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._queue.join()
+        await self._health_queue.join()
+        self._writer.cancel()
+        self._health_writer.cancel()
+        await self._http.aclose()
+
+    def _apply(self, camera_id: int, target: Optional[Target]):
+        current = self._tasks.get(camera_id)
+        if current and current[0] == target:
+            return
+        if current:
+            current[1].cancel()
+            self._tasks.pop(camera_id, None)
+        if target is not None:
+            task = self._loop.create_task(self._run_camera(target))
+            self._tasks[camera_id] = (target, task)
+
+    async def _run_camera(self, target: Target):
+        failures = 0
+        while True:
+            client = PullPointClient(self._http, target)
+            try:
+                self._report(target.camera_id, False)
+                await client.subscribe()
+                logger.info("ONVIF events: camera %s subscribed", target.camera_id)
+                self._report(target.camera_id, True)
+                while True:
+                    if client.renew_due():
+                        await client.renew()
+                    messages = await client.pull()
+                    failures = 0
+                    self._emit(target.camera_id, client, messages)
+            except asyncio.CancelledError:
+                try:
+                    await client.unsubscribe()
+                except Exception:
+                    pass
+                self._report(target.camera_id, False)
+                raise
+            except Exception as e:
+                failures += 1
+                delay = min(settings.ONVIF_BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** (failures - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning("ONVIF events: camera %s: %s; retrying in %.1fs", target.camera_id, e, delay)
+                await asyncio.sleep(delay)
+
+    def _emit(self, camera_id: int, client: PullPointClient, messages: List[dict]):
+        now = time.time()
+        for msg in messages:
+            active = motion_state(msg)
+            if active is None:
+                continue
+            source = ";".join(f"{k}={v}" for k, v in sorted(msg["source"].items())) or None
+            key = (camera_id, f"{msg['topic']}|{source}")
+            last = self._state.get(key)
+            self._state[key] = active
+            if last == active or (last is None and not active):
+                continue  # Initialized replay, a repeat, or "no motion" as the first word
+            ts = msg["utc"] + client.clock_offset if msg["utc"] is not None else now
+            self._queue.put_nowait({
+                "camera_id": camera_id, "ts": ts, "active": active,
+                "topic": msg["topic"], "source": source,
+            })
+
+    def _report(self, camera_id: int, up: bool):
+        self._health_queue.put_nowait((camera_id, up, time.time()))
+
+    async def _health_loop(self):
+        # one writer, like _write_loop: sixty cameras reconnecting must not mean sixty threads
+        while True:
+            camera_id, up, ts = await self._health_queue.get()
+            try:
+                await asyncio.to_thread(self._health, camera_id, "onvif", up, ts)
+            except Exception:
+                logger.exception("Failed to store ONVIF state for camera %s", camera_id)
+            finally:
+                self._health_queue.task_done()
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(WRITE_DELAY_SEC)
+            while len(batch) < WRITE_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._sink, batch)
+            except Exception:
+                logger.exception("Failed to store %d motion events", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+onvif_events = OnvifEventService()
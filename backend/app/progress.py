@@ -0,0 +1,102 @@
+# backend/app/progress.py
+"""
+Live encoder telemetry from ffmpeg's -progress output.
+
+Role processes run with `-progress pipe:1 -nostats`: about twice a second ffmpeg
+writes a block of key=value lines to stdout ending in `progress=continue` (or
+`progress=end`). The supervisor thread hands the raw bytes to RoleProgress.feed();
+each complete block updates fps, speed, bitrate, dropped/duplicated frames and the
+output position. `advanced_at` moves only when the output position (or frame
+count) grows, which is what the stall watchdog in ffmpeg_manager looks at: a
+process that is alive but stuck on a dead RTSP session keeps its pid, not its
+out_time.
+"""
+import time
+from typing import Dict, Optional
+
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+MAX_LINE = 4096  # anything longer is not progress output
+
+
+def _num(value: Optional[str], suffix: str = "") -> Optional[float]:
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A" before the first frame
+
+
+class RoleProgress:
+    def __init__(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.started = now
+        self.updated: Optional[float] = None     # last complete block
+        self.advanced_at = now                   # last time the output moved
+        self.fps: Optional[float] = None
+        self.speed: Optional[float] = None
+        self.bitrate_kbps: Optional[float] = None
+        self.frame = 0
+        self.drop_frames = 0
+        self.dup_frames = 0
+        self.out_time = 0.0                      # seconds of output written
+        self.total_size: Optional[int] = None
+        self.ended = False
+        self._buf = b""
+        self._block: Dict[str, str] = {}
+
+    def feed(self, data: bytes, now: Optional[float] = None):
+        self._buf += data
+        *lines, self._buf = self._buf.split(b"\n")
+        if len(self._buf) > MAX_LINE:
+            self._buf = b""
+        for raw in lines:
+            key, sep, value = raw.decode("utf-8", "replace").strip().partition("=")
+            if not sep:
+                continue
+            if key == "progress":
+                self._commit(self._block, value, time.time() if now is None else now)
+                self._block = {}
+            else:
+                self._block[key] = value
+
+    def _commit(self, block: Dict[str, str], state: str, now: float):
+        frame = _num(block.get("frame"))
+        out_us = _num(block.get("out_time_us")) or _num(block.get("out_time_ms"))  # both are µs
+        out_time = out_us / 1e6 if out_us is not None else self.out_time
+        if out_time > self.out_time or (frame is not None and frame > self.frame):
+            self.advanced_at = now
+        self.out_time = max(self.out_time, out_time)
+        if frame is not None:
+            self.frame = int(frame)
+        self.fps = _num(block.get("fps"))
+        self.speed = _num(block.get("speed"), "x")
+        self.bitrate_kbps = _num(block.get("bitrate"), "kbits/s")
+        self.drop_frames = int(_num(block.get("drop_frames")) or self.drop_frames)
+        self.dup_frames = int(_num(block.get("dup_frames")) or self.dup_frames)
+        size = _num(block.get("total_size"))
+        self.total_size = int(size) if size is not None else self.total_size
+        self.updated = now
+        self.ended = state == "end"
+
+    def stalled_for(self, now: Optional[float] = None) -> float:
+        """Seconds since the output last advanced (or since start if it never did)."""
+        return max(0.0, (time.time() if now is None else now) - self.advanced_at)
+
+    def as_dict(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        return {
+            "fps": self.fps,
+            "speed": self.speed,
+            "bitrate_kbps": self.bitrate_kbps,
+            "frame": self.frame,
+            "drop_frames": self.drop_frames,
+            "dup_frames": self.dup_frames,
+            "out_time": round(self.out_time, 2),
+            "total_size": self.total_size,
+            "updated_ago": round(now - self.updated, 1) if self.updated is not None else None,
+            "stalled_for": round(self.stalled_for(now), 1),
+        }
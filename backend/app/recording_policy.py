@@ -0,0 +1,282 @@
+# backend/app/recording_policy.py
+"""
+Motion-aware recording.
+
+A camera's recording_policy decides what happens to footage in which nothing moved:
+
+  continuous        (default) keep everything for retention_days
+  motion_drop       quiet segments are deleted after QUIET_RETENTION_HOURS
+  motion_compact    quiet segments are re-encoded at QUIET_CRF, at most QUIET_MAX_WIDTH wide
+  motion_substream  record the camera's smallest stream while quiet; the recording
+                    role switches to the full stream when motion starts and back
+                    MOTION_POSTROLL_SEC after it ends (resolve_role asks motion_active);
+                    the switch restarts ffmpeg: the pre-roll stays substream and each
+                    motion start loses about a GOP while the new process waits for a keyframe
+
+A segment is quiet when no motion interval (ONVIF or detector motion_events),
+widened by MOTION_PREROLL_SEC before and MOTION_POSTROLL_SEC after, overlaps it.
+Absent events only mean "no motion" while the source is working: the ONVIF
+subscription and the detector tap report each outage (motion_outages), and a
+segment recorded during one counts as motion. A motion policy needs a motion
+source (has_motion_source), and only footage recorded after the policy took
+effect (Camera.recording_policy_since) is classified at all.
+Motion segments keep full quality for the camera's retention_days (pre-roll included,
+except under motion_substream). The segment is the unit, so cameras with a motion
+policy record MOTION_SEGMENT_SEC segments.
+retention.run_policy_loop() classifies closed segments (RecordingSegment.tier) and
+applies the drops and re-encodes.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import settings
+from .models import MotionEvent, MotionSourceOutage
+
+logger = logging.getLogger("homecam.recording_policy")
+
+CONTINUOUS = "continuous"
+MOTION_DROP = "motion_drop"
+MOTION_COMPACT = "motion_compact"
+MOTION_SUBSTREAM = "motion_substream"
+POLICIES = (CONTINUOUS, MOTION_DROP, MOTION_COMPACT, MOTION_SUBSTREAM)
+
+# RecordingSegment.tier
+TIER_MOTION = "motion"
+TIER_QUIET = "quiet"
+TIER_COMPACT = "compact"
+
+# motion still open this long before a segment is not looked for
+LOOKBACK_SEC = 3600
+
+
+def is_motion_policy(policy: Optional[str]) -> bool:
+    return policy in (MOTION_DROP, MOTION_COMPACT, MOTION_SUBSTREAM)
+
+
+def has_motion_source(cam) -> bool:
+    """ONVIF events (when the service is on) or the software detector."""
+    return bool((cam.onvif_port and settings.ONVIF_EVENTS) or cam.motion_detect)
+
+
+def motion_intervals(session, camera_id: int, start: float, end: float) -> List[Tuple[float, float]]:
+    """
+    Merged motion intervals overlapping [start, end), padded with pre-/post-roll.
+    Each (topic, source) opens and closes its own interval; one still open runs to end.
+    """
+    lo = start - settings.MOTION_POSTROLL_SEC - LOOKBACK_SEC
+    hi = end + settings.MOTION_PREROLL_SEC
+    events = (
+        session.query(MotionEvent)
+        .filter(MotionEvent.camera_id == camera_id, MotionEvent.ts >= lo, MotionEvent.ts < hi)
+        .order_by(MotionEvent.ts)
+        .all()
+    )
+    opened: Dict[Tuple[str, Optional[str]], float] = {}
+    spans = []
+    for ev in events:
+        key = (ev.topic, ev.source)
+        if ev.active:
+            opened.setdefault(key, ev.ts)
+        elif key in opened:
+            spans.append((opened.pop(key), ev.ts))
+    spans.extend((ts, hi) for ts in opened.values())
+
+    merged: List[Tuple[float, float]] = []
+    for s, e in sorted((s - settings.MOTION_PREROLL_SEC, e + settings.MOTION_POSTROLL_SEC) for s, e in spans):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return [(s, e) for s, e in merged if e > start and s < end]
+
+
+def overlaps(start: float, end: float, intervals: List[Tuple[float, float]]) -> bool:
+    return any(s < end and e > start for s, e in intervals)
+
+
+# ---------- motion source health ----------
+
+def note_source(camera_id: int, source: str, up: bool, ts: Optional[float] = None):
+    """
+    Record that a motion source started or stopped delivering events. Down opens
+    an outage (unless one is open already); up closes it. Never raises: the
+    event loops calling this must keep running.
+    """
+    from . import db
+
+    ts = time.time() if ts is None else ts
+    try:
+        with db.SessionLocal() as session:
+            row = (
+                session.query(MotionSourceOutage)
+                .filter_by(camera_id=camera_id, source=source, end_ts=None)
+                .first()
+            )
+            if up and row is not None:
+                row.end_ts = ts
+            elif not up and row is None:
+                session.add(MotionSourceOutage(camera_id=camera_id, source=source, start_ts=ts))
+            else:
+                return
+            session.commit()
+    except Exception:
+        logger.exception("Could not record %s %s for cam_id=%s", source, "up" if up else "down", camera_id)
+
+
+def outage_intervals(session, camera_id: int, start: float, end: float) -> List[Tuple[float, float]]:
+    """Motion source outages overlapping [start, end); one still open runs to end."""
+    rows = (
+        session.query(MotionSourceOutage)
+        .filter(
+            MotionSourceOutage.camera_id == camera_id,
+            MotionSourceOutage.start_ts < end,
+            (MotionSourceOutage.end_ts.is_(None)) | (MotionSourceOutage.end_ts > start),
+        )
+        .all()
+    )
+    return [(r.start_ts, end if r.end_ts is None else r.end_ts) for r in rows]
+
+
+# ---------- re-encoding quiet segments ----------
+
+def compact_cmd(src: Path, out: Path) -> list:
+    if settings.RECORDING_FORMAT == "mp4":
+        movflags = "+faststart"
+    else:
+        movflags = "+frag_keyframe+empty_moov+default_base_moof"
+    return [
+        "ffmpeg", "-v", "error", "-y", "-i", str(src),
+        "-map", "0:v", "-map", "0:a?",
+        "-vf", f"scale='min(iw,{settings.QUIET_MAX_WIDTH})':-2",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(settings.QUIET_CRF),
+        "-c:a", "copy",
+        "-movflags", movflags, "-f", "mp4", str(out),
+    ]
+
+
+def _lower_priority():
+    try:
+        os.nice(settings.QUIET_NICE)
+    except OSError:
+        pass
+
+
+def compact(path: Path) -> Optional[int]:
+    """Re-encode one closed segment in place; its new size, or None if it was kept as is."""
+    # the temporary name must not look like a segment to the index
+    tmp = path.with_name(f".{path.stem}.compact.tmp")
+    proc = subprocess.run(compact_cmd(path, tmp), capture_output=True, preexec_fn=_lower_priority)
+    try:
+        if proc.returncode != 0 or not tmp.exists():
+            logger.warning("Re-encode failed for %s: %s", path, proc.stderr.decode("utf-8", "ignore")[-500:])
+            return None
+        size = tmp.stat().st_size
+        if size >= path.stat().st_size:
+            return None  # already smaller than our quiet tier
+        os.replace(tmp, path)
+        return size
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+# ---------- live motion state (motion_substream) ----------
+
+class RecordingPolicyService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies: Dict[int, str] = {}
+        self._by_name: Dict[str, str] = {}
+        self._names: Dict[int, str] = {}
+        self._active: Dict[int, Set[str]] = {}     # cam_id -> (topic|source) keys in motion
+        self._hold_until: Dict[int, float] = {}   # post-roll after the last motion ended
+        self._timers: Dict[int, threading.Timer] = {}
+
+    def watch(self, cam):
+        """Take the camera's policy; a substream camera's recording follows its motion state."""
+        policy = cam.recording_policy or CONTINUOUS
+        with self._lock:
+            old = self._policies.get(cam.id)
+            self._policies[cam.id] = policy
+            self._by_name[cam.name] = policy
+            self._names[cam.id] = cam.name
+        if old is None or old == policy:
+            return
+        # a new segment length only takes effect when the recording ffmpeg restarts
+        resegment = is_motion_policy(old) != is_motion_policy(policy)
+        if resegment or MOTION_SUBSTREAM in (old, policy):
+            self._sync_recording(cam.id, restart=resegment)
+
+    def unwatch(self, cam_id: int):
+        with self._lock:
+            self._policies.pop(cam_id, None)
+            self._by_name.pop(self._names.pop(cam_id, None), None)
+            self._active.pop(cam_id, None)
+            self._hold_until.pop(cam_id, None)
+            timer = self._timers.pop(cam_id, None)
+        if timer:
+            timer.cancel()
+
+    def segment_sec(self, cam_name: str) -> int:
+        """Recording segment length: short for motion policies, so quiet time can be cut out."""
+        if is_motion_policy(self._by_name.get(cam_name)):
+            return settings.MOTION_SEGMENT_SEC
+        return settings.RECORDING_SEGMENT_SEC
+
+    def motion_active(self, cam_id: int) -> bool:
+        with self._lock:
+            return bool(self._active.get(cam_id)) or time.time() < self._hold_until.get(cam_id, 0.0)
+
+    def note_motion(self, cam_id: int, key: str, active: bool):
+        """A stored motion state change (any source); switches substream recording."""
+        with self._lock:
+            keys = self._active.setdefault(cam_id, set())
+            was = bool(keys) or time.time() < self._hold_until.get(cam_id, 0.0)
+            if active:
+                keys.add(key)
+            else:
+                keys.discard(key)
+            substream = self._policies.get(cam_id) == MOTION_SUBSTREAM
+            timer = None
+            if not keys and not active and substream and was:
+                self._hold_until[cam_id] = time.time() + settings.MOTION_POSTROLL_SEC
+                timer = threading.Timer(settings.MOTION_POSTROLL_SEC, self._sync_recording, args=(cam_id,))
+                timer.daemon = True
+            old = self._timers.pop(cam_id, None)
+            if timer:
+                self._timers[cam_id] = timer
+        if old:
+            old.cancel()
+        if timer:
+            timer.start()
+        elif active and substream and not was:
+            self._sync_recording(cam_id)
+
+    def _sync_recording(self, cam_id: int, restart: bool = False):
+        """Restart the recording role if resolve_role now picks another source (or restart is set)."""
+        from . import db
+        from .ffmpeg_manager import ffmpeg_manager
+        from .models import Camera
+        from .roles import resolve_role, stream_meta
+
+        try:
+            with db.SessionLocal() as session:
+                cam = session.get(Camera, cam_id)
+                if cam is None:
+                    return
+                src, _, _, run = resolve_role(cam, "recording")
+                current = ffmpeg_manager.role_src(cam_id, "recording")
+                if not run or not src or current is None or (current == src and not restart):
+                    return
+                logger.info("Restarting recording cam_id=%s (motion=%s)", cam_id, self.motion_active(cam_id))
+                ffmpeg_manager.stop_role(cam_id, cam.name, "recording")
+                ffmpeg_manager.start_role(cam_id, cam.name, "recording", src, cam.high_crf, meta=stream_meta(cam, src))
+        except Exception:
+            logger.exception("Recording source switch failed for cam_id=%s", cam_id)
+
+
+recording_policy = RecordingPolicyService()
@@ -1,48 +1,419 @@
 # backend/app/recordings.py
+"""
+Recording segment index.
+
+Every recorded file has a RecordingSegment row (camera, start, duration, size),
+so listings and lookups are indexed queries instead of walks of the recordings
+tree. Rows come from two places:
+  - the recording ffmpeg's segment list (REC_DIR/<cam>/.segments.csv), tailed by
+    run_index_loop(): one line per closed segment, with its exact duration;
+  - directory syncs: an hour directory is re-listed only when its mtime changed
+    since we last looked (a full incremental pass runs at startup).
+Segments that were never closed by ffmpeg (crash, pre-index files) get their
+duration measured once in the background and stored. Archived segments (cold)
+live under COLD_DIR with the same relative path; segment_path() knows which.
+"""
 from pathlib import Path
-import os, time, re
-from typing import List
-from .config import REC_DIR
+import logging
+import os, time, re, threading
+import datetime as dt
+from struct import error as struct_error
+from typing import Dict, List, Optional, Tuple
+
+from . import db
+from . import metrics
+from .config import COLD_DIR, REC_DIR, settings
+from .ffprobe_utils import probe_duration
+from .models import RecordingSegment
+from . import mp4frag
+
+logger = logging.getLogger("homecam.recordings")
 
 # Filenames like: YYYY-MM-DD_HH-MM-SS[_NNN].mp4
+# <date>_<time>[_<run>].mp4: the recorder adds its process run number (ffmpeg_manager)
 FNAME_RE = re.compile(
     r"(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})(?:_(\d+))?\.mp4$"
 )
 
-def list_recordings(camera: str, date_str: str) -> List[dict]:
-    base = REC_DIR / camera / date_str
-    if not base.exists():
-        return []
-    items = []
-    for hour_dir, _, files in os.walk(base):
-        for f in files:
-            if not f.endswith(".mp4"):
+# Written by the recording ffmpeg (-segment_list) in each camera's directory
+SEGMENT_LIST_NAME = ".segments.csv"
+
+# A segment written to within this many seconds is treated as still recording
+GROWING_MTIME_SEC = 10
+
+# Timeline: holes shorter than this between segments are not reported as gaps
+GAP_TOLERANCE_SEC = 2.0
+TIMELINE_MAX_SEC = 31 * 86400
+MEASURE_BATCH = 20
+
+def is_growing(st: os.stat_result) -> bool:
+    """True if the file looks like the segment ffmpeg is currently appending to."""
+    return time.time() - st.st_mtime < GROWING_MTIME_SEC
+
+def _count_closed(camera: str, size: int):
+    metrics.RECORDING_SEGMENTS.inc(camera=camera)
+    metrics.RECORDING_BYTES.inc(size, camera=camera)
+
+
+def segment_path(r: RecordingSegment) -> Path:
+    """Where a segment's file is: the cold tier once archived, else REC_DIR."""
+    if r.cold and COLD_DIR is not None:
+        return COLD_DIR / r.rel_path
+    return REC_DIR / r.rel_path
+
+def parse_start(filename: str) -> Optional[float]:
+    m = FNAME_RE.search(filename)
+    if not m:
+        return None
+    ts_str = f"{m.group(1)}_{m.group(2)}-{m.group(3)}-{m.group(4)}"
+    try:
+        return time.mktime(time.strptime(ts_str, "%Y-%m-%d_%H-%M-%S"))
+    except ValueError:
+        return None
+
+
+class SegmentIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dir_mtimes: Dict[Tuple[str, str, str], int] = {}  # (cam, date, hour) -> mtime_ns at last sync
+        self._list_pos: Dict[str, Tuple[int, int]] = {}        # cam -> (inode, offset) in its segment list
+
+    # ---------- directory sync ----------
+
+    def _sync_hour(self, session, camera: str, date: str, hour: str, known: Optional[Dict[str, RecordingSegment]] = None):
+        hour_path = REC_DIR / camera / date / hour
+        if known is None:
+            known = {
+                r.filename: r
+                for r in session.query(RecordingSegment).filter_by(camera=camera, date=date, hour=hour)
+            }
+        try:
+            mtime = hour_path.stat().st_mtime_ns
+            names = {f for f in os.listdir(hour_path) if FNAME_RE.search(f)}
+        except FileNotFoundError:
+            mtime, names = None, set()
+
+        for name in known.keys() - names:
+            if not known[name].cold:  # archived: its file is in the cold tier
+                session.delete(known[name])
+        for name in names - known.keys():
+            try:
+                st = (hour_path / name).stat()
+            except FileNotFoundError:
+                continue
+            start = parse_start(name)
+            session.add(RecordingSegment(
+                camera=camera, date=date, hour=hour, filename=name,
+                start_ts=start if start is not None else st.st_mtime,
+                size_bytes=st.st_size,
+            ))
+        if mtime is None:
+            self._dir_mtimes.pop((camera, date, hour), None)
+        else:
+            self._dir_mtimes[(camera, date, hour)] = mtime
+
+    def sync_day(self, camera: str, date: str):
+        """Re-list the hour directories of one day whose mtime changed since the last sync."""
+        base = REC_DIR / camera / date
+        try:
+            hours = [h for h in os.listdir(base) if (base / h).is_dir()]
+        except FileNotFoundError:
+            hours = []
+        with self._lock, db.SessionLocal() as session:
+            indexed = {h for (h,) in session.query(RecordingSegment.hour).filter_by(camera=camera, date=date).distinct()}
+            for hour in set(hours) | indexed:
+                try:
+                    mtime = (base / hour).stat().st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if mtime is None or self._dir_mtimes.get((camera, date, hour)) != mtime:
+                    self._sync_hour(session, camera, date, hour)
+            session.commit()
+
+    def scan_all(self):
+        """Startup pass: reconcile the index with REC_DIR, listing each directory once."""
+        if not REC_DIR.exists():
+            return
+        for cam_dir in sorted(p for p in REC_DIR.iterdir() if p.is_dir()):
+            camera = cam_dir.name
+            with self._lock, db.SessionLocal() as session:
+                by_dir: Dict[Tuple[str, str], Dict[str, RecordingSegment]] = {}
+                for r in session.query(RecordingSegment).filter_by(camera=camera):
+                    by_dir.setdefault((r.date, r.hour), {})[r.filename] = r
+                on_disk = set()
+                for date_dir in cam_dir.iterdir():
+                    if not date_dir.is_dir():
+                        continue
+                    for hour_dir in date_dir.iterdir():
+                        if hour_dir.is_dir():
+                            on_disk.add((date_dir.name, hour_dir.name))
+                for date, hour in on_disk | by_dir.keys():
+                    self._sync_hour(session, camera, date, hour, by_dir.get((date, hour), {}))
+                session.commit()
+
+    def forget(self, camera: str, date: Optional[str] = None):
+        """Drop rows after a camera's directory (or one day of it) was deleted."""
+        with self._lock, db.SessionLocal() as session:
+            q = session.query(RecordingSegment).filter_by(camera=camera)
+            if date is not None:
+                q = q.filter_by(date=date)
+            q.delete(synchronize_session=False)
+            session.commit()
+            for key in [k for k in self._dir_mtimes if k[0] == camera and (date is None or k[1] == date)]:
+                self._dir_mtimes.pop(key, None)
+
+    # ---------- ffmpeg segment lists ----------
+
+    def poll_segment_lists(self):
+        """Apply new entries from every camera's segment list (exact durations, final sizes)."""
+        if not REC_DIR.exists():
+            return
+        for cam_dir in REC_DIR.iterdir():
+            list_path = cam_dir / SEGMENT_LIST_NAME
+            try:
+                st = list_path.stat()
+            except (FileNotFoundError, NotADirectoryError):
                 continue
-            if not FNAME_RE.search(f):
+            ino, pos = self._list_pos.get(cam_dir.name, (None, 0))
+            if ino != st.st_ino or st.st_size < pos:
+                pos = 0  # ffmpeg restarted and truncated/recreated the list
+            if st.st_size == pos:
                 continue
-            full = Path(hour_dir) / f
+            with open(list_path, "rb") as f:
+                f.seek(pos)
+                chunk = f.read()
+            # only consume complete lines
+            done = chunk.rfind(b"\n") + 1
+            self._list_pos[cam_dir.name] = (st.st_ino, pos + done)
+            entries = []
+            for line in chunk[:done].decode(errors="replace").splitlines():
+                parts = line.strip().rsplit(",", 2)
+                if len(parts) != 3:
+                    continue
+                try:
+                    entries.append((os.path.basename(parts[0].strip('"')), float(parts[2]) - float(parts[1])))
+                except ValueError:
+                    continue
+            if entries:
+                self._apply_closed(cam_dir.name, entries)
+
+    def _apply_closed(self, camera: str, entries: List[Tuple[str, float]]):
+        with self._lock, db.SessionLocal() as session:
+            for name, duration in entries:
+                m = FNAME_RE.search(name)
+                if not m:
+                    continue
+                date, hour = m.group(1), m.group(2)
+                try:
+                    size = (REC_DIR / camera / date / hour / name).stat().st_size
+                except FileNotFoundError:
+                    continue
+                row = session.query(RecordingSegment).filter_by(
+                    camera=camera, date=date, hour=hour, filename=name
+                ).one_or_none()
+                if row is None:
+                    row = RecordingSegment(camera=camera, date=date, hour=hour, filename=name,
+                                           start_ts=parse_start(name) or time.time() - duration)
+                    session.add(row)
+                if row.duration is None:
+                    _count_closed(camera, size)
+                row.duration = duration
+                row.size_bytes = size
+            session.commit()
+
+    def measure_pending(self, limit: int = MEASURE_BATCH) -> int:
+        """Store durations for closed segments ffmpeg never reported (ffprobe, else mtime)."""
+        with db.SessionLocal() as session:
+            rows = (
+                session.query(RecordingSegment)
+                .filter(RecordingSegment.duration.is_(None))
+                .order_by(RecordingSegment.start_ts)
+                .limit(limit * 4)
+                .all()
+            )
+            session.expunge_all()
+        measured = {}
+        for r in rows:
+            if len(measured) >= limit:
+                break
+            path = segment_path(r)  # archived rows are measured in the cold tier
             try:
-                m = FNAME_RE.search(f)
-                ts_str = f"{m.group(1)}_{m.group(2)}-{m.group(3)}-{m.group(4)}"
-                ts = time.mktime(time.strptime(ts_str, "%Y-%m-%d_%H-%M-%S"))
-            except Exception:
-                ts = full.stat().st_mtime
-
-            # Derive path relative to REC_DIR, regardless of the absolute root
-            # rel_parts = [camera, YYYY-MM-DD, HH, filename.mp4]
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if is_growing(st):
+                continue
+            dur = probe_duration(str(path))
+            measured[r.id] = (dur if dur is not None else max(0.0, st.st_mtime - r.start_ts), st.st_size)
+        if measured:
+            with self._lock, db.SessionLocal() as session:
+                for row in session.query(RecordingSegment).filter(RecordingSegment.id.in_(measured)):
+                    row.duration, row.size_bytes = measured[row.id]
+                    _count_closed(row.camera, row.size_bytes)
+                session.commit()
+        return len(measured)
+
+    # ---------- queries ----------
+
+    def between(self, camera: str, start: float, end: float) -> List[RecordingSegment]:
+        """Segments overlapping [start, end): the one starting before start plus those inside."""
+        day, last = dt.date.fromtimestamp(start), dt.date.fromtimestamp(end)
+        while day <= last:
+            self.sync_day(camera, day.isoformat())
+            day += dt.timedelta(days=1)
+        with db.SessionLocal() as session:
+            q = session.query(RecordingSegment).filter_by(camera=camera)
+            prev = q.filter(RecordingSegment.start_ts < start).order_by(RecordingSegment.start_ts.desc()).first()
+            rows = (
+                q.filter(RecordingSegment.start_ts >= start, RecordingSegment.start_ts < end)
+                .order_by(RecordingSegment.start_ts)
+                .all()
+            )
+            session.expunge_all()
+        return ([prev] if prev else []) + rows
+
+    def at(self, camera: str, ts: float) -> Optional[RecordingSegment]:
+        """Latest segment starting at or before ts (an index seek on camera, start_ts)."""
+        self.sync_day(camera, time.strftime("%Y-%m-%d", time.localtime(ts)))
+        with db.SessionLocal() as session:
+            row = (
+                session.query(RecordingSegment)
+                .filter(RecordingSegment.camera == camera, RecordingSegment.start_ts <= ts)
+                .order_by(RecordingSegment.start_ts.desc())
+                .first()
+            )
+            session.expunge_all()
+        return row
+
+
+    def list_day(self, camera: str, date: str) -> List[RecordingSegment]:
+        self.sync_day(camera, date)
+        with db.SessionLocal() as session:
+            rows = (
+                session.query(RecordingSegment)
+                .filter_by(camera=camera, date=date)
+                .order_by(RecordingSegment.start_ts)
+                .all()
+            )
+            session.expunge_all()
+        return rows
+
+
+segment_index = SegmentIndex()
+
+
+def run_index_loop():
+    """Startup scan, then tail the ffmpeg segment lists."""
+    try:
+        segment_index.scan_all()
+    except Exception:
+        logger.exception("Recording index scan failed")
+    while True:
+        time.sleep(settings.RECORDING_INDEX_POLL_SEC)
+        try:
+            segment_index.poll_segment_lists()
+            segment_index.measure_pending()
+        except Exception:
+            logger.exception("Recording index poll failed")
+
+
+def segment_end(r: RecordingSegment) -> Optional[float]:
+    """End time of a segment: stored duration, else the file's last write."""
+    if r.duration is not None:
+        return r.start_ts + r.duration
+    try:
+        return max(r.start_ts, segment_path(r).stat().st_mtime)
+    except FileNotFoundError:
+        return None
+
+
+def timeline(camera: str, start: float, end: float) -> dict:
+    """Merged coverage intervals and the gaps between them within [start, end)."""
+    coverage: List[List[float]] = []
+    for r in segment_index.between(camera, start, end):
+        seg_end = segment_end(r)
+        if seg_end is None:
+            continue
+        s, e = max(r.start_ts, start), min(seg_end, end)
+        if e <= s:
+            continue
+        if coverage and s - coverage[-1][1] <= GAP_TOLERANCE_SEC:
+            coverage[-1][1] = max(coverage[-1][1], e)
+        else:
+            coverage.append([s, e])
+    gaps = []
+    cursor = start
+    for s, e in coverage:
+        if s - cursor > GAP_TOLERANCE_SEC:
+            gaps.append({"start": cursor, "end": s})
+        cursor = e
+    if end - cursor > GAP_TOLERANCE_SEC:
+        gaps.append({"start": cursor, "end": end})
+    return {
+        "start": start,
+        "end": end,
+        "coverage": [{"start": s, "end": e} for s, e in coverage],
+        "gaps": gaps,
+    }
+
+
+def lookup(camera: str, ts: float) -> Optional[dict]:
+    """
+    Segment containing ts, with the time offset into it. For fMP4 segments also the
+    byte offset and start time of the last fragment at or before that instant that
+    starts on a keyframe, where playback or a byte-range read can start decoding.
+    """
+    r = segment_index.at(camera, ts)
+    if r is None:
+        return None
+    seg_end = segment_end(r)
+    if seg_end is None or ts >= seg_end + GAP_TOLERANCE_SEC:
+        return None
+    path = segment_path(r)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    offset = ts - r.start_ts
+    frag = None
+    try:
+        frag = mp4frag.locate(str(path), st.st_size, offset)
+    except (OSError, IndexError, struct_error):
+        frag = None
+    return {
+        "rel_parts": r.rel_path.split("/"),
+        "start_ts": r.start_ts,
+        "duration": r.duration,
+        "size_bytes": st.st_size,
+        "in_progress": r.duration is None and is_growing(st),
+        "thumbs": bool(r.thumbs),
+        "cold": bool(r.cold),
+        "offset_sec": offset,
+        "byte_offset": frag[0] if frag else None,
+        "fragment_offset_sec": frag[1] if frag else None,
+    }
+
+
+def list_recordings(camera: str, date_str: str) -> List[dict]:
+    items = []
+    for r in segment_index.list_day(camera, date_str):
+        size, in_progress = r.size_bytes, False
+        if r.duration is None:
+            # not closed by ffmpeg yet: the current segment (or one cut short by a crash)
             try:
-                rel = full.relative_to(REC_DIR)
-            except ValueError:
-                # Fallback: best-effort construct using known components
-                rel = Path(camera) / date_str / Path(hour_dir).name / f
-            rel_parts = rel.parts
-
-            items.append({
-                # legacy field kept for backward-compat if you still reference it
-                "path": str(Path("/") / rel),               # "/<camera>/<date>/<hour>/<file>"
-                "rel_parts": list(rel_parts),               # ["camera","YYYY-MM-DD","HH","file.mp4"]
-                "start_ts": ts,
-                "size_bytes": full.stat().st_size,
-            })
-    items.sort(key=lambda x: x["start_ts"])
+                st = segment_path(r).stat()
+                size, in_progress = st.st_size, is_growing(st)
+            except FileNotFoundError:
+                continue
+        items.append({
+            # legacy field kept for backward-compat if you still reference it
+            "path": str(Path("/") / r.rel_path),       # "/<camera>/<date>/<hour>/<file>"
+            "rel_parts": r.rel_path.split("/"),        # ["camera","YYYY-MM-DD","HH","file.mp4"]
+            "start_ts": r.start_ts,
+            "duration": r.duration,
+            "size_bytes": size,
+            "in_progress": in_progress,
+            "thumbs": bool(r.thumbs),
+            "cold": bool(r.cold),
+        })
     return items
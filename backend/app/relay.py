@@ -0,0 +1,218 @@
+# backend/app/relay.py
+import logging
+import queue
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger("homecam.relay")
+
+# MPEG-TS packets are 188 bytes; keep every chunk packet-aligned so a
+# subscriber that joins mid-stream can resync on the next PAT/PMT.
+TS_PACKET = 188
+CHUNK_SIZE = TS_PACKET * 348  # ~64 KiB
+
+
+class _Subscriber:
+    """
+    One consumer of a relay: an ffmpeg whose stdin is fed the relayed MPEG-TS.
+    Each subscriber gets a bounded queue and its own writer so a slow/stuck
+    encoder cannot stall the other roles. A consumer whose queue overflows is
+    detached (EOF) rather than fed a stream with a hole in it: for a stream-copied
+    recording a skipped chunk is a corrupt GOP on disk, while an EOF makes the role
+    exit and restart cleanly on the next keyframe.
+    """
+    def __init__(self, proc: subprocess.Popen, max_chunks: int):
+        self.proc = proc
+        self.overflowed = False
+        self._q: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=max_chunks)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def _writer(self):
+        stdin = self.proc.stdin
+        while True:
+            data = self._q.get()
+            if data is None:
+                break
+            try:
+                stdin.write(data)
+            except (BrokenPipeError, OSError, ValueError):
+                break
+        try:
+            stdin.close()
+        except Exception:
+            pass
+
+    def offer(self, data: bytes) -> bool:
+        """Queue a chunk. Returns False once the consumer is gone or too slow to keep."""
+        if self.proc.poll() is not None or not self._thread.is_alive():
+            return False
+        try:
+            self._q.put_nowait(data)
+        except queue.Full:
+            self.overflowed = True
+            return False
+        return True
+
+    def close(self, drain: bool = False):
+        """Signal EOF to the consumer; with drain=False pending chunks are discarded."""
+        if drain:
+            try:
+                self._q.put(None, timeout=5)
+                return
+            except queue.Full:
+                pass
+        with self._q.mutex:
+            self._q.queue.clear()
+        try:
+            self._q.put_nowait(None)
+        except queue.Full:  # pragma: no cover - queue was just cleared
+            pass
+
+
+class IngestRelay:
+    """
+    Single RTSP pull for one camera stream, re-muxed (no transcode) to MPEG-TS
+    on stdout and fanned out to every attached role's stdin.
+
+      - attach(proc) -> proc must be spawned with stdin=PIPE reading `-f mpegts -i pipe:0`
+      - when the source ends, all subscribers get EOF (their restart logic takes over)
+      - with no subscribers for `linger` seconds the relay stops itself
+      - rtsp_timeout ends an RTSP session that sends nothing (the relay exits and
+        its subscribers restart); idle_for() lets the stall watchdog catch the rest
+    """
+    def __init__(self, cam_name: str, src: str, log_path: Path,
+                 linger: float = 15.0, max_chunks: int = 64, rtsp_timeout: float = 0.0):
+        self.cam_name = cam_name
+        self.src = src
+        self._log_path = log_path
+        self._linger = linger
+        self._max_chunks = max_chunks
+        self._rtsp_timeout = rtsp_timeout
+        self._last_data = time.monotonic()
+        self._lock = threading.Lock()
+        self._subs: List[_Subscriber] = []
+        self._proc: Optional[subprocess.Popen] = None
+        self._empty_since: Optional[float] = None
+        self._stopped = False
+        self._overflows = 0  # subscribers detached for falling behind
+
+    def _build_cmd(self) -> list[str]:
+        return [
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "warning",
+            "-rtsp_transport", "tcp",
+            *(["-timeout", str(int(self._rtsp_timeout * 1e6))] if self._rtsp_timeout > 0 else []),  # µs
+            "-i", self.src,
+            "-map", "0:v", "-map", "0:a?",
+            "-c", "copy",
+            "-f", "mpegts",
+            "pipe:1",
+        ]
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        self._log_path.parent.mkdir(parents=True, exist_ok=True)
+        logf = open(self._log_path, "ab", buffering=0)
+        cmd = self._build_cmd()
+        logger.debug("Relay cmd: %s", " ".join(str(x) for x in cmd))
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=logf,
+        )
+        self._empty_since = self._last_data = time.monotonic()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        logger.info("Started ingest relay for %s", self.cam_name)
+
+    @property
+    def pid(self) -> Optional[int]:
+        """The relay ffmpeg's pid while it runs (for metrics)."""
+        p = self._proc
+        return p.pid if p is not None and p.poll() is None else None
+
+    def stop(self, drain: bool = False):
+        with self._lock:
+            self._stopped = True
+            subs, self._subs = self._subs, []
+        for s in subs:
+            s.close(drain=drain)
+        p = self._proc
+        if p is not None and p.poll() is None:
+            try:
+                p.send_signal(signal.SIGTERM)
+                p.wait(timeout=5)
+            except Exception:
+                try:
+                    p.kill()
+                except Exception:
+                    pass
+
+    @property
+    def alive(self) -> bool:
+        return not self._stopped and self._proc is not None and self._proc.poll() is None
+
+    def attach(self, proc: subprocess.Popen) -> bool:
+        with self._lock:
+            if self._stopped:
+                return False
+            self._subs.append(_Subscriber(proc, self._max_chunks))
+            self._empty_since = None
+        return True
+
+    def feeds(self, proc: subprocess.Popen) -> bool:
+        with self._lock:
+            return any(s.proc is proc for s in self._subs)
+
+    def idle_for(self) -> float:
+        """Seconds since the source last sent anything (or since start)."""
+        return time.monotonic() - self._last_data
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def detached_slow(self) -> int:
+        """Subscribers detached because they fell max_chunks behind (each one restarts)."""
+        with self._lock:
+            return self._overflows
+
+    # ---------- pump ----------
+
+    def _read_loop(self):
+        out = self._proc.stdout
+        try:
+            while True:
+                data = out.read(CHUNK_SIZE)
+                if not data:
+                    break
+                self._last_data = time.monotonic()
+                with self._lock:
+                    subs = list(self._subs)
+                gone = [s for s in subs if not s.offer(data)]
+                with self._lock:
+                    for s in gone:
+                        if s in self._subs:
+                            self._subs.remove(s)
+                        if s.overflowed:
+                            self._overflows += 1
+                    if not self._subs:
+                        if self._empty_since is None:
+                            self._empty_since = time.monotonic()
+                        elif time.monotonic() - self._empty_since > self._linger:
+                            logger.info("Ingest relay for %s idle; stopping", self.cam_name)
+                            break
+                for s in gone:
+                    if s.overflowed:
+                        logger.warning(
+                            "Ingest relay for %s: consumer pid=%s fell %d chunks behind; detaching it",
+                            self.cam_name, s.proc.pid, self._max_chunks,
+                        )
+                    s.close()
+        except Exception:
+            logger.exception("Ingest relay read error for %s", self.cam_name)
+        finally:
+            # let subscribers finish what was already pulled, then EOF them
+            self.stop(drain=True)
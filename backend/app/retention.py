@@ -1,37 +1,478 @@
-import time, shutil
+# backend/app/retention.py
+"""
+Recording retention.
+
+RetentionEngine.run_pass() runs every RETENTION_INTERVAL_SEC and works from the
+segment index, one segment at a time:
+  - age: closed segments older than the camera's retention_days are deleted;
+    day directories entirely past it are swept for anything left over;
+  - space: when the recordings disk has less than DISK_MIN_FREE_PCT free, or the
+    recordings use more than RECORDINGS_QUOTA_GB, the oldest segments across all
+    cameras go first until RETENTION_HEADROOM_PCT is won back. Age is divided by
+    the camera's retention_priority, so a priority 2 camera keeps footage twice
+    as long as a priority 1 camera under pressure. If the recordings on a disk
+    could not cover its deficit even all together, something else is filling it:
+    that is logged and no footage is deleted for it;
+  - quiet: motion_drop cameras lose segments classified quiet (by the policy
+    loop below) once they are QUIET_RETENTION_HOURS old.
+With a cold tier on its own filesystem, each disk's watermark only evicts the
+segments stored on it; the quota counts both.
+Deletes are paced at RETENTION_DELETE_RATE files per second so a large eviction
+does not starve the recorders of disk I/O. Per-camera usage is the index's sizes,
+adjusted as segments go. Each pass produces a report (what was evicted, why, and
+how long it took) that is logged and served by /api/admin/retention.
+"""
+import heapq
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
 from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
-from .models import Camera
-from .config import REC_DIR, settings
 
-# Run daily to delete old recordings per-camera
+from . import db as database
+from . import metrics
+from .models import Camera, RecordingSegment
+from .config import COLD_DIR, REC_DIR, settings
+from .recordings import segment_index, segment_path
+from . import recording_policy as policy
+from . import thumbnails
+
+logger = logging.getLogger("homecam.retention")
+
+# closed segments younger than this (past their post-roll) wait for late motion events
+POLICY_SETTLE_SEC = 60
+CANDIDATE_PAGE = 200
+
+
+class RetentionReport:
+    def __init__(self):
+        self.started = time.time()
+        self.duration_sec = 0.0
+        self.free_bytes: Optional[int] = None
+        self.usage_bytes = 0
+        self.shortfall_bytes = 0  # space still missing after evicting everything allowed
+        self.evicted: Dict[str, Dict[str, Dict[str, int]]] = {}  # camera -> reason -> {segments, bytes}
+
+    def add(self, camera: str, reason: str, size: int):
+        slot = self.evicted.setdefault(camera, {}).setdefault(reason, {"segments": 0, "bytes": 0})
+        slot["segments"] += 1
+        slot["bytes"] += size
+        metrics.RETENTION_EVICTED.inc(size, reason=reason)
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "duration_sec": self.duration_sec,
+            "free_bytes": self.free_bytes,
+            "usage_bytes": self.usage_bytes,
+            "shortfall_bytes": self.shortfall_bytes,
+            "evicted": self.evicted,
+        }
+
+
+def _prune_dirs(hour_dir: Path, now: float):
+    """Remove an hour directory (and its day) once nothing is left in it but an empty .thumbs."""
+    try:
+        start = time.mktime(time.strptime(f"{hour_dir.parent.name} {hour_dir.name}", "%Y-%m-%d %H"))
+    except ValueError:
+        return
+    if start + 2 * 3600 > now:
+        return  # the recorder may still need it
+    try:
+        for p in hour_dir.iterdir():
+            # sprites are content too: those of a segment still on disk elsewhere must stay
+            if p.name != thumbnails.THUMB_DIR or any(p.iterdir()):
+                return
+        shutil.rmtree(hour_dir, ignore_errors=True)
+        hour_dir.parent.rmdir()
+    except OSError:
+        pass  # missing, or the day still has other hours
+
+
+def delete_segment(session: Session, row: RecordingSegment, now: Optional[float] = None):
+    """Remove one segment's file, thumbnails and index row (caller commits)."""
+    path = segment_path(row)
+    path.unlink(missing_ok=True)
+    thumbnails.remove(path)
+    session.delete(row)
+    _prune_dirs(path.parent, now if now is not None else time.time())
+
+
+class RetentionEngine:
+    def __init__(self, disk_usage: Callable = shutil.disk_usage, sleep: Callable[[float], None] = time.sleep):
+        self._disk_usage = disk_usage
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.last_report: Optional[RetentionReport] = None
+        self.usage: Dict[str, int] = {}
+
+    def _pace(self):
+        if settings.RETENTION_DELETE_RATE > 0:
+            self._sleep(1.0 / settings.RETENTION_DELETE_RATE)
+
+    def _evict(self, session: Session, row: RecordingSegment, reason: str, report: RetentionReport, now: float):
+        size = row.size_bytes or 0
+        report.add(row.camera, reason, size)
+        self.usage[row.camera] = max(0, self.usage.get(row.camera, 0) - size)
+        delete_segment(session, row, now)
+        session.commit()
+        self._pace()
+
+    # ---------- age ----------
+
+    def _expire(self, session: Session, report: RetentionReport, now: float):
+        for cam in session.query(Camera).all():
+            days = cam.retention_days or settings.DEFAULT_RETENTION_DAYS
+            cut = now - days * 86400
+            rows = (
+                session.query(RecordingSegment)
+                .filter(
+                    RecordingSegment.camera == cam.name,
+                    RecordingSegment.duration.isnot(None),
+                    RecordingSegment.start_ts + RecordingSegment.duration < cut,
+                )
+                .order_by(RecordingSegment.start_ts)
+                .all()
+            )
+            for row in rows:
+                self._evict(session, row, "age", report, now)
+            self._sweep_days(cam.name, cut)
+
+    def _sweep_days(self, camera: str, cut: float):
+        """Day directories entirely past retention: whatever the index never saw."""
+        for root in (REC_DIR, COLD_DIR):
+            cam_dir = root / camera if root is not None else None
+            if cam_dir is None or not cam_dir.exists():
+                continue
+            for date_dir in sorted(cam_dir.iterdir()):
+                if not date_dir.is_dir():
+                    continue
+                try:
+                    ts = time.mktime(time.strptime(date_dir.name, "%Y-%m-%d"))
+                except ValueError:
+                    continue
+                if ts + 86400 <= cut:
+                    shutil.rmtree(date_dir, ignore_errors=True)
+                    segment_index.forget(camera, date_dir.name)
+
+    # ---------- quiet (motion_drop) ----------
+
+    def _drop_quiet(self, session: Session, report: RetentionReport, now: float):
+        cut = now - settings.QUIET_RETENTION_HOURS * 3600
+        cams = [c.name for c in session.query(Camera).filter(Camera.recording_policy == policy.MOTION_DROP)]
+        if not cams:
+            return
+        rows = (
+            session.query(RecordingSegment)
+            .filter(
+                RecordingSegment.camera.in_(cams),
+                RecordingSegment.tier == policy.TIER_QUIET,
+                RecordingSegment.start_ts + RecordingSegment.duration < cut,
+            )
+            .order_by(RecordingSegment.start_ts)
+            .all()
+        )
+        for row in rows:
+            self._evict(session, row, "quiet", report, now)
+
+    # ---------- space ----------
+
+    def _disk_need(self, root: Path) -> Tuple[int, Optional[int]]:
+        """(bytes to free on root's disk, its free bytes)."""
+        try:
+            du = self._disk_usage(root)
+        except OSError:
+            return 0, None
+        if du.free >= du.total * settings.DISK_MIN_FREE_PCT / 100:
+            return 0, du.free
+        want = du.total * (settings.DISK_MIN_FREE_PCT + settings.RETENTION_HEADROOM_PCT) / 100
+        return int(want - du.free), du.free
+
+    def _quota_need(self) -> int:
+        if settings.RECORDINGS_QUOTA_GB <= 0:
+            return 0
+        quota = settings.RECORDINGS_QUOTA_GB * 1024 ** 3
+        total = sum(self.usage.values())
+        return int(total - quota * (1 - settings.RETENTION_HEADROOM_PCT / 100)) if total > quota else 0
+
+    @staticmethod
+    def _cold_on_own_disk() -> bool:
+        if COLD_DIR is None:
+            return False
+        try:
+            return os.stat(COLD_DIR).st_dev != os.stat(REC_DIR).st_dev
+        except OSError:
+            return False
+
+    def _oldest(self, session: Session, camera: str, cold: Optional[bool]) -> Iterator[RecordingSegment]:
+        """A camera's closed segments (hot only / cold only / either), oldest first, a page at a time."""
+        after = None
+        while True:
+            q = session.query(RecordingSegment).filter(
+                RecordingSegment.camera == camera, RecordingSegment.duration.isnot(None),
+            )
+            if cold is True:
+                q = q.filter(RecordingSegment.cold.is_(True))
+            elif cold is False:
+                q = q.filter(RecordingSegment.cold.isnot(True))
+            if after is not None:
+                # (start_ts, id) keyset: segments may share a start second
+                q = q.filter(or_(
+                    RecordingSegment.start_ts > after[0],
+                    and_(RecordingSegment.start_ts == after[0], RecordingSegment.id > after[1]),
+                ))
+            page = q.order_by(RecordingSegment.start_ts, RecordingSegment.id).limit(CANDIDATE_PAGE).all()
+            if not page:
+                return
+            yield from page
+            after = (page[-1].start_ts, page[-1].id)
+
+    def _make_room(self, session: Session, report: RetentionReport, now: float):
+        # (bytes to free, which segments count): the hot disk, the cold disk, the quota
+        pools = []
+        split = self._cold_on_own_disk()
+        need, report.free_bytes = self._disk_need(REC_DIR)
+        pools.append((need, False if split else None))
+        if split:
+            pools.append((self._disk_need(COLD_DIR)[0], True))
+        for need, cold in pools:
+            have = self._evictable(session, cold)
+            if need > have:
+                logger.error(
+                    "Retention: the disk needs %d bytes freed but its recordings hold only %d; "
+                    "something else is filling it", need, have,
+                )
+            self._evict_oldest(session, need, cold, report, now)
+        self._evict_oldest(session, self._quota_need(), None, report, now)
+
+    @staticmethod
+    def _evictable(session: Session, cold: Optional[bool]) -> int:
+        """Bytes of closed segments (hot only / cold only / either) that space eviction could free."""
+        q = session.query(func.sum(RecordingSegment.size_bytes)).filter(RecordingSegment.duration.isnot(None))
+        if cold is True:
+            q = q.filter(RecordingSegment.cold.is_(True))
+        elif cold is False:
+            q = q.filter(RecordingSegment.cold.isnot(True))
+        return int(q.scalar() or 0)
+
+    def _evict_oldest(self, session: Session, need: int, cold: Optional[bool], report: RetentionReport, now: float):
+        if need <= 0:
+            return
+        priority = {c.name: max(1, c.retention_priority or 1) for c in session.query(Camera).all()}
+        heads = []
+        streams = {}
+        for camera in self.usage:
+            streams[camera] = self._oldest(session, camera, cold)
+            self._push(heads, camera, streams[camera], priority.get(camera, 1), now)
+        freed = 0
+        while heads and freed < need:
+            _, camera, row = heapq.heappop(heads)
+            size = row.size_bytes or 0
+            self._evict(session, row, "space", report, now)
+            freed += size
+            self._push(heads, camera, streams[camera], priority.get(camera, 1), now)
+        if freed < need:
+            report.shortfall_bytes += need - freed
+            logger.warning("Retention: %d bytes short of the disk watermark with nothing left to evict", need - freed)
+
+    @staticmethod
+    def _push(heads: list, camera: str, rows: Iterator[RecordingSegment], prio: int, now: float):
+        row = next(rows, None)
+        if row is not None:
+            # oldest weighted age first: heapq is a min-heap
+            heapq.heappush(heads, (-(now - row.start_ts) / prio, camera, row))
 
-def run_retention_loop(get_session_func):
+    # ---------- passes ----------
+
+    def refresh_usage(self, session: Session):
+        self.usage = {
+            cam: int(total or 0)
+            for cam, total in session.query(RecordingSegment.camera, func.sum(RecordingSegment.size_bytes))
+            .group_by(RecordingSegment.camera)
+        }
+
+    def run_pass(self, session: Optional[Session] = None, now: Optional[float] = None) -> RetentionReport:
+        report = RetentionReport()
+        now = now if now is not None else time.time()
+        own = session is None
+        session = session or database.SessionLocal()
+        try:
+            with self._lock:
+                self.refresh_usage(session)
+                self._expire(session, report, now)
+                self._drop_quiet(session, report, now)
+                self._make_room(session, report, now)
+                report.usage_bytes = sum(self.usage.values())
+        finally:
+            if own:
+                session.close()
+        report.duration_sec = time.time() - report.started
+        self.last_report = report
+        metrics.RETENTION_PASS.observe(report.duration_sec)
+        if report.evicted:
+            logger.info("Retention pass: %.2fs, evicted %s", report.duration_sec, report.evicted)
+        else:
+            logger.debug("Retention pass: %.2fs, nothing to evict", report.duration_sec)
+        return report
+
+    def run(self):
+        while True:
+            try:
+                self.run_pass()
+            except Exception:
+                logger.exception("Retention pass failed")
+            time.sleep(settings.RETENTION_INTERVAL_SEC)
+
+
+retention_engine = RetentionEngine()
+
+
+def _collect_metrics():
+    usage = metrics.Family("homecam_recording_usage_bytes", "gauge", "Recorded bytes per camera (as of the last retention pass).")
+    for camera, size in dict(retention_engine.usage).items():
+        usage.add(size, camera=camera)
+    free = metrics.Family("homecam_recordings_disk_free_bytes", "gauge", "Free space on the recordings disk at the last retention pass.")
+    report = retention_engine.last_report
+    free.add(report.free_bytes if report else None)
+    return [usage, free]
+
+
+metrics.registry.collector("retention", _collect_metrics)
+
+
+# Motion-aware recording tiers (recording_policy.py), checked every few minutes
+
+def run_policy_loop():
     while True:
+        time.sleep(settings.RECORDING_POLICY_INTERVAL_SEC)
         try:
-            with get_session_func() as db:
-                _apply_retention(db)
+            with database.SessionLocal() as session:
+                _apply_recording_policies(session)
         except Exception:
-            pass
-        time.sleep(24 * 3600)
-
-
-def _apply_retention(db: Session):
-    cams = db.query(Camera).all()
-    now = time.time()
-    for cam in cams:
-        days = cam.retention_days or settings.DEFAULT_RETENTION_DAYS
-        cut = now - days * 86400
-        cam_dir = REC_DIR / cam.name
-        if not cam_dir.exists():
+            logger.exception("Recording policy pass failed")
+
+
+def _apply_recording_policies(db: Session, now: float = None):
+    now = now if now is not None else time.time()
+    for cam in db.query(Camera).all():
+        if not policy.is_motion_policy(cam.recording_policy):
             continue
-        for date_dir in sorted(cam_dir.iterdir()):
-            if not date_dir.is_dir():
-                continue
-            # Parse date folder YYYY-MM-DD
+        _classify(db, cam, now)
+        if cam.recording_policy == policy.MOTION_COMPACT:
+            _compact_quiet(db, cam)
+        # motion_drop: the retention pass deletes quiet segments (paced, in its report)
+        # motion_substream: quiet footage was recorded small already
+
+
+def _classify(db: Session, cam: Camera, now: float):
+    """
+    Tag closed segments motion/quiet once late events can no longer change the answer.
+    Only footage recorded since the policy took effect is looked at; a segment is
+    quiet only if its motion source was up and reported nothing for all of it.
+    """
+    if cam.recording_policy_since is None:
+        cam.recording_policy_since = now  # policy set before this was tracked: from here on
+        db.commit()
+    settled = now - settings.MOTION_POSTROLL_SEC - POLICY_SETTLE_SEC
+    rows = (
+        db.query(RecordingSegment)
+        .filter(
+            RecordingSegment.camera == cam.name,
+            RecordingSegment.start_ts >= cam.recording_policy_since,
+            RecordingSegment.tier.is_(None),
+            RecordingSegment.duration.isnot(None),
+            RecordingSegment.start_ts + RecordingSegment.duration < settled,
+        )
+        .order_by(RecordingSegment.start_ts)
+        .all()
+    )
+    if not rows:
+        return
+    start, end = rows[0].start_ts, max(r.start_ts + r.duration for r in rows)
+    intervals = policy.motion_intervals(db, cam.id, start, end)
+    down = policy.outage_intervals(db, cam.id, start, end)
+    watched = policy.has_motion_source(cam)
+    for r in rows:
+        seg_end = r.start_ts + r.duration
+        moving = not watched or policy.overlaps(r.start_ts, seg_end, intervals) or policy.overlaps(r.start_ts, seg_end, down)
+        r.tier = policy.TIER_MOTION if moving else policy.TIER_QUIET
+    db.commit()
+
+
+def _compact_quiet(db: Session, cam: Camera):
+    """Queue the camera's quiet segments for re-encoding (they stay quiet until done)."""
+    rows = (
+        db.query(RecordingSegment.id)
+        .filter(RecordingSegment.camera == cam.name, RecordingSegment.tier == policy.TIER_QUIET)
+        .order_by(RecordingSegment.start_ts)
+        .all()
+    )
+    for (seg_id,) in rows:
+        quiet_compactor.submit(seg_id)
+
+
+class QuietCompactor:
+    """
+    Re-encodes queued quiet segments on its own thread, one at a time, so a long
+    backlog never holds up the policy pass of other cameras. The tier only moves
+    to compact once a segment is done, so a backlog survives restarts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._pending: Set[int] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, seg_id: int):
+        with self._lock:
+            if seg_id in self._pending:
+                return
+            self._pending.add(seg_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="quiet-compact", daemon=True)
+                self._thread.start()
+        self._queue.put(seg_id)
+
+    def join(self):
+        """Block until everything queued so far is done (tests)."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            seg_id = self._queue.get()
             try:
-                ts = time.mktime(time.strptime(date_dir.name, "%Y-%m-%d"))
+                self.compact_one(seg_id)
             except Exception:
-                continue
-            if ts < cut:
-                shutil.rmtree(date_dir, ignore_errors=True)
+                logger.exception("Re-encoding quiet segment %s failed", seg_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(seg_id)
+                self._queue.task_done()
+
+    @staticmethod
+    def compact_one(seg_id: int):
+        # no session is held across the encode: it can take a while
+        with database.SessionLocal() as session:
+            r = session.get(RecordingSegment, seg_id)
+            if r is None or r.tier != policy.TIER_QUIET:
+                return
+            path = segment_path(r)
+        size = policy.compact(path) if path.exists() else None
+        with database.SessionLocal() as session:
+            r = session.get(RecordingSegment, seg_id)
+            if r is None or r.tier != policy.TIER_QUIET:
+                return  # deleted by retention meanwhile
+            if size is not None:
+                r.size_bytes = size
+            r.tier = policy.TIER_COMPACT
+            session.commit()
+
+
+quiet_compactor = QuietCompactor()
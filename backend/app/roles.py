@@ -1,6 +1,8 @@
 # backend/app/roles.py
 from typing import Optional, Tuple
 from .models import Camera, CameraStream, RoleMode
+from .config import settings
+from .recording_policy import MOTION_SUBSTREAM, recording_policy
 
 def _best_stream_for(cam: Camera, target_w: int, target_h: int) -> Optional[CameraStream]:
     cands = [s for s in cam.streams if s.enabled and s.width and s.height]
@@ -14,9 +16,18 @@ def _best_stream_for(cam: Camera, target_w: int, target_h: int) -> Optional[Came
 
 def resolve_role(cam: Camera, role: str) -> Tuple[Optional[str], Optional[int], Optional[int], bool]:
     """
-    Returns (rtsp_url, scale_w, scale_h, should_run) for role in {"grid","medium","high","recording"}.
+    Returns (rtsp_url, scale_w, scale_h, should_run) for role in {"grid","medium","high","recording","abr"}.
     Scaling is only applied for grid/auto when needed to match grid_target_*; otherwise None.
+    For "abr" (LIVE_ABR ladder) the source is the high stream and scale_* is the grid rung size.
     """
+    if role == "abr":
+        if not settings.LIVE_ABR:
+            return (None,None,None,False)
+        src, _, _, run = resolve_role(cam, "high")
+        if not run or not src:
+            src, _, _, run = resolve_role(cam, "grid")
+        return (src, cam.grid_target_w, cam.grid_target_h, run)
+
     if role == "grid":
         if cam.grid_mode == RoleMode.manual and cam.grid_stream:
             return (cam.grid_stream.rtsp_url, None, None, True)
@@ -42,9 +53,25 @@ def resolve_role(cam: Camera, role: str) -> Tuple[Optional[str], Optional[int],
     if role == "recording":
         if (cam.retention_days or 0) <= 0 or cam.recording_mode == RoleMode.disabled:
             return (None,None,None,False)
+        if cam.recording_policy == MOTION_SUBSTREAM and not recording_policy.motion_active(cam.id):
+            # nothing moving: the smallest stream; full quality again once motion starts
+            low = min([s for s in cam.streams if s.enabled and s.width and s.height], key=lambda s: s.width*s.height, default=None)
+            if low:
+                return (low.rtsp_url, None, None, True)
         if cam.recording_mode == RoleMode.manual and cam.recording_stream:
             return (cam.recording_stream.rtsp_url, None, None, True)
         pick = max([s for s in cam.streams if s.enabled and s.width and s.height], key=lambda s: s.width*s.height, default=None)
         return ((pick.rtsp_url if pick else cam.rtsp_url), None, None, True)
 
     return (None,None,None,False)
+
+def stream_meta(cam: Camera, url: Optional[str]) -> Optional[dict]:
+    """Probed codec info for the camera stream behind url (None if unknown / never probed)."""
+    s = next((s for s in cam.streams if s.rtsp_url == url and s.probed_at), None)
+    if not s:
+        return None
+    return {
+        "width": s.width, "height": s.height, "fps": s.fps,
+        "codec": s.codec, "profile": s.profile, "gop": s.gop,
+        "audio_codec": s.audio_codec,
+    }
@@ -9,11 +9,21 @@ class CameraCreate(BaseModel):
     name: str
     rtsp_url: str
     retention_days: Optional[int] = None  # 0 means no recordings
+    retention_priority: Optional[int] = None  # eviction weight under disk pressure (None = 1)
+    onvif_port: Optional[int] = None      # ONVIF events on the RTSP host; None = off
+    motion_detect: Optional[bool] = None  # software motion detection on the grid source
+    recording_policy: Optional[str] = None  # continuous | motion_drop | motion_compact | motion_substream
 
 class CameraUpdate(BaseModel):
     rtsp_url: Optional[str] = None
     enabled: Optional[bool] = None
     retention_days: Optional[int] = None
+    retention_priority: Optional[int] = None
+    onvif_port: Optional[int] = None
+    motion_detect: Optional[bool] = None
+    motion_mask: Optional[str] = None        # "x,y,w,h;..." zones to ignore (fractions of the frame)
+    motion_threshold: Optional[float] = None # changed fraction of watched pixels
+    recording_policy: Optional[str] = None   # continuous | motion_drop | motion_compact | motion_substream
     # legacy encoder knobs (keep for CRF)
     low_crf: Optional[int] = None
     high_crf: Optional[int] = None
@@ -38,6 +48,10 @@ class CameraStreamOut(BaseModel):
     height: Optional[int]
     fps: Optional[int]
     bitrate_kbps: Optional[int]
+    codec: Optional[str] = None
+    profile: Optional[str] = None
+    gop: Optional[int] = None
+    audio_codec: Optional[str] = None
     class Config:
         from_attributes = True  # Pydantic v2
 
@@ -63,6 +77,7 @@ class CameraAdminOut(BaseModel):
     name: str
     rtsp_url: str
     retention_days: int
+    retention_priority: Optional[int] = None
 
     grid_mode: RoleMode
     grid_stream_id: Optional[int]
@@ -78,10 +93,32 @@ class CameraAdminOut(BaseModel):
     recording_mode: RoleMode
     recording_stream_id: Optional[int]
 
+    onvif_port: Optional[int] = None
+    motion_detect: Optional[bool] = None
+    motion_mask: Optional[str] = None
+    motion_threshold: Optional[float] = None
+    recording_policy: Optional[str] = None
+
     streams: List[CameraStreamOut]
     class Config:
         from_attributes = True
 
+class RetentionEviction(BaseModel):
+    segments: int
+    bytes: int
+
+class RetentionPassOut(BaseModel):
+    started: float
+    duration_sec: float
+    free_bytes: Optional[int] = None   # free space on the recordings disk
+    usage_bytes: int                   # indexed recordings after the pass
+    shortfall_bytes: int = 0           # space still missing when everything evictable is gone
+    evicted: Dict[str, Dict[str, RetentionEviction]]  # camera -> "age" | "space" -> totals
+
+class RetentionStatusOut(BaseModel):
+    last_pass: Optional[RetentionPassOut] = None
+    usage: Dict[str, int]              # camera -> bytes
+
 # -------- Client list (no RTSP) --------
 
 class CameraClientItem(BaseModel):
@@ -98,6 +135,58 @@ class RecordingFile(BaseModel):
     path: str          # API path like /api/recordings/<cam>/<date>/<hour>/<file>.mp4
     start_ts: float    # epoch seconds
     size_bytes: int
+    duration: Optional[float] = None  # seconds; None until the segment is closed
+    in_progress: bool = False  # segment still being written (size will grow)
+    thumbnails: Optional[str] = None  # WebVTT thumbnail track (sprite sheet cues), once generated
+    cold: bool = False  # archived: re-encoded smaller in the cold tier
+
+# -------- Timeline --------
+
+class TimeInterval(BaseModel):
+    start: float
+    end: float
+
+class TimelineOut(BaseModel):
+    start: float
+    end: float
+    coverage: List[TimeInterval]   # merged recorded intervals within [start, end)
+    gaps: List[TimeInterval]       # holes longer than the gap tolerance
+
+class RecordingLookup(BaseModel):
+    segment: RecordingFile
+    offset_sec: float                            # seconds from segment start to `at`
+    byte_offset: Optional[int] = None            # start of the keyframe fMP4 fragment at or before `at`
+    fragment_offset_sec: Optional[float] = None  # that fragment's start (a keyframe), seconds into the segment
+
+# -------- Motion --------
+
+class MotionEventOut(BaseModel):
+    id: int
+    ts: float
+    active: bool                 # motion started (True) or ended
+    topic: str
+    source: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class MotionEventsOut(BaseModel):
+    events: List[MotionEventOut]
+    next: Optional[str] = None   # pass as `after` for the next page; None on the last page
+
+class MotionHourOut(BaseModel):
+    ts: float          # start of the hour
+    events: int        # motion starts
+    seconds: float     # motion time inside the hour (summed over sources)
+
+class MotionHistogramCamera(BaseModel):
+    camera_id: int
+    hours: List[MotionHourOut]   # hours without motion are left out
+
+class MotionHistogramOut(BaseModel):
+    start: float
+    end: float
+    bucket_sec: int
+    cameras: List[MotionHistogramCamera]
 
 # -------- Clip export --------
 
@@ -106,6 +195,25 @@ class ClipExportRequest(BaseModel):
     end: float
     name: Optional[str] = None
     save: bool = False
+    stream: bool = True        # save=false: stream fragmented MP4 as ffmpeg writes it
+
+class CameraExportRequest(BaseModel):
+    start: float               # epoch seconds (wall clock)
+    end: float
+    name: Optional[str] = None
+    save: bool = False
+    accurate: bool = False     # re-encode the head GOP so the clip starts exactly at `start`
+    stream: bool = True        # save=false: stream fragmented MP4 (not with accurate)
+
+class ExportJobOut(BaseModel):
+    id: str
+    status: str                    # queued | running | done | failed | cancelled
+    progress: float                # 0..1
+    duration: float                # clip length in seconds
+    error: Optional[str] = None
+    created: float
+    finished: Optional[float] = None
+    path: Optional[str] = None     # saved clip or download URL once done
 
 class SavedVideo(BaseModel):
     name: str
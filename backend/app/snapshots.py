@@ -0,0 +1,108 @@
+# backend/app/snapshots.py
+"""
+Still images from the live grid stream.
+
+snapshot_cache.get(cam) decodes the first (key)frame of the grid role's newest complete
+segment, the last one its playlist lists, so it never starts an HLS session or
+touches the camera. Results are cached per camera for SNAPSHOT_TTL_SEC, and
+concurrent requests for the same camera wait on one decode instead of starting
+their own. After the TTL runs out, a new decode only happens once a newer
+segment exists. Without a grid playlist (camera stopped) there is no snapshot.
+"""
+import subprocess
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from .config import LIVE_DIR, settings
+from .llhls import PARTS_PLAYLIST
+from . import live_store
+
+DECODE_TIMEOUT_SEC = 10
+
+
+def newest_segment(cam_name: str) -> Optional[Tuple[str, bytes]]:
+    """(name, decodable bytes) of the grid role's last listed segment."""
+    for playlist, init in (("index.m3u8", None), (PARTS_PLAYLIST, "init.mp4")):
+        text = live_store.read(LIVE_DIR, f"{cam_name}/grid/{playlist}")
+        if not text:
+            continue
+        uris = [l for l in text.decode("utf-8", "ignore").splitlines() if l and not l.startswith("#")]
+        if not uris:
+            continue
+        name = uris[-1].rsplit("/", 1)[-1]
+        data = live_store.read(LIVE_DIR, f"{cam_name}/grid/{name}")
+        if data is None:
+            continue
+        if init:
+            # LL-HLS parts are fMP4 fragments: decodable only after the init segment
+            head = live_store.read(LIVE_DIR, f"{cam_name}/grid/{init}")
+            if head is None:
+                continue
+            data = head + data
+        return name, data
+    return None
+
+
+def decode_keyframe(data: bytes) -> Optional[bytes]:
+    """JPEG of the first keyframe in a media segment (piped through ffmpeg)."""
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-skip_frame", "nokey", "-i", "pipe:0",
+        "-an", "-frames:v", "1", "-q:v", str(settings.SNAPSHOT_QUALITY),
+        "-f", "image2", "-c:v", "mjpeg", "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=data, capture_output=True, timeout=DECODE_TIMEOUT_SEC)
+    except subprocess.TimeoutExpired:
+        return None
+    return proc.stdout if proc.returncode == 0 and proc.stdout else None
+
+
+class Snapshot:
+    def __init__(self, jpeg: bytes, segment: str):
+        self.jpeg = jpeg
+        self.segment = segment
+        self.taken = time.time()
+        self.etag = f'"{zlib.crc32(jpeg):08x}"'
+
+
+class SnapshotCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cam_locks: Dict[str, threading.Lock] = {}
+        self._items: Dict[str, Snapshot] = {}
+
+    def _cam_lock(self, cam_name: str) -> threading.Lock:
+        with self._lock:
+            return self._cam_locks.setdefault(cam_name, threading.Lock())
+
+    def get(self, cam_name: str) -> Optional[Snapshot]:
+        cached = self._items.get(cam_name)
+        if cached and time.time() - cached.taken < settings.SNAPSHOT_TTL_SEC:
+            return cached
+        # one decode per camera at a time; everyone else waits and reuses it
+        with self._cam_lock(cam_name):
+            cached = self._items.get(cam_name)
+            if cached and time.time() - cached.taken < settings.SNAPSHOT_TTL_SEC:
+                return cached
+            seg = newest_segment(cam_name)
+            if seg is None:
+                self._items.pop(cam_name, None)  # grid isn't running
+                return None
+            name, data = seg
+            if cached and cached.segment == name:
+                cached.taken = time.time()  # nothing newer to decode yet
+                return cached
+            jpeg = decode_keyframe(data)
+            if jpeg is None:
+                return cached
+            snap = self._items[cam_name] = Snapshot(jpeg, name)
+            return snap
+
+    def forget(self, cam_name: str):
+        self._items.pop(cam_name, None)
+
+
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,187 @@
+# backend/app/supervisor.py
+"""
+One thread that notices when any managed ffmpeg exits.
+
+Each watched process gets a pidfd (Linux 5.3+) registered with a selector; the
+pidfd turns readable when the process exits, so hundreds of children cost one
+thread and one epoll set instead of a thread blocked in wait() per process.
+Where pidfds are unavailable the loop polls those processes every POLL_SEC.
+Exit status is collected with Popen.poll(), so a caller that also wait()s on
+the process (stop_role) does not race the supervisor for the reap.
+
+A process's stdout can be watched too (on_output gets each chunk read, on this
+thread, so it must be cheap); ffmpeg_manager uses that for -progress telemetry.
+The pipe is always drained, so a chatty child never blocks on a full pipe.
+
+call_later() runs a callback after a delay (restart backoff, stall checks);
+callbacks run on a small thread pool so a slow restart never stalls exit detection.
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import selectors
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger("homecam.supervisor")
+
+POLL_SEC = 1.0
+CALLBACK_WORKERS = 4
+
+ExitCallback = Callable[[subprocess.Popen, Optional[int]], None]
+OutputCallback = Callable[[bytes], None]
+
+
+def backoff_delay(failures: int) -> float:
+    """Delay before restart number `failures` (1-based): doubling, capped, with jitter."""
+    if failures <= 0:
+        return 0.0
+    base = min(settings.RESTART_BACKOFF_MAX_SEC, settings.RESTART_BACKOFF_MIN_SEC * 2 ** (failures - 1))
+    # equal jitter: cameras behind one dead switch do not all retry in the same second
+    return base / 2 + random.uniform(0, base / 2)
+
+
+class ProcessSupervisor:
+    def __init__(self, name: str = "supervisor"):
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._pending: List[Tuple[subprocess.Popen, ExitCallback, Optional[OutputCallback]]] = []
+        self._polled: Dict[int, Tuple[subprocess.Popen, ExitCallback]] = {}  # pid -> no pidfd
+        self._timers: List[Tuple[float, int, Callable, tuple]] = []
+        self._seq = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS, thread_name_prefix=f"{name}-cb")
+        threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    # ---------- public ----------
+
+    def watch(self, proc: subprocess.Popen, on_exit: ExitCallback, on_output: Optional[OutputCallback] = None):
+        """
+        Call on_exit(proc, returncode) on the pool once proc has exited.
+        on_output (if proc has a stdout pipe) gets what the process writes there.
+        """
+        with self._lock:
+            self._pending.append((proc, on_exit, on_output))
+        self._wake()
+
+    def call_later(self, delay: float, fn: Callable, *args):
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + max(0.0, delay), next(self._seq), fn, args))
+        self._wake()
+
+    def watched(self) -> int:
+        """Processes currently watched (for status/metrics)."""
+        with self._lock:
+            exits = sum(1 for k in self._selector.get_map().values() if k.data and k.data[0] == "exit")
+            return exits + len(self._polled) + len(self._pending)
+
+    # ---------- loop ----------
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # already woken
+
+    def _register_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for proc, on_exit, on_output in pending:
+            if on_output is not None and proc.stdout is not None:
+                os.set_blocking(proc.stdout.fileno(), False)
+                with self._lock:
+                    self._selector.register(proc.stdout.fileno(), selectors.EVENT_READ, ("out", proc, on_output))
+            try:
+                fd = os.pidfd_open(proc.pid)
+            except ProcessLookupError:
+                self._exited(proc, on_exit)  # gone and reaped before we looked
+                continue
+            except (AttributeError, OSError):
+                with self._lock:
+                    self._polled[proc.pid] = (proc, on_exit)
+                continue
+            with self._lock:
+                self._selector.register(fd, selectors.EVENT_READ, ("exit", proc, on_exit))
+
+    def _next_timeout(self, now: float) -> Optional[float]:
+        with self._lock:
+            due = self._timers[0][0] - now if self._timers else None
+            if self._polled:
+                due = POLL_SEC if due is None else min(due, POLL_SEC)
+        return None if due is None else max(0.0, due)
+
+    def _run_due(self, now: float):
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > now:
+                    return
+                _, _, fn, args = heapq.heappop(self._timers)
+            self._pool.submit(self._call, fn, *args)
+
+    def _exited(self, proc: subprocess.Popen, on_exit: ExitCallback):
+        self._pool.submit(self._call, on_exit, proc, proc.poll())
+
+    @staticmethod
+    def _call(fn: Callable, *args):
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("Supervisor callback %s failed", getattr(fn, "__name__", fn))
+
+    def _read_output(self, fd: int, proc: subprocess.Popen, on_output: OutputCallback):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            with self._lock:
+                self._selector.unregister(fd)
+            proc.stdout.close()
+            return
+        self._call(on_output, data)
+
+    def _run(self):
+        while True:
+            self._register_pending()
+            events = self._selector.select(self._next_timeout(time.monotonic()))
+            for key, _ in events:
+                if key.fd == self._wake_r:
+                    try:
+                        while os.read(self._wake_r, 512):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                kind, proc, cb = key.data
+                if kind == "out":
+                    self._read_output(key.fd, proc, cb)
+                    continue
+                with self._lock:
+                    self._selector.unregister(key.fd)
+                os.close(key.fd)
+                on_exit = cb
+                try:
+                    proc.wait(timeout=1)  # readable pidfd: already exited, reap now
+                except subprocess.TimeoutExpired:  # pragma: no cover - defensive
+                    pass
+                self._exited(proc, on_exit)
+            if self._polled:
+                with self._lock:
+                    done = [(pid, v) for pid, v in self._polled.items() if v[0].poll() is not None]
+                    for pid, _ in done:
+                        self._polled.pop(pid, None)
+                for _, (proc, on_exit) in done:
+                    self._exited(proc, on_exit)
+            self._run_due(time.monotonic())
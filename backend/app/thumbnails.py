@@ -0,0 +1,213 @@
+# backend/app/thumbnails.py
+"""
+Scrub previews for recordings.
+
+For every closed segment a low-priority worker renders one JPEG sprite sheet (a
+tile every THUMB_INTERVAL_SEC, decoded from keyframes only) and a WebVTT track
+whose cues point into it with #xywh= fragments. Both live next to the segment's
+file in <hour>/.thumbs/ (hot or cold tier: archiving moves them along), so
+deleting a day or hour directory removes them too; remove() covers segments
+deleted one by one.
+
+Work is found through the index: closed segments (duration known) with
+thumbs IS NULL, newest first, so fresh segments get previews within a poll and
+old footage is backfilled behind them.
+"""
+import logging
+import math
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Set, Tuple
+
+from . import db
+from .config import REC_DIR, settings
+from .models import RecordingSegment
+from .recordings import segment_path
+
+logger = logging.getLogger("homecam.thumbnails")
+
+THUMB_DIR = ".thumbs"
+BATCH = 8
+
+
+def asset_paths(seg: Path) -> Tuple[Path, Path]:
+    """(sprite .jpg, .vtt) for a segment file (see recordings.segment_path)."""
+    base = seg.parent / THUMB_DIR / seg.stem
+    return base.with_suffix(".jpg"), base.with_suffix(".vtt")
+
+
+def remove(seg: Path):
+    for p in asset_paths(seg):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def move(src: Path, dst: Path):
+    """Carry a segment's sprite and VTT from src's directory to dst's (archiving)."""
+    for a, b in zip(asset_paths(src), asset_paths(dst)):
+        if not a.exists():
+            continue
+        b.parent.mkdir(exist_ok=True)
+        shutil.copyfile(a, b)  # COLD_DIR is usually another filesystem
+        a.unlink(missing_ok=True)
+
+
+def grid(duration: float) -> Tuple[int, int, int]:
+    """(tiles, columns, rows) for a segment of this length."""
+    count = max(1, math.ceil(duration / settings.THUMB_INTERVAL_SEC))
+    cols = min(count, settings.THUMB_COLUMNS)
+    return count, cols, math.ceil(count / cols)
+
+
+def sprite_cmd(src: Path, out: Path, cols: int, rows: int):
+    vf = (
+        f"fps=1/{settings.THUMB_INTERVAL_SEC},"
+        f"scale={settings.THUMB_WIDTH}:-2,"
+        f"tile={cols}x{rows}"
+    )
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-skip_frame", "nokey", "-i", str(src),
+        "-an", "-vf", vf, "-frames:v", "1", "-q:v", "5",
+        str(out),
+    ]
+
+
+def jpeg_size(path: Path) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG's SOF marker."""
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            length = struct.unpack(">H", f.read(2))[0]
+            if marker[1] in (0xC0, 0xC1, 0xC2):
+                h, w = struct.unpack(">xHH", f.read(5))
+                return w, h
+            f.seek(length - 2, 1)
+
+
+def _ts(sec: float) -> str:
+    h, rem = divmod(int(round(sec * 1000)), 3_600_000)
+    m, rem = divmod(rem, 60_000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def build_vtt(sprite_name: str, duration: float, cols: int, tile_w: int, tile_h: int) -> str:
+    """Cue i covers [i*interval, (i+1)*interval) and points at tile i (row-major)."""
+    step = settings.THUMB_INTERVAL_SEC
+    count = max(1, math.ceil(duration / step))
+    lines = ["WEBVTT", ""]
+    for i in range(count):
+        x, y = (i % cols) * tile_w, (i // cols) * tile_h
+        lines.append(f"{_ts(i * step)} --> {_ts(min((i + 1) * step, duration))}")
+        lines.append(f"{sprite_name}#xywh={x},{y},{tile_w},{tile_h}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _lower_priority():
+    try:
+        os.nice(settings.THUMB_NICE)
+    except OSError:
+        pass
+
+
+def generate(rel_path: str, duration: float, src: Optional[Path] = None) -> bool:
+    """Render sprite + VTT next to one segment (src: its file, if archived); True on success."""
+    src = src or REC_DIR / rel_path
+    sprite, vtt = asset_paths(src)
+    sprite.parent.mkdir(exist_ok=True)
+    count, cols, rows = grid(duration)
+    tmp = sprite.with_name(sprite.stem + ".tmp.jpg")
+    proc = subprocess.run(
+        sprite_cmd(src, tmp, cols, rows),
+        capture_output=True,
+        preexec_fn=_lower_priority,
+    )
+    size = jpeg_size(tmp) if proc.returncode == 0 and tmp.exists() else None
+    if size is None:
+        logger.warning("Thumbnail sprite failed for %s: %s", rel_path, proc.stderr.decode("utf-8", "ignore")[-500:])
+        tmp.unlink(missing_ok=True)
+        return False
+    os.replace(tmp, sprite)
+    # the VTT names the sprite relatively: both are served from the segment's URL
+    vtt_tmp = vtt.with_name(vtt.name + ".tmp")
+    vtt_tmp.write_text(build_vtt("thumbnails.jpg", duration, cols, size[0] // cols, size[1] // rows))
+    os.replace(vtt_tmp, vtt)
+    return True
+
+
+class ThumbnailWorkers:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claimed: Set[int] = set()
+
+    def _claim(self) -> Optional[RecordingSegment]:
+        with self._lock, db.SessionLocal() as session:
+            q = (
+                session.query(RecordingSegment)
+                .filter(RecordingSegment.duration.isnot(None), RecordingSegment.thumbs.is_(None))
+                .order_by(RecordingSegment.start_ts.desc())
+            )
+            if self._claimed:
+                q = q.filter(RecordingSegment.id.notin_(self._claimed))
+            row = q.first()
+            if row is None:
+                return None
+            self._claimed.add(row.id)
+            session.expunge(row)
+            return row
+
+    def _mark(self, seg_id: int, ok: bool):
+        with self._lock, db.SessionLocal() as session:
+            row = session.get(RecordingSegment, seg_id)
+            if row is not None:
+                row.thumbs = ok
+                session.commit()
+            self._claimed.discard(seg_id)
+
+    def run_batch(self, limit: int = BATCH) -> int:
+        done = 0
+        while done < limit:
+            row = self._claim()
+            if row is None:
+                break
+            try:
+                src = segment_path(row)
+                ok = src.exists() and generate(row.rel_path, row.duration, src)
+            except Exception:
+                logger.exception("Thumbnail generation failed for %s", row.rel_path)
+                ok = False
+            self._mark(row.id, ok)
+            done += 1
+        return done
+
+    def run(self):
+        while True:
+            try:
+                if self.run_batch():
+                    continue
+            except Exception:  # e.g. "database is locked": try again later, don't lose the worker
+                logger.exception("Thumbnail batch failed")
+            time.sleep(settings.RECORDING_INDEX_POLL_SEC)
+
+
+thumbnail_workers = ThumbnailWorkers()
+
+
+def start_workers():
+    if not settings.THUMBNAILS:
+        return
+    for _ in range(max(1, settings.THUMB_WORKERS)):
+        threading.Thread(target=thumbnail_workers.run, daemon=True).start()
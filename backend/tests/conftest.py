@@ -0,0 +1,41 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+# Modules under backend.app read settings at import time; make sure any test
+# module that imports them during collection gets a writable DB location.
+os.environ.setdefault("DB_PATH", "/tmp/homecam_test.db")
+# main starts the thumbnail workers on import; left running, they would outlive
+# each test's database (tests that need them drive run_batch() by hand).
+os.environ.setdefault("THUMBNAILS", "false")
+
+
+@pytest.fixture()
+def rec_env(tmp_path, monkeypatch):
+    """Settings for a fresh recordings tree: own DB, media root and cold tier.
+
+    Test modules reload the backend.app modules they exercise on top of this.
+    """
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setenv("MEDIA_ROOT", str(tmp_path / "media"))
+    monkeypatch.delenv("RECORDINGS_ROOT", raising=False)
+    monkeypatch.setenv("THUMBNAILS", "false")  # tests drive the workers by hand
+    monkeypatch.setenv("COLD_ROOT", str(tmp_path / "cold"))
+    monkeypatch.setenv("ARCHIVE_WORKERS", "0")
+    return tmp_path
+
+
+@pytest.fixture()
+def write_segment():
+    """write_segment(rec_dir, name, size, age=0): a cam1 segment file, optionally `age` seconds old."""
+    def write(rec_dir: Path, name: str, size: int, age: float = 0) -> Path:
+        p = rec_dir / "cam1" / name[:10] / name[11:13] / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_bytes(b"x" * size)
+        if age:
+            t = time.time() - age
+            os.utime(p, (t, t))
+        return p
+    return write
@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app import ffmpeg_manager as fm
+
+
+def test_abr_single_process_ladder(tmp_path, monkeypatch):
+    monkeypatch.setattr(fm, "LIVE_DIR", tmp_path)
+    mgr = fm.FFmpegManager()
+    mgr._stream_meta["rtsp://cam"] = {"width": 1920, "height": 1080, "audio_codec": "aac"}
+
+    captured = {}
+
+    def fake_spawn(tail, cam_name, src, log, **kwargs):
+        captured["tail"] = tail
+        return None
+
+    monkeypatch.setattr(mgr, "_spawn_from_source", fake_spawn)
+    mgr._start_abr_proc("cam1", "rtsp://cam", 23, 640, 360)
+    tail = captured["tail"]
+
+    # one decode, split three ways; grid and medium scaled, high untouched
+    fc = tail[tail.index("-filter_complex") + 1]
+    assert fc.startswith("[0:v]split=3[v0][v1][v2];")
+    assert "[v0]scale=640:360[o0]" in fc
+    assert "[v1]scale=1280:720[o1]" in fc
+    assert "[v2]null[o2]" in fc
+    # aligned keyframes for every rung
+    assert tail[tail.index("-force_key_frames") + 1] == "expr:gte(t,n_forced*2)"
+    assert tail[tail.index("-var_stream_map") + 1] == "v:0,name:grid v:1,a:0,name:medium v:2,a:1,name:high"
+    assert tail[-1] == str(tmp_path / "cam1" / "%v" / "index.m3u8")
+
+    master = (tmp_path / "cam1" / "master.m3u8").read_text().splitlines()
+    assert master[0] == "#EXTM3U"
+    assert [l for l in master if not l.startswith("#")] == [
+        "grid/index.m3u8", "medium/index.m3u8", "high/index.m3u8",
+    ]
+    assert "#EXT-X-STREAM-INF:BANDWIDTH=1200000,RESOLUTION=640x360" in master
+
+    mgr._cleanup_live_role("cam1", "abr")
+    assert not (tmp_path / "cam1" / "master.m3u8").exists()
+    assert not (tmp_path / "cam1" / "grid").exists()
@@ -75,3 +75,39 @@ def test_camera_crud(api_client):
     resp = client.get("/api/admin/cameras")
     assert resp.status_code == 200
     assert resp.json() == []
+
+
+def test_metrics_endpoint_exposes_route_latency_and_processes(api_client):
+    import subprocess
+    from backend.app import ffmpeg_manager, metrics
+
+    client, _ = api_client
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam-m", "rtsp_url": "rtsp://x"}).json()["id"]
+    client.get(f"/api/cameras/{cam_id}/recordings/2024-01-01")
+
+    mgr = ffmpeg_manager.ffmpeg_manager
+    proc = subprocess.Popen(["sleep", "30"])
+    with mgr._lock:
+        mgr._procs.setdefault(cam_id, {})["grid"] = proc
+        mgr._cam_names[cam_id] = "cam-m"
+    try:
+        resp = client.get("/metrics")
+    finally:
+        with mgr._lock:
+            mgr._procs.pop(cam_id, None)
+        proc.kill()
+        proc.wait()
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    # latency is labelled by route template, not by camera id
+    assert ('homecam_http_request_duration_seconds_count{method="GET",'
+            'route="/api/cameras/{cam_id}/recordings/{date}"}') in text
+    assert 'homecam_ffmpeg_processes{role="grid"} 1' in text
+    assert 'homecam_ffmpeg_rss_bytes{camera="cam-m",role="grid"}' in text
+    assert 'homecam_ffmpeg_cpu_seconds_total{camera="cam-m",role="grid"}' in text
+    assert text.count("# TYPE homecam_ffmpeg_processes ") == 1
+
+    before = metrics.LEASE_OPS.value(role="high", op="renew_unknown")
+    mgr.renew_lease(cam_id, "high", "nope")
+    assert metrics.LEASE_OPS.value(role="high", op="renew_unknown") == before + 1
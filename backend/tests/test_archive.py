@@ -0,0 +1,125 @@
+import importlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, recordings, export, thumbnails, archive, retention, main
+    for module in (config, db, models, recordings, export, thumbnails, archive, retention, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def test_archive_moves_aged_segments_to_cold_tier_transparently(rec_client, write_segment, monkeypatch):
+    from backend.app import archive, config, db, export, models, recordings, retention, thumbnails
+
+    client, rec_dir = rec_client
+    old, new = "2024-04-09_10-00-00.mp4", "2024-04-13_10-00-00.mp4"
+    for n in (old, new):
+        write_segment(rec_dir, n, 1000, age=3600)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text(f"{old},0.0,300.0\n{new},0.0,300.0\n")
+    recordings.segment_index.poll_segment_lists()
+    sprite, vtt = thumbnails.asset_paths(rec_dir / "cam1/2024-04-09/10" / old)
+    sprite.parent.mkdir()
+    sprite.write_bytes(b"jpg")
+    vtt.write_text("WEBVTT\n")
+    with db.SessionLocal() as s:
+        s.query(models.RecordingSegment).update({"thumbs": True})
+        s.commit()
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+
+    # the encode is paused while the machine is busy and resumed once it calms down
+    loads = [0.0, 1.0, 1.0, 0.1]
+    workers = archive.ArchiveWorkers(load=lambda exclude=None: loads.pop(0) if loads else 0.0)
+    monkeypatch.setattr(archive, "LOAD_CHECK_SEC", 0.05)
+    monkeypatch.setattr(archive, "archive_cmd", lambda src, out: ["sh", "-c", f"sleep 0.3; head -c 100 /dev/zero > '{out}'"])
+    now = recordings.parse_start(new) + 3600
+    assert workers.run_batch(now=now) == 1
+    assert not loads
+
+    hot, cold = rec_dir / "cam1/2024-04-09/10" / old, config.COLD_DIR / "cam1/2024-04-09/10" / old
+    assert not hot.exists() and cold.stat().st_size == 100
+    assert (rec_dir / "cam1/2024-04-13/10" / new).exists()
+
+    items = client.get(f"/api/cameras/{cam_id}/recordings/2024-04-09").json()
+    assert [(it["cold"], it["size_bytes"]) for it in items] == [(True, 100)]
+    assert client.get(items[0]["path"]).content == b"\0" * 100
+    at = recordings.parse_start(old) + 10
+    assert client.get(f"/api/cameras/{cam_id}/timeline/lookup", params={"at": at}).json()["segment"]["cold"] is True
+    assert export.plan_pieces("cam1", at, at + 5)[0]["path"] == str(cold)
+    # the thumbnails went along and are served from there
+    assert not sprite.exists() and thumbnails.asset_paths(cold)[0].read_bytes() == b"jpg"
+    assert client.get(items[0]["path"] + "/thumbnails.vtt").text == "WEBVTT\n"
+    # a hot hour holding another segment's sprites is not pruned as empty
+    other = rec_dir / "cam1/2024-04-09/11"
+    (other / thumbnails.THUMB_DIR).mkdir(parents=True)
+    (other / thumbnails.THUMB_DIR / "x.jpg").write_bytes(b"jpg")
+    retention._prune_dirs(other, now)
+    assert other.exists()
+    (other / thumbnails.THUMB_DIR / "x.jpg").unlink()
+    retention._prune_dirs(other, now)
+    assert not other.exists()
+
+    # a busy machine starts nothing
+    assert archive.ArchiveWorkers(load=lambda exclude=None: 5.0).run_batch(now=now + 30 * 86400) == 0
+
+
+def test_archive_load_leaves_out_its_own_encode(monkeypatch):
+    from backend.app import archive
+
+    monkeypatch.setattr(archive, "load_per_cpu", lambda: -1.0)
+    stat = iter([(100, 0, 0, 900), (400, 0, 0, 1000), (700, 0, 0, 1100)])
+    ticks = iter([250, 500])
+    monkeypatch.setattr(archive, "open", lambda *a: io.StringIO("cpu  %d %d %d %d 0 0 0 0 0 0\n" % next(stat)), raising=False)
+    monkeypatch.setattr(archive, "_cpu_ticks", lambda pid: next(ticks))
+    load = archive.CpuLoad()
+    assert load(exclude=None) == -1.0  # first sample: nothing to compare yet
+    # 300 of 400 ticks busy, 250 of them the encode itself (started since the last sample)
+    assert load(exclude=42) == pytest.approx(50 / 400)
+    assert load(exclude=42) == pytest.approx(50 / 400)
+
+    cmd = archive.archive_cmd(Path("in.mp4"), Path("out.mp4"))
+    assert "pools=1:frame-threads=1" in cmd[cmd.index("-x265-params") + 1]
+    assert cmd.count("-threads") == 2
+
+
+def test_worker_loop_survives_a_failed_batch():
+    import sqlite3
+    from backend.app import archive
+
+    class Stop(Exception):
+        pass
+
+    batches = [sqlite3.OperationalError("database is locked"), 1, 0]
+    slept = []
+
+    def sleep(sec):
+        slept.append(sec)
+        if not batches:
+            raise Stop
+
+    workers = archive.ArchiveWorkers(sleep=sleep)
+
+    def run_batch():
+        result = batches.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    workers.run_batch = run_batch
+    with pytest.raises(Stop):
+        workers.run()
+    assert not batches and slept == [archive.IDLE_SEC] * 2
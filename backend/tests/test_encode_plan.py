@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app.encode_plan import plan_encode
+from backend.app.ffprobe_utils import _gop_from_frames
+
+H264 = {"codec": "h264", "fps": 25, "gop": 50, "audio_codec": "aac"}
+
+
+def test_copy_when_compatible_and_unscaled():
+    plan = plan_encode("high", H264, crf=20)
+    assert plan["copy_video"] and plan["copy_audio"]
+    assert plan["video"] == ["-c:v", "copy"]
+    assert plan["audio"] == ["-c:a", "copy"]
+
+
+def test_transcode_when_scaling():
+    plan = plan_encode("grid", H264, crf=26, scale_w=640, scale_h=360)
+    assert not plan["copy_video"]
+    assert plan["video"][:2] == ["-vf", "scale=640:360"]
+    assert plan["audio"] == ["-an"]
+
+
+def test_hls_needs_short_known_gop():
+    assert not plan_encode("medium", {**H264, "gop": 250}, crf=26)["copy_video"]
+    assert not plan_encode("medium", {**H264, "gop": None}, crf=26)["copy_video"]
+    # recordings don't care about the GOP
+    assert plan_encode("recording", {**H264, "gop": None}, crf=20)["copy_video"]
+
+
+def test_codec_and_audio_conversion():
+    hevc = {**H264, "codec": "hevc", "audio_codec": "pcm_mulaw"}
+    hls = plan_encode("high", hevc, crf=20)
+    assert not hls["copy_video"] and not hls["copy_audio"]
+    assert "aac" in hls["audio"]
+    rec = plan_encode("recording", hevc, crf=20)
+    assert rec["copy_video"] and not rec["copy_audio"]
+    # nothing probed -> always transcode
+    assert not plan_encode("recording", None, crf=20)["copy_video"]
+
+
+def test_gop_from_frames():
+    frames = [{"stream_index": 0, "key_frame": int(i % 30 == 0)} for i in range(95)]
+    frames += [{"stream_index": 1, "key_frame": 1}] * 10  # audio frames are ignored
+    assert _gop_from_frames(frames, 0) == 30
+    assert _gop_from_frames(frames[:20], 0) is None
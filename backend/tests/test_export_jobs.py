@@ -0,0 +1,102 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app import export_jobs  # noqa: E402
+from backend.app.export_jobs import ExportQueue, parse_progress  # noqa: E402
+
+_popen = subprocess.Popen
+
+
+class _Plan:
+    def __init__(self, steps, out_path, duration=10.0):
+        self.steps = steps
+        self.out_path = out_path
+        self.duration = duration
+        self.cleaned = False
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def test_parse_progress():
+    assert parse_progress("out_time_us=2500000\n") == 2.5
+    assert parse_progress("out_time_ms=1000000") == 1.0
+    assert parse_progress("frame=12") is None
+    assert parse_progress("out_time_us=N/A") is None
+
+
+def test_job_reports_progress_and_is_reaped(tmp_path, monkeypatch):
+    out = tmp_path / "out.mp4"
+    script = "echo out_time_us=5000000; echo progress=continue; touch \"$0\""
+
+    def fake_popen(cmd, **kwargs):
+        # cmd: ffmpeg -nostats -progress pipe:1 ... <out>
+        return _popen(["sh", "-c", script, cmd[-1]], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    monkeypatch.setattr(export_jobs.subprocess, "Popen", fake_popen)
+    q = ExportQueue(workers=1)
+    plan = _Plan([["ffmpeg", str(out)], ["ffmpeg", str(out)]], out)
+    job = q.submit(plan)
+    assert job.wait(5)
+    assert job.status == "done" and job.progress == 1.0 and plan.cleaned
+    assert job.to_dict()["path"] == f"/api/export/jobs/{job.id}/download"
+
+    q.reap(now=time.time() + export_jobs.settings.EXPORT_TTL_SEC + 1)
+    assert q.get(job.id) is None and not out.exists()
+
+
+def test_cancel_running_and_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        export_jobs.subprocess, "Popen",
+        lambda cmd, **kw: _popen(["sleep", "30"], stdout=subprocess.PIPE, stderr=subprocess.PIPE),
+    )
+    q = ExportQueue(workers=1)
+    running = q.submit(_Plan([["ffmpeg", "x"]], tmp_path / "a.mp4"))
+    queued = q.submit(_Plan([["ffmpeg", "x"]], tmp_path / "b.mp4"))
+    deadline = time.time() + 5
+    while running.status != "running" and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert q.cancel(queued.id).status == "cancelled"
+    q.cancel(running.id)
+    assert running.wait(5) and running.status == "cancelled"
+
+
+def test_streamed_downloads_share_the_export_slots(tmp_path, monkeypatch):
+    def fake_popen(cmd, **kw):
+        script = "printf fmp4" if cmd[-1] == "pipe:1" else "exec sleep 30"
+        return _popen(["sh", "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    monkeypatch.setattr(export_jobs.subprocess, "Popen", fake_popen)
+    q = ExportQueue(workers=1)
+    monkeypatch.setattr(export_jobs, "export_queue", q)
+    plan = _Plan([["ffmpeg", "x"]], tmp_path / "a.mp4")
+    plan.stream_cmd = ["ffmpeg", "pipe:1"]
+
+    stream = export_jobs.stream_clip(plan)
+    assert next(stream) == b"fmp4"
+    busy = _Plan([["ffmpeg", "x"]], tmp_path / "b.mp4")
+    busy.stream_cmd = plan.stream_cmd
+    try:
+        export_jobs.stream_clip(busy)
+        assert False, "a second stream must not start"
+    except export_jobs.ExportBusy:
+        assert busy.cleaned
+    # a queued job waits for the slot too
+    job = q.submit(_Plan([["ffmpeg", "x"]], tmp_path / "c.mp4"))
+    time.sleep(0.2)
+    assert job.status == "queued"
+
+    stream.close()  # client went away: ffmpeg killed, slot freed
+    assert plan.cleaned
+    deadline = time.time() + 5
+    while job.status == "queued" and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.status == "running"
+    q.cancel(job.id)
+    assert job.wait(5)
@@ -115,3 +115,172 @@ def test_no_restart_when_config_says_stop(monkeypatch):
         raise AssertionError("process restarted despite disabled config")
 
     mgr.stop_camera(cam_id, cam_name)
+
+
+def test_backoff_doubles_with_jitter_and_caps(monkeypatch):
+    from app.config import settings
+    from app.supervisor import backoff_delay
+
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MIN_SEC", 1.0)
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MAX_SEC", 8.0)
+    assert backoff_delay(0) == 0.0
+    for failures, base in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (10, 8.0)]:
+        delays = [backoff_delay(failures) for _ in range(50)]
+        assert all(base / 2 <= d <= base for d in delays)
+        assert len(set(delays)) > 1
+
+
+def test_crash_loop_backs_off_and_is_reported(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MIN_SEC", 0.02)
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MAX_SEC", 0.1)
+    monkeypatch.setattr(settings, "RESTART_CRASHLOOP_COUNT", 3)
+    mgr = FFmpegManager()
+    spawned = []
+
+    def fake_start_hls_proc(cam_name, role, src, crf, scale_w, scale_h):
+        spawned.append(time.monotonic())
+        return subprocess.Popen(['sh', '-c', 'exit 1'])  # camera unreachable
+
+    mgr._start_hls_proc = fake_start_hls_proc
+    mgr.start_role(cam_id=7, cam_name='cam7', role='grid', src='src', crf=23)
+
+    for _ in range(100):
+        time.sleep(0.05)
+        status = mgr.status(7)
+        if status["restarts"].get("grid", {}).get("failures", 0) >= 4:
+            break
+    else:
+        raise AssertionError("crash loop was not reported")
+    assert status["crash_looping"] == ["grid"]
+    assert status["restarts"]["grid"]["last_rc"] == 1
+    gaps = [b - a for a, b in zip(spawned, spawned[1:])]
+    assert gaps[0] >= 0.01 and gaps[2] > gaps[0]  # 0.01-0.02s, then 0.04-0.08s
+
+    mgr.stop_role(7, 'cam7', 'grid')
+    time.sleep(0.3)
+    n = len(spawned)
+    time.sleep(0.3)
+    assert len(spawned) == n
+    assert mgr.status(7)["crash_looping"] == [] and not mgr.status(7)["roles"].get("grid")
+    mgr.stop_camera(7, 'cam7')
+
+
+PROGRESS_BLOCK = (
+    "frame=50\nfps=25.00\nstream_0_0_q=28.0\nbitrate= 512.3kbits/s\ntotal_size=131072\n"
+    "out_time_us=2000000\nout_time_ms=2000000\nout_time=00:00:02.000000\n"
+    "dup_frames=1\ndrop_frames=3\nspeed=1.01x\nprogress=continue\n"
+)
+
+
+def test_progress_blocks_are_parsed_across_reads():
+    from app.progress import RoleProgress
+
+    prog = RoleProgress(now=100.0)
+    assert prog.as_dict(now=100.0)["fps"] is None
+    data = PROGRESS_BLOCK.encode()
+    prog.feed(data[:37], now=101.0)
+    assert prog.updated is None  # half a block changes nothing
+    prog.feed(data[37:], now=101.0)
+    info = prog.as_dict(now=102.0)
+    assert info["fps"] == 25.0 and info["speed"] == 1.01 and info["bitrate_kbps"] == 512.3
+    assert (info["frame"], info["drop_frames"], info["dup_frames"]) == (50, 3, 1)
+    assert info["out_time"] == 2.0 and info["total_size"] == 131072
+    assert prog.advanced_at == 101.0
+
+    # alive but stuck: blocks keep coming, the position does not move
+    prog.feed(b"frame=50\nfps=0.0\nout_time_us=2000000\nspeed=N/A\nbitrate=N/A\nprogress=continue\n", now=140.0)
+    assert prog.advanced_at == 101.0 and prog.stalled_for(now=141.0) == 40.0
+    assert prog.as_dict(now=141.0)["speed"] is None
+
+
+def test_stalled_role_is_killed_and_restarted(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "STALL_TIMEOUT_SEC", 0.6)
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MIN_SEC", 0.02)
+    mgr = FFmpegManager()
+    script = f"printf '{PROGRESS_BLOCK}'; sleep 60"
+
+    def fake_start_hls_proc(cam_name, role, src, crf, scale_w, scale_h):
+        return subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE)
+
+    mgr._start_hls_proc = fake_start_hls_proc
+    mgr.start_role(cam_id=9, cam_name='cam9', role='grid', src='src', crf=23)
+    with mgr._lock:
+        proc1 = mgr._procs[9]['grid']
+
+    for _ in range(20):
+        time.sleep(0.05)
+        info = mgr.status(9)["progress"].get("grid")
+        if info and info["fps"] is not None:
+            break
+    else:
+        raise AssertionError("progress was not reported")
+    assert info["fps"] == 25.0 and info["drop_frames"] == 3
+    assert "last_segment_at" in info
+
+    for _ in range(60):
+        time.sleep(0.05)
+        with mgr._lock:
+            proc2 = mgr._procs[9]['grid']
+        if proc2 is not proc1 and _alive(proc2):
+            break
+    else:
+        raise AssertionError("stalled process was not restarted")
+    assert proc1.returncode == -9
+    assert mgr.status(9)["restarts"]["grid"]["stalls"] >= 1
+    mgr.stop_camera(9, 'cam9')
+
+
+def test_stalled_relay_is_torn_down_with_its_roles(monkeypatch, tmp_path):
+    from app.config import settings
+    from app.relay import IngestRelay
+
+    class SilentRelay(IngestRelay):
+        """An RTSP session that connected and then never sent a byte."""
+        def _build_cmd(self):
+            return ["sleep", "60"]
+
+    monkeypatch.setattr(settings, "STALL_TIMEOUT_SEC", 0.6)
+    monkeypatch.setattr(settings, "RESTART_BACKOFF_MIN_SEC", 0.02)
+    mgr = FFmpegManager()
+    relay = SilentRelay("cam8", "rtsp://cam8", tmp_path / "relay.log", rtsp_timeout=5)
+    cmd = IngestRelay._build_cmd(relay)
+    assert cmd[cmd.index("-timeout") + 1] == "5000000" and cmd.index("-timeout") < cmd.index("-i")
+    relay.start()
+    with mgr._lock:
+        mgr._relays["rtsp://cam8"] = relay
+
+    def fake_start_hls_proc(cam_name, role, src, crf, scale_w, scale_h):
+        proc = subprocess.Popen(["sh", "-c", f"printf '{PROGRESS_BLOCK}'; exec cat > /dev/null"],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        relay.attach(proc)
+        return proc
+
+    mgr._start_hls_proc = fake_start_hls_proc
+    mgr.start_role(cam_id=8, cam_name="cam8", role="grid", src="rtsp://cam8", crf=23)
+    for _ in range(60):
+        time.sleep(0.05)
+        if not relay.alive:
+            break
+    else:
+        raise AssertionError("silent relay was not stopped")
+    with mgr._lock:
+        assert "rtsp://cam8" not in mgr._relays  # the restarted role gets a fresh session
+    mgr.stop_camera(8, "cam8")
+
+
+def test_recording_restart_in_the_same_second_gets_a_new_name(monkeypatch):
+    from app.recordings import parse_start
+
+    mgr = FFmpegManager()
+    tails = []
+    monkeypatch.setattr(mgr, "_ensure_rec_date_hour", lambda cam_name: None)
+    monkeypatch.setattr(mgr, "_spawn_from_source", lambda tail, *a, **k: tails.append(tail))
+    mgr._start_recording_proc("cam1", "src", 23)
+    mgr._start_recording_proc("cam1", "src", 23)
+    first, second = (t[-1] for t in tails)
+    assert first != second and first.endswith("_%H-%M-%S_001.mp4") and second.endswith("_002.mp4")
+    assert parse_start("2024-04-06_10-00-00_002.mp4") == parse_start("2024-04-06_10-00-00.mp4")
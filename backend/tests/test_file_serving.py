@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app.file_serving import parse_range, serve_file
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+
+
+def _client(tmp_path, cacheable=True):
+    path = tmp_path / "seg.mp4"
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.get("/f")
+    def f(request: Request):
+        return serve_file(request, path, cacheable=cacheable)
+
+    return TestClient(app)
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == [(0, 99)]
+    assert parse_range("bytes=-100", 1000) == [(900, 999)]
+    assert parse_range("bytes=990-2000", 1000) == [(990, 999)]
+    assert parse_range("bytes=0-9, 5-20, 100-", 1000) == [(0, 20), (100, 999)]
+    assert parse_range("bytes=2000-", 1000) == []
+    assert parse_range("items=0-1", 1000) is None
+    assert parse_range("bytes=9-1", 1000) is None
+
+
+def test_ranges_and_multipart(tmp_path):
+    client = _client(tmp_path)
+    full = client.get("/f")
+    assert full.status_code == 200 and full.content == DATA
+    assert full.headers["etag"] and full.headers["last-modified"]
+
+    r = client.get("/f", headers={"Range": "bytes=-16"})
+    assert r.status_code == 206 and r.content == DATA[-16:]
+    assert r.headers["content-range"] == f"bytes {len(DATA) - 16}-{len(DATA) - 1}/{len(DATA)}"
+
+    r = client.get("/f", headers={"Range": "bytes=0-3,100-103"})
+    assert r.status_code == 206
+    assert r.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(r.headers["content-length"]) == len(r.content)
+    assert b"Content-Range: bytes 0-3/10240\r\n\r\n" + DATA[0:4] in r.content
+    assert b"Content-Range: bytes 100-103/10240\r\n\r\n" + DATA[100:104] in r.content
+
+    r = client.get("/f", headers={"Range": "bytes=20000-"})
+    assert r.status_code == 416 and r.headers["content-range"] == "bytes */10240"
+
+
+def test_conditional_requests(tmp_path):
+    client = _client(tmp_path)
+    first = client.get("/f")
+    etag, modified = first.headers["etag"], first.headers["last-modified"]
+
+    assert client.get("/f", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/f", headers={"If-Modified-Since": modified}).status_code == 304
+
+    r = client.get("/f", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert r.status_code == 206 and r.content == DATA[:10]
+    r = client.get("/f", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert r.status_code == 200 and r.content == DATA
+
+
+def test_growing_file_has_no_validators(tmp_path):
+    client = _client(tmp_path, cacheable=False)
+    r = client.get("/f", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206 and r.content == DATA[10:20]
+    assert r.headers["cache-control"] == "no-store"
+    assert "etag" not in r.headers
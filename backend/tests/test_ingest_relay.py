@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app.relay import IngestRelay, CHUNK_SIZE
+
+
+class FakeRelay(IngestRelay):
+    """Relay whose 'camera' is a fixed number of zero bytes on stdout."""
+    def __init__(self, *args, payload: int, delay: float = 0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._payload = payload
+        self._delay = delay
+
+    def _build_cmd(self):
+        return ["sh", "-c", f"sleep {self._delay}; head -c {self._payload} /dev/zero"]
+
+
+class PacedRelay(IngestRelay):
+    """Relay whose 'camera' sends a file one chunk every 10 ms, like a live source."""
+    def __init__(self, *args, source: Path, chunks: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._source = source
+        self._chunks = chunks
+
+    def _build_cmd(self):
+        loop = (f"for i in $(seq 0 {self._chunks - 1}); do "
+                f"dd if='{self._source}' bs={CHUNK_SIZE} skip=$i count=1 2>/dev/null; sleep 0.01; done")
+        return ["sh", "-c", f"sleep 0.3; {loop}"]
+
+
+def _consumer():
+    return subprocess.Popen(["wc", "-c"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+def test_fan_out_to_all_subscribers(tmp_path):
+    payload = CHUNK_SIZE * 3
+    relay = FakeRelay("cam1", "rtsp://cam1", tmp_path / "relay.log", payload=payload)
+    relay.start()
+    a, b = _consumer(), _consumer()
+    assert relay.attach(a)
+    assert relay.attach(b)
+
+    # source EOF propagates to every subscriber
+    # (communicate() would close stdin; read stdout directly instead)
+    assert int(a.stdout.read()) == payload
+    assert int(b.stdout.read()) == payload
+
+    for _ in range(50):
+        if not relay.alive:
+            break
+        time.sleep(0.1)
+    assert not relay.alive
+    assert not relay.attach(_consumer())
+
+
+def test_dead_subscriber_is_dropped(tmp_path):
+    relay = FakeRelay("cam1", "rtsp://cam1", tmp_path / "relay.log", payload=CHUNK_SIZE * 4, delay=1)
+    relay.start()
+    dead = subprocess.Popen(["true"], stdin=subprocess.PIPE)
+    dead.wait()
+    live = _consumer()
+    relay.attach(dead)
+    relay.attach(live)
+
+    assert int(live.stdout.read()) == CHUNK_SIZE * 4
+    assert relay.subscriber_count() == 0
+
+
+def test_slow_subscriber_is_detached_not_fed_a_gap(tmp_path):
+    source = tmp_path / "stream.ts"
+    source.write_bytes(os.urandom(CHUNK_SIZE * 40))
+    relay = PacedRelay("cam1", "rtsp://cam1", tmp_path / "relay.log", source=source, chunks=40, max_chunks=2)
+    relay.start()
+    stuck = subprocess.Popen(["sh", "-c", "sleep 2; cat"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    live = _consumer()
+    relay.attach(stuck)
+    relay.attach(live)
+
+    assert int(live.stdout.read()) == CHUNK_SIZE * 40
+    assert relay.detached_slow() == 1
+    # the slow consumer got a clean prefix of the stream and then EOF, never a hole
+    got = stuck.stdout.read()
+    assert 0 < len(got) < CHUNK_SIZE * 40 and source.read_bytes().startswith(got)
@@ -5,6 +5,7 @@ from fastapi.testclient import TestClient
 sys.path.append('backend')
 from app.lease_static import LeaseRenewStaticFiles
 from app.ffmpeg_manager import ffmpeg_manager
+from app.config import settings
 
 
 def test_auto_acquire_and_renew(tmp_path, monkeypatch):
@@ -84,3 +85,63 @@ def test_reacquire_after_expired_lease(tmp_path, monkeypatch):
         (1, "medium", "lease1"),
         (1, "medium", "lease2"),
     ]
+
+
+def test_leases_are_per_viewer(tmp_path, monkeypatch):
+    media_root = tmp_path / "media"
+    live_dir = media_root / "live" / "cam1" / "high"
+    live_dir.mkdir(parents=True)
+    (live_dir / "index.m3u8").write_text("dummy")
+
+    ffmpeg_manager._cam_names[1] = "cam1"  # type: ignore[attr-defined]
+
+    acquired = []
+
+    def fake_acquire(cam_id, role):
+        acquired.append((cam_id, role))
+        return f"lease{len(acquired)}"
+
+    monkeypatch.setattr(ffmpeg_manager, "acquire_lease", fake_acquire)
+    monkeypatch.setattr(ffmpeg_manager, "renew_lease", lambda *a: True)
+
+    app = FastAPI()
+    app.mount("/media", LeaseRenewStaticFiles(directory=str(media_root)), name="media")
+
+    client = TestClient(app)
+    client.get("/media/live/cam1/high/index.m3u8?session=a")
+    client.get("/media/live/cam1/high/index.m3u8?session=b")
+    client.get("/media/live/cam1/high/index.m3u8?session=a")
+    assert acquired == [(1, "high"), (1, "high")]
+
+
+def test_rotating_session_ids_share_one_lease_past_the_cap(tmp_path, monkeypatch):
+    media_root = tmp_path / "media"
+    live_dir = media_root / "live" / "cam1" / "high"
+    live_dir.mkdir(parents=True)
+    (live_dir / "index.m3u8").write_text("dummy")
+
+    ffmpeg_manager._cam_names[1] = "cam1"  # type: ignore[attr-defined]
+
+    acquired = []
+    renewed = []
+
+    def fake_acquire(cam_id, role):
+        acquired.append((cam_id, role))
+        return f"lease{len(acquired)}"
+
+    monkeypatch.setattr(ffmpeg_manager, "acquire_lease", fake_acquire)
+    monkeypatch.setattr(ffmpeg_manager, "renew_lease", lambda c, r, lid: renewed.append(lid) or True)
+    monkeypatch.setattr(settings, "LEASE_SESSIONS_PER_CLIENT", 3)
+
+    app = FastAPI()
+    app.mount("/media", LeaseRenewStaticFiles(directory=str(media_root)), name="media")
+
+    client = TestClient(app)
+    for session in "abcdefgh":
+        client.get(f"/media/live/cam1/high/index.m3u8?session={session}")
+    # three sessions of their own, then one lease shared by the rest
+    assert len(acquired) == 4
+
+    client.get("/media/live/cam1/high/index.m3u8?session=b")
+    assert len(acquired) == 4
+    assert renewed[-1] == "lease2"
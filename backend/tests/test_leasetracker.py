@@ -1,10 +1,12 @@
 import sys
+import threading
+import time
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[2]
 sys.path.append(str(ROOT))
 
-from backend.app.ffmpeg_manager import LeaseTracker
+from backend.app.ffmpeg_manager import CamNameIndex, LeaseTracker
 
 def test_mark_activity_resets_idle():
     lt = LeaseTracker()
@@ -15,3 +17,49 @@ def test_mark_activity_resets_idle():
     assert lt.idle_for(cam_id, role) >= 0
     lt.mark_activity(cam_id, role)
     assert lt.idle_for(cam_id, role) == 0
+
+
+def test_expired_lease_schedules_idle_stop(monkeypatch):
+    lt = LeaseTracker(idle_timeout=0.05)
+    monkeypatch.setattr(lt, "_ttl", 0.05)
+    fired = []
+    threading.Thread(target=lt.run, args=(lambda c, r: fired.append((c, r)),), daemon=True).start()
+
+    lid = lt.acquire(1, "high")
+    other = lt.acquire(1, "high")
+    lt.release(1, "high", other)
+    deadline = time.time() + 0.2
+    while time.time() < deadline:  # keep one viewer alive past the ttl
+        assert lt.renew(1, "high", lid)
+        time.sleep(0.01)
+    assert fired == []
+
+    time.sleep(0.3)  # lease expires, then the idle timeout elapses
+    assert fired == [(1, "high")]
+    assert not lt.renew(1, "high", lid)
+    assert lt.count(1, "high") == 0
+
+
+def test_cam_name_index():
+    idx = CamNameIndex()
+    idx[1] = "front"
+    idx[2] = "back"
+    idx[1] = "porch"
+    assert idx.id_for("porch") == 1 and idx.id_for("front") is None
+    idx.pop(2, None)
+    assert idx.id_for("back") is None and dict(idx) == {1: "porch"}
+
+
+def test_cam_name_index_pop_and_rename_keep_the_reverse_index_in_step():
+    idx = CamNameIndex()
+    idx[1] = "front"
+    idx[2] = "front"  # a second camera takes the name over
+    assert idx.id_for("front") == 2
+    assert idx.pop(1) == "front"
+    assert idx.id_for("front") == 2  # not the entry popped
+    assert idx.pop(3, None) is None and idx.pop(3, "front") == "front"
+    assert idx.id_for("front") == 2  # a default is not a name to drop
+    idx[2] = "garage"
+    assert idx.id_for("front") is None and idx.id_for("garage") == 2
+    del idx[2]
+    assert idx.id_for("garage") is None and dict(idx) == {}
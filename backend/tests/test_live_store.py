@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app import live_store as ls
+from backend.app.config import settings
+from backend.app.lease_static import LeaseRenewStaticFiles
+
+
+def test_ring_evicts_oldest_media_but_keeps_playlists():
+    store = ls.LiveSegmentStore(role_max_bytes=250)
+    store.put("cam1/grid/init.mp4", b"i" * 50)
+    store.put("cam1/grid/index.m3u8", b"p" * 10)
+    for n in range(4):
+        store.put(f"cam1/grid/segment_{n}.ts", b"s" * 80)
+
+    assert store.get("cam1/grid/segment_0.ts") is None
+    assert store.get("cam1/grid/segment_1.ts") is None
+    assert store.get("cam1/grid/segment_3.ts")[0] == b"s" * 80
+    assert store.get("cam1/grid/init.mp4") is not None
+    assert store.get("cam1/grid/index.m3u8") is not None
+    assert store.usage()["cam1/grid"] == 50 + 10 + 2 * 80
+    assert store.newest("cam1/grid", ".ts") == "segment_3.ts"
+
+    store.delete("cam1/grid/segment_2.ts")
+    assert store.usage()["cam1/grid"] == 50 + 10 + 80
+    store.clear("cam1")
+    assert store.get("cam1/grid/index.m3u8") is None
+
+
+def _client(tmp_path):
+    app = FastAPI()
+    app.mount("/media", LeaseRenewStaticFiles(directory=str(tmp_path), check_dir=False), name="media")
+    return TestClient(app)
+
+
+def test_memory_mode_serves_from_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_STORE", "memory")
+    monkeypatch.setattr(ls, "live_store", ls.LiveSegmentStore(1024 * 1024))
+    ls.live_store.put("cam1/grid/index.m3u8", b"#EXTM3U\n")
+    ls.live_store.put("cam1/grid/segment_000001.ts", b"x" * 376)
+    client = _client(tmp_path)
+
+    resp = client.get("/media/live/cam1/grid/index.m3u8")
+    assert resp.status_code == 200
+    assert resp.content == b"#EXTM3U\n"
+    assert resp.headers["cache-control"] == "no-cache"
+    assert resp.headers["content-type"].startswith("application/vnd.apple.mpegurl")
+
+    resp = client.get("/media/live/cam1/grid/segment_000001.ts")
+    assert resp.status_code == 200
+    assert len(resp.content) == 376
+    assert "immutable" in resp.headers["cache-control"]
+
+    resp = client.head("/media/live/cam1/grid/segment_000001.ts")
+    assert resp.headers["content-length"] == "376"
+    assert client.get("/media/live/cam1/grid/segment_000009.ts").status_code == 404
+
+
+def test_disk_mode_adds_cache_headers(tmp_path):
+    seg = tmp_path / "live" / "cam1" / "grid"
+    seg.mkdir(parents=True)
+    (seg / "index.m3u8").write_text("#EXTM3U\n")
+    (seg / "segment_000001.ts").write_bytes(b"x" * 188)
+    client = _client(tmp_path)
+
+    assert client.get("/media/live/cam1/grid/index.m3u8").headers["cache-control"] == "no-cache"
+    assert "immutable" in client.get("/media/live/cam1/grid/segment_000001.ts").headers["cache-control"]
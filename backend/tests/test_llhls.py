@@ -0,0 +1,98 @@
+import sys
+import threading
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app import llhls
+from backend.app.config import settings
+from backend.app.lease_static import LeaseRenewStaticFiles
+
+
+def _parts_playlist(first: int, last: int) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-TARGETDURATION:1",
+             f"#EXT-X-MEDIA-SEQUENCE:{first}", '#EXT-X-MAP:URI="init.mp4"']
+    for n in range(first, last + 1):
+        lines += ["#EXTINF:0.500000,", llhls.part_name(n)]
+    return "\n".join(lines) + "\n"
+
+
+def _write_parts(role_dir: Path, first: int, last: int):
+    for n in range(first, last + 1):
+        (role_dir / llhls.part_name(n)).write_bytes(bytes([n % 256]) * 10)
+    (role_dir / llhls.PARTS_PLAYLIST).write_text(_parts_playlist(first, last))
+
+
+def test_render_groups_parts_into_segments():
+    st = llhls.PartsState(llhls.parse_parts_playlist(_parts_playlist(2, 13)), per_seg=4)
+    text = llhls.render_playlist(st, 0.5)
+    lines = text.splitlines()
+    # parts 2,3 belong to a segment whose head was deleted -> first full segment is msn 1
+    assert "#EXT-X-MEDIA-SEQUENCE:1" in lines
+    assert "#EXT-X-PART-INF:PART-TARGET=0.500" in lines
+    assert [l for l in lines if l.startswith("seg_")] == ["seg_1.m4s", "seg_2.m4s"]
+    assert "#EXTINF:2.000," in lines
+    # open segment 3 lists its parts, then the preload hint for the next part
+    assert '#EXT-X-PART:DURATION=0.500,URI="part_000013.m4s",INDEPENDENT=YES' in lines
+    assert lines[-1] == '#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part_000014.m4s"'
+    assert st.has(3, 1) and not st.has(3, 2) and not st.has(3)
+
+
+def test_blocking_reload_and_virtual_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LL_HLS_ROLES", "medium")
+    monkeypatch.setattr(settings, "LL_HLS_PART_SEC", 0.5)
+    monkeypatch.setattr(settings, "LL_HLS_PARTS_PER_SEGMENT", 4)
+    role_dir = tmp_path / "live" / "cam1" / "medium"
+    role_dir.mkdir(parents=True)
+    _write_parts(role_dir, 0, 9)
+
+    app = FastAPI()
+    app.mount("/media", LeaseRenewStaticFiles(directory=str(tmp_path)), name="media")
+    client = TestClient(app)
+
+    resp = client.get("/media/live/cam1/medium/index.m3u8")
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == "no-cache"
+    assert "seg_1.m4s" in resp.text and "seg_2.m4s" not in resp.text
+
+    seg = client.get("/media/live/cam1/medium/seg_1.m4s")
+    assert seg.content == b"".join(bytes([n]) * 10 for n in range(4, 8))
+
+    # too far ahead -> 400
+    assert client.get("/media/live/cam1/medium/index.m3u8?_HLS_msn=9").status_code == 400
+
+    # block until segment 2 completes
+    threading.Timer(0.3, _write_parts, args=(role_dir, 0, 11)).start()
+    resp = client.get("/media/live/cam1/medium/index.m3u8?_HLS_msn=2")
+    assert resp.status_code == 200
+    assert "seg_2.m4s" in resp.text
+
+    # preload hint part is held until it exists
+    threading.Timer(0.3, _write_parts, args=(role_dir, 0, 12)).start()
+    resp = client.get("/media/live/cam1/medium/part_000012.m4s")
+    assert resp.status_code == 200
+    assert resp.content == bytes([12]) * 10
+
+
+def test_unknown_roles_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LL_HLS_ROLES", "medium")
+    monkeypatch.setattr(llhls, "MAX_ROLES", 3)
+    llhls._roles.clear()
+    app = FastAPI()
+    app.mount("/media", LeaseRenewStaticFiles(directory=str(tmp_path)), name="media")
+    client = TestClient(app)
+
+    for i in range(20):
+        assert client.get(f"/media/live/nope{i}/medium/index.m3u8").status_code == 404
+    assert not llhls._roles
+
+    for i in range(5):
+        role_dir = tmp_path / "live" / f"cam{i}" / "medium"
+        role_dir.mkdir(parents=True)
+        _write_parts(role_dir, 0, 5)
+        assert client.get(f"/media/live/cam{i}/medium/index.m3u8").status_code == 200
+    assert len(llhls._roles) == 3
@@ -0,0 +1,65 @@
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app.motion_detect import FrameDiffDetector, parse_mask, run_frames  # noqa: E402
+
+W, H = 160, 90
+
+
+def _scene(n, block_at=None, seed=0):
+    """n gray frames of a static noisy scene; from frame block_at on, a bright block walks right."""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(60, 120, size=(H, W), dtype=np.uint8)
+    frames = []
+    for i in range(n):
+        f = base + rng.integers(0, 8, size=(H, W), dtype=np.uint8)  # sensor noise under pixel_delta
+        if block_at is not None and i >= block_at:
+            x = 10 + 6 * (i - block_at)
+            f[30:60, x:x + 20] = 250
+        frames.append(f)
+    return frames
+
+
+def test_motion_starts_and_ends_with_hold():
+    det = FrameDiffDetector(W, H, threshold=0.01, start_frames=2, hold_sec=1.0)
+    events = []
+    frames = _scene(10, block_at=4) + _scene(12, seed=1)[1:]
+    for i, f in enumerate(frames):
+        state = det.feed(f, i * 0.25)
+        if state is not None:
+            events.append((i, state))
+    # frame 4 changes (block appears), frame 5 is the second frame over threshold
+    assert events[0] == (5, True)
+    assert events[-1][1] is False and len(events) == 2
+    assert not det.active
+
+
+def test_noise_alone_never_triggers():
+    det = FrameDiffDetector(W, H)
+    assert all(det.feed(f, i * 0.25) is None for i, f in enumerate(_scene(40)))
+
+
+def test_mask_hides_motion_in_ignored_zone():
+    mask = parse_mask("0,0.3,1,0.4", W, H)  # full-width band over rows 27..63
+    assert mask.shape == (H, W) and not mask[40, 80] and mask[10, 80]
+    det = FrameDiffDetector(W, H, mask=mask)
+    assert all(det.feed(f, i * 0.25) is None for i, f in enumerate(_scene(12, block_at=2)))
+    assert parse_mask("", W, H) is None
+
+
+def test_run_frames_reads_raw_stream():
+    frames = _scene(8, block_at=3)
+    stream = io.BufferedReader(io.BytesIO(b"".join(f.tobytes() for f in frames) + b"\x00" * 100))
+    clock = iter(i * 0.25 for i in range(100))
+    events, started = [], []
+    n = run_frames(stream, FrameDiffDetector(W, H), lambda ts, active: events.append((ts, active)),
+                   clock=lambda: next(clock), on_start=lambda: started.append(len(events)))
+    assert n == 8  # the trailing partial frame is dropped
+    assert events == [(1.0, True)]
+    assert started == [0]
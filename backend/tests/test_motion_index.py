@@ -0,0 +1,63 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, motion_index, main
+    for module in (config, db, models, motion_index, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def test_motion_search_pages_and_hourly_histogram(rec_client):
+    from backend.app import db, models, motion_index
+    from backend.app.motion_detect import store_event
+    from backend.app.onvif_events import store_events
+
+    client, _ = rec_client
+    cam1 = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+    cam2 = client.post("/api/admin/cameras", json={"name": "cam2", "rtsp_url": "rtsp://y"}).json()["id"]
+    h = 1712736000  # an hour boundary
+    store_event(cam1, h + 3000, True)
+    store_event(cam1, h + 4200, False)   # 600 s in the first hour, 600 s in the next
+    onvif = {"camera_id": cam2, "topic": "tns1:RuleEngine/CellMotionDetector/Motion", "source": "Rule=MyMotion"}
+    store_events([{**onvif, "ts": h + 10, "active": True}])
+    store_events([{**onvif, "ts": h + 70, "active": False}, {**onvif, "ts": h + 100, "active": True},
+                  {**onvif, "ts": h + 130, "active": False}])
+
+    hist = client.get("/api/motion/histogram", params={"start": h - 86400, "end": h + 86400}).json()
+    assert hist["bucket_sec"] == 3600
+    by_cam = {c["camera_id"]: c["hours"] for c in hist["cameras"]}
+    assert by_cam[cam1] == [{"ts": h, "events": 1, "seconds": 600.0}, {"ts": h + 3600, "events": 0, "seconds": 600.0}]
+    assert by_cam[cam2] == [{"ts": h, "events": 2, "seconds": 90.0}]
+    only2 = client.get("/api/motion/histogram", params={"start": h, "end": h + 60, "cameras": str(cam2)}).json()
+    assert [c["camera_id"] for c in only2["cameras"]] == [cam2]
+    assert client.get("/api/motion/histogram", params={"start": 0, "end": h}).status_code == 400
+
+    # events that predate the histogram are folded in once
+    with db.SessionLocal() as s:
+        s.query(models.MotionHour).delete()
+        s.commit()
+        motion_index.backfill(s)
+    assert client.get("/api/motion/histogram", params={"start": h - 86400, "end": h + 86400}).json() == hist
+
+    page = client.get(f"/api/cameras/{cam2}/motion", params={"start": h, "end": h + 3600, "limit": 3}).json()
+    assert [e["ts"] for e in page["events"]] == [h + 10, h + 70, h + 100]
+    assert page["events"][0]["active"] and page["events"][0]["source"] == "Rule=MyMotion"
+    rest = client.get(f"/api/cameras/{cam2}/motion",
+                      params={"start": h, "end": h + 3600, "limit": 3, "after": page["next"]}).json()
+    assert [e["ts"] for e in rest["events"]] == [h + 130] and rest["next"] is None
+    assert client.get(f"/api/cameras/{cam2}/motion", params={"after": "nope"}).status_code == 400
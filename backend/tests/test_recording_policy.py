@@ -0,0 +1,199 @@
+import importlib
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, recording_policy, recordings, thumbnails, retention, main
+    for module in (config, db, models, recording_policy, recordings, thumbnails, retention, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def _motion_camera(client, monkeypatch, policy: str, since: float) -> int:
+    """cam1 with the detector as its motion source and the policy in effect since `since`."""
+    from backend.app import db, main, models
+
+    monkeypatch.setattr(main.motion_detector, "watch", lambda cam: None)  # no tap ffmpeg
+    cam_id = client.post("/api/admin/cameras", json={
+        "name": "cam1", "rtsp_url": "rtsp://x", "motion_detect": True, "recording_policy": policy,
+    }).json()["id"]
+    with db.SessionLocal() as s:
+        s.get(models.Camera, cam_id).recording_policy_since = since
+        s.commit()
+    return cam_id
+
+
+def test_policy_loop_runs_a_real_pass(rec_client, write_segment, monkeypatch):
+    from backend.app import config, db, models, recordings, retention
+
+    client, rec_dir = rec_client
+    name = "2024-04-12_09-00-00.mp4"
+    write_segment(rec_dir, name, 1000, age=3600)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text(f"{name},0.0,60.0\n")
+    recordings.segment_index.poll_segment_lists()
+    _motion_camera(client, monkeypatch, "motion_compact", since=recordings.parse_start(name))
+
+    class Stop(BaseException):  # not Exception: the loop must not swallow it
+        pass
+
+    sleeps = []
+
+    def sleep(sec):
+        if sleeps:
+            raise Stop
+        sleeps.append(sec)
+
+    # archived already: the re-encode works on the cold copy
+    cold = config.COLD_DIR / "cam1/2024-04-12/09" / name
+    cold.parent.mkdir(parents=True)
+    os.replace(rec_dir / "cam1/2024-04-12/09" / name, cold)
+    with db.SessionLocal() as s:
+        s.query(models.RecordingSegment).update({"cold": True})
+        s.commit()
+
+    compacted = []
+    monkeypatch.setattr(retention.time, "sleep", sleep)
+    monkeypatch.setattr(retention.policy, "compact", lambda path: compacted.append(path) or 10)
+    failures = []
+    monkeypatch.setattr(retention.logger, "exception", lambda *a, **k: failures.append(a))
+    with pytest.raises(Stop):
+        retention.run_policy_loop()
+    retention.quiet_compactor.join()  # the encode runs on the compactor's thread, not the loop
+    assert not failures and compacted == [cold]
+    with db.SessionLocal() as s:
+        row = s.query(models.RecordingSegment).filter_by(filename=name).one()
+        assert (row.tier, row.size_bytes) == ("compact", 10)
+
+
+def test_motion_policy_drops_and_compacts_quiet_segments(rec_client, write_segment, monkeypatch):
+    from backend.app import db, models, recordings, recording_policy, retention, thumbnails
+
+    client, rec_dir = rec_client
+    names = ["2024-04-12_10-00-00.mp4", "2024-04-12_10-01-00.mp4", "2024-04-12_10-02-00.mp4", "2024-04-12_10-03-00.mp4"]
+    for n in names:
+        write_segment(rec_dir, n, 1000, age=3600)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("".join(f"{n},0.0,60.0\n" for n in names))
+    recordings.segment_index.poll_segment_lists()
+    t0 = recordings.parse_start(names[0])
+    sprite, _ = thumbnails.asset_paths(rec_dir / "cam1/2024-04-12/10" / names[3])
+    sprite.parent.mkdir()
+    sprite.write_bytes(b"jpg")
+
+    cam_id = _motion_camera(client, monkeypatch, "motion_drop", since=t0)
+    assert client.put(f"/api/admin/cameras/{cam_id}", json={"recording_policy": "sometimes"}).status_code == 400
+    assert recording_policy.recording_policy.segment_sec("cam1") == 60
+
+    # motion 10:01:30-10:01:40; with 10 s pre-roll and 30 s post-roll it touches 10:01 and 10:02 only
+    with db.SessionLocal() as s:
+        s.add(models.MotionEvent(camera_id=cam_id, ts=t0 + 90, active=True, topic="t"))
+        s.add(models.MotionEvent(camera_id=cam_id, ts=t0 + 100, active=False, topic="t"))
+        s.commit()
+
+    now = t0 + 240 + 3600  # everything settled, but quiet footage is still within QUIET_RETENTION_HOURS
+    with db.SessionLocal() as s:
+        retention._apply_recording_policies(s, now=now)
+        tiers = {r.filename: r.tier for r in s.query(models.RecordingSegment)}
+    assert tiers == dict(zip(names, ["quiet", "motion", "motion", "quiet"]))
+
+    monkeypatch.setattr(retention.retention_engine, "_sleep", lambda sec: None)
+    with db.SessionLocal() as s:
+        retention._apply_recording_policies(s, now=now + 86400)
+    report = retention.retention_engine.run_pass(now=now + 86400)
+    assert report.evicted == {"cam1": {"quiet": {"segments": 2, "bytes": 2000}}}
+    items = client.get(f"/api/cameras/{cam_id}/recordings/2024-04-12").json()
+    assert [it["path"].rsplit("/", 1)[1] for it in items] == names[1:3]
+    assert not (rec_dir / "cam1/2024-04-12/10" / names[0]).exists()
+    assert not sprite.exists()
+
+    # motion_compact re-encodes what's quiet instead
+    client.put(f"/api/admin/cameras/{cam_id}", json={"recording_policy": "motion_compact"})
+    later = "2024-04-12_10-04-00.mp4"
+    write_segment(rec_dir, later, 1000, age=3600)
+    with open(rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME, "a") as f:
+        f.write(f"{later},0.0,60.0\n")
+    recordings.segment_index.poll_segment_lists()
+    ran = []
+
+    def fake_run(cmd, **kwargs):
+        ran.append(cmd)
+        Path(cmd[-1]).write_bytes(b"y" * 100)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    monkeypatch.setattr(recording_policy.subprocess, "run", fake_run)
+    with db.SessionLocal() as s:
+        retention._apply_recording_policies(s, now=now + 86400)
+    retention.quiet_compactor.join()
+    with db.SessionLocal() as s:
+        row = s.query(models.RecordingSegment).filter_by(filename=later).one()
+        assert (row.tier, row.size_bytes) == ("compact", 100)
+    assert len(ran) == 1 and "32" in ran[0]
+    assert (rec_dir / "cam1/2024-04-12/10" / later).read_bytes() == b"y" * 100
+    assert not list((rec_dir / "cam1/2024-04-12/10").glob(".*.tmp"))
+
+
+def test_motion_policy_only_trusts_a_working_source(rec_client, write_segment, monkeypatch):
+    from backend.app import db, models, recordings, retention
+
+    client, rec_dir = rec_client
+    # without a motion source every segment would look quiet
+    resp = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x", "recording_policy": "motion_drop"})
+    assert resp.status_code == 400
+    names = ["2024-04-12_10-00-00.mp4", "2024-04-12_10-01-00.mp4", "2024-04-12_10-02-00.mp4", "2024-04-12_10-03-00.mp4"]
+    for n in names:
+        write_segment(rec_dir, n, 1000, age=3600)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("".join(f"{n},0.0,60.0\n" for n in names))
+    recordings.segment_index.poll_segment_lists()
+    t0 = recordings.parse_start(names[0])
+
+    # 10:00 was recorded before the policy; the detector was down 10:02:10-10:02:20
+    cam_id = _motion_camera(client, monkeypatch, "motion_drop", since=t0 + 60)
+    assert client.put(f"/api/admin/cameras/{cam_id}", json={"motion_detect": False}).status_code == 400
+    with db.SessionLocal() as s:
+        s.add(models.MotionSourceOutage(camera_id=cam_id, source="detector", start_ts=t0 + 130, end_ts=t0 + 140))
+        s.commit()
+        retention._apply_recording_policies(s, now=t0 + 240 + 3600)
+        tiers = {r.filename: r.tier for r in s.query(models.RecordingSegment)}
+    assert tiers == dict(zip(names, [None, "quiet", "motion", "quiet"]))
+
+    # switching back to continuous and to a motion policy again starts over
+    client.put(f"/api/admin/cameras/{cam_id}", json={"recording_policy": "continuous"})
+    client.put(f"/api/admin/cameras/{cam_id}", json={"recording_policy": "motion_compact"})
+    with db.SessionLocal() as s:
+        assert s.get(models.Camera, cam_id).recording_policy_since > t0 + 3600
+
+
+def test_substream_policy_records_small_stream_until_motion():
+    from backend.app.models import Camera, CameraStream, RoleMode
+    from backend.app.roles import recording_policy, resolve_role
+
+    cam = Camera(id=9001, name="drive", rtsp_url="rtsp://x/main", retention_days=7,
+                 recording_mode=RoleMode.auto, recording_policy="motion_substream")
+    cam.streams = [
+        CameraStream(name="main", rtsp_url="rtsp://x/main", enabled=True, width=2560, height=1440),
+        CameraStream(name="sub", rtsp_url="rtsp://x/sub", enabled=True, width=640, height=360),
+    ]
+    recording_policy.watch(cam)
+    try:
+        assert resolve_role(cam, "recording")[0] == "rtsp://x/sub"
+        recording_policy.note_motion(cam.id, "detector", True)
+        assert resolve_role(cam, "recording")[0] == "rtsp://x/main"
+        recording_policy.note_motion(cam.id, "detector", False)
+        assert resolve_role(cam, "recording")[0] == "rtsp://x/main"  # post-roll
+    finally:
+        recording_policy.unwatch(cam.id)
+    assert resolve_role(cam, "recording")[0] == "rtsp://x/sub"
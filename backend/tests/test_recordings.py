@@ -0,0 +1,368 @@
+import importlib
+import os
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, recordings, export, export_jobs, main
+    for module in (config, db, models, recordings, export, export_jobs, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def test_durations_of_archived_segments_are_measured_in_the_cold_tier(rec_client, monkeypatch):
+    from backend.app import config, db, models, recordings
+
+    client, rec_dir = rec_client
+    name = "2024-04-05_10-00-00.mp4"
+    cold = config.COLD_DIR / "cam1/2024-04-05/10" / name
+    cold.parent.mkdir(parents=True)
+    cold.write_bytes(b"x" * 300)
+    t = time.time() - 3600
+    os.utime(cold, (t, t))
+    with db.SessionLocal() as s:
+        s.add(models.RecordingSegment(camera="cam1", date="2024-04-05", hour="10", filename=name,
+                                      start_ts=recordings.parse_start(name), size_bytes=0, cold=True))
+        s.commit()
+    probed = []
+    monkeypatch.setattr(recordings, "probe_duration", lambda path: probed.append(path) or 42.0)
+    assert recordings.segment_index.measure_pending() == 1
+    assert probed == [str(cold)]
+    with db.SessionLocal() as s:
+        row = s.query(models.RecordingSegment).filter_by(filename=name).one()
+        assert (row.duration, row.size_bytes) == (42.0, 300)
+
+
+def test_in_progress_segment_is_served_with_snapshot_length(rec_client, write_segment):
+    client, rec_dir = rec_client
+    write_segment(rec_dir, "2024-04-06_10-00-00_000.mp4", 1000, age=3600)
+    write_segment(rec_dir, "2024-04-06_11-00-00_000.mp4", 500)
+
+    resp = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"})
+    cam_id = resp.json()["id"]
+    items = client.get(f"/api/cameras/{cam_id}/recordings/2024-04-06").json()
+    assert [it["in_progress"] for it in items] == [False, True]
+
+    resp = client.get(items[1]["path"])
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == "no-store"
+    assert len(resp.content) == 500
+
+    resp = client.get(items[1]["path"], headers={"Range": "bytes=100-"})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == "bytes 100-499/500"
+
+    resp = client.get(items[0]["path"])
+    assert resp.status_code == 200
+    assert "cache-control" not in resp.headers
+
+
+def test_index_tracks_segment_list_and_directory_changes(rec_client, write_segment):
+    from backend.app import recordings
+
+    client, rec_dir = rec_client
+    idx = recordings.segment_index
+    seg = write_segment(rec_dir, "2024-04-07_09-00-00.mp4", 100)
+    assert [(r.filename, r.duration) for r in idx.list_day("cam1", "2024-04-07")] == [
+        ("2024-04-07_09-00-00.mp4", None),
+    ]
+
+    # ffmpeg closes the segment: its list line gives the exact duration and final size
+    seg.write_bytes(b"x" * 300)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("2024-04-07_09-00-00.mp4,0.000000,59.960000\n")
+    idx.poll_segment_lists()
+    (row,) = idx.list_day("cam1", "2024-04-07")
+    assert round(row.duration, 2) == 59.96 and row.size_bytes == 300
+
+    # files that appear or vanish are picked up via the hour directory's mtime
+    write_segment(rec_dir, "2024-04-07_09-01-00.mp4", 50)
+    seg.unlink()
+    names = [r.filename for r in idx.list_day("cam1", "2024-04-07")]
+    assert names == ["2024-04-07_09-01-00.mp4"]
+
+    idx.forget("cam1", "2024-04-07")
+    with recordings.db.SessionLocal() as s:
+        assert s.query(recordings.RecordingSegment).count() == 0
+
+
+def _box(typ: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I", 8 + len(body)) + typ + body
+
+
+def _fmp4(fragment_starts, timescale=90000, entry=None, keyframes=None) -> bytes:
+    """
+    Tiny fMP4: one video track, one moof+mdat per fragment start (seconds).
+    entry=(fourcc, width, height) adds a sample description. With keyframes (the
+    starts that begin on one) the others start mid-GOP, as with frag_duration:
+    trex defaults every sample to non-sync and a trun marks the keyframes.
+    """
+    tkhd = _box(b"tkhd", b"\0\0\0\3", b"\0" * 8, struct.pack(">I", 1), b"\0" * 68)
+    mdhd = _box(b"mdhd", b"\0\0\0\0", b"\0" * 8, struct.pack(">I", timescale), b"\0" * 8)
+    hdlr = _box(b"hdlr", b"\0\0\0\0", b"\0" * 4, b"vide", b"\0" * 13)
+    mdia = [mdhd, hdlr]
+    if entry:
+        fourcc, w, h = entry
+        sample = _box(fourcc.encode(), b"\0" * 24, struct.pack(">HH", w, h), b"\0" * 50)
+        stsd = _box(b"stsd", b"\0\0\0\0", struct.pack(">I", 1), sample)
+        mdia.append(_box(b"minf", _box(b"stbl", stsd)))
+    moov = [_box(b"trak", tkhd, _box(b"mdia", *mdia))]
+    if keyframes is not None:
+        trex = _box(b"trex", b"\0\0\0\0", struct.pack(">5I", 1, 1, 0, 0, 0x01010000))
+        moov.append(_box(b"mvex", trex))
+    out = _box(b"ftyp", b"iso6") + _box(b"moov", *moov)
+    for t in fragment_starts:
+        tfhd = _box(b"tfhd", b"\0\0\0\0", struct.pack(">I", 1))
+        tfdt = _box(b"tfdt", b"\1\0\0\0", struct.pack(">Q", int(t * timescale)))
+        traf = [tfhd, tfdt]
+        if keyframes is not None and t in keyframes:
+            # data_offset + first_sample_flags (sample_depends_on=2: an I-frame)
+            traf.append(_box(b"trun", b"\0\0\0\5", struct.pack(">IiI", 1, 0, 0x02000000)))
+        elif keyframes is not None:
+            traf.append(_box(b"trun", b"\0\0\0\1", struct.pack(">Ii", 1, 0)))
+        out += _box(b"moof", _box(b"traf", *traf)) + _box(b"mdat", b"\0" * 100)
+    return out
+
+
+def test_timeline_coverage_gaps_and_lookup(rec_client, write_segment):
+    from backend.app import recordings
+
+    client, rec_dir = rec_client
+    for name in ("2024-04-08_10-00-00.mp4", "2024-04-08_10-01-00.mp4", "2024-04-08_10-05-00.mp4"):
+        p = write_segment(rec_dir, name, 0, age=3600)
+        p.write_bytes(_fmp4([0, 2, 4]))
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text(
+        "2024-04-08_10-00-00.mp4,0.0,59.5\n"
+        "2024-04-08_10-01-00.mp4,0.0,60.0\n"
+        "2024-04-08_10-05-00.mp4,0.0,30.0\n"
+    )
+    recordings.segment_index.poll_segment_lists()
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+    t0 = time.mktime(time.strptime("2024-04-08 10:00:00", "%Y-%m-%d %H:%M:%S"))
+
+    tl = client.get(f"/api/cameras/{cam_id}/timeline", params={"start": t0 - 60, "end": t0 + 600}).json()
+    # the half-second hole at 10:00:59.5 is within tolerance
+    assert tl["coverage"] == [{"start": t0, "end": t0 + 120}, {"start": t0 + 300, "end": t0 + 330}]
+    assert tl["gaps"] == [
+        {"start": t0 - 60, "end": t0},
+        {"start": t0 + 120, "end": t0 + 300},
+        {"start": t0 + 330, "end": t0 + 600},
+    ]
+
+    hit = client.get(f"/api/cameras/{cam_id}/timeline/lookup", params={"at": t0 + 63}).json()
+    assert hit["segment"]["path"].endswith("/2024-04-08_10-01-00.mp4")
+    assert hit["offset_sec"] == 3
+    assert hit["fragment_offset_sec"] == 2
+    data = _fmp4([0, 2, 4])
+    assert data[hit["byte_offset"] + 4:hit["byte_offset"] + 8] == b"moof"
+    assert hit["byte_offset"] == data.index(b"moof", data.index(b"moof") + 1) - 4
+
+    # 2 s fragments inside a 4 s GOP: the lookup points at the keyframe, not the fragment
+    data = _fmp4([0, 2, 4], keyframes={0, 4})
+    (rec_dir / "cam1/2024-04-08/10/2024-04-08_10-05-00.mp4").write_bytes(data)
+    hit = client.get(f"/api/cameras/{cam_id}/timeline/lookup", params={"at": t0 + 303}).json()
+    assert (hit["fragment_offset_sec"], hit["byte_offset"]) == (0, data.index(b"moof") - 4)
+    assert client.get(f"/api/cameras/{cam_id}/timeline/lookup", params={"at": t0 + 200}).status_code == 404
+    assert client.get(f"/api/cameras/{cam_id}/timeline", params={"start": t0, "end": t0 - 1}).status_code == 400
+
+
+def test_accel_redirect_hands_bytes_to_nginx(rec_client, write_segment, monkeypatch):
+    from backend.app import config
+
+    client, rec_dir = rec_client
+    monkeypatch.setattr(config.settings, "ACCEL_REDIRECT", True)
+    write_segment(rec_dir, "2024-04-09_10-00-00.mp4", 1000, age=3600)
+    (config.CLIP_DIR / "clip one.mp4").write_bytes(b"x" * 10)
+
+    resp = client.get("/api/recordings/cam1/2024-04-09/10/2024-04-09_10-00-00.mp4", headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 200 and resp.content == b""
+    assert resp.headers["x-accel-redirect"] == "/_accel/recordings/cam1/2024-04-09/10/2024-04-09_10-00-00.mp4"
+
+    resp = client.get("/api/saved/clip one.mp4")
+    assert resp.headers["x-accel-redirect"] == "/_accel/clips/clip%20one.mp4"
+    assert client.get("/api/recordings/cam1/2024-04-09/10/missing.mp4").status_code == 404
+
+
+def test_export_spans_segments_with_copy_and_accurate_head(rec_client, write_segment, monkeypatch):
+    from backend.app import export, export_jobs, recordings
+
+    client, rec_dir = rec_client
+    frags = list(range(0, 60, 2))
+    for name in ("2024-04-10_10-00-00.mp4", "2024-04-10_10-01-00.mp4"):
+        write_segment(rec_dir, name, 0, age=3600).write_bytes(_fmp4(frags))
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text(
+        "2024-04-10_10-00-00.mp4,0.0,60.0\n2024-04-10_10-01-00.mp4,0.0,60.0\n"
+    )
+    recordings.segment_index.poll_segment_lists()
+    t0 = time.mktime(time.strptime("2024-04-10 10:00:00", "%Y-%m-%d %H:%M:%S"))
+    seg1 = str(rec_dir / "cam1/2024-04-10/10/2024-04-10_10-00-00.mp4")
+    seg2 = str(rec_dir / "cam1/2024-04-10/10/2024-04-10_10-01-00.mp4")
+
+    plan = export.ExportPlan("cam1", t0 + 30, t0 + 70, Path("/tmp/out.mp4"))
+    try:
+        assert len(plan.steps) == 1 and plan.duration == 40
+        listing = Path(plan.steps[0][plan.steps[0].index("-i") + 1]).read_text()
+        assert listing == (
+            f"ffconcat version 1.0\nfile '{seg1}'\ninpoint 30.000\n"
+            f"file '{seg2}'\noutpoint 10.000\n"
+        )
+    finally:
+        plan.cleanup()
+
+    plan = export.ExportPlan("cam1", t0 + 31, t0 + 70, Path("/tmp/out.mp4"), accurate=True)
+    try:
+        head, body, final = plan.steps
+        assert head[head.index("-ss") + 1] == "31.000" and head[head.index("-t") + 1] == "1.000"
+        assert "libx264" in head
+        assert "inpoint 32.000" in Path(body[body.index("-i") + 1]).read_text()
+        assert final[final.index("-i") + 1].startswith("concat:")
+    finally:
+        plan.cleanup()
+
+    ran = []
+    popen = subprocess.Popen
+
+    def fake_popen(cmd, **kwargs):
+        ran.append(cmd)
+        if cmd[-1] == "pipe:1":
+            return popen(["printf", "fmp4"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        Path(cmd[-1]).write_bytes(b"clip")
+        return popen(["true"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    monkeypatch.setattr(export_jobs.subprocess, "Popen", fake_popen)
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+    resp = client.post(f"/api/cameras/{cam_id}/export", json={"start": t0 + 30, "end": t0 + 70})
+    assert resp.status_code == 200 and resp.content == b"fmp4"
+    assert "frag_keyframe+empty_moov+default_base_moof" in ran[-1] and "-progress" not in ran[-1]
+    resp = client.post(f"/api/cameras/{cam_id}/export", json={"start": t0 + 30, "end": t0 + 70, "stream": False})
+    assert resp.status_code == 200 and resp.content == b"clip"
+    assert ran[-1][1:4] == ["-nostats", "-progress", "pipe:1"]
+
+    job = client.post(f"/api/cameras/{cam_id}/export/jobs", json={"start": t0 + 30, "end": t0 + 70}).json()
+    export_jobs.export_queue.get(job["id"]).wait(5)
+    job = client.get(f"/api/export/jobs/{job['id']}").json()
+    assert job["status"] == "done" and job["progress"] == 1.0
+    resp = client.get(job["path"])
+    assert resp.status_code == 200 and resp.content == b"clip"
+    assert 'filename="clip.mp4"' in resp.headers["content-disposition"]
+    resp = client.post(f"/api/cameras/{cam_id}/export", json={"start": t0 + 500, "end": t0 + 600})
+    assert resp.status_code == 404
+
+
+def test_concat_inpoint_never_lands_before_the_keyframe():
+    from backend.app import export
+
+    # keyframe 370 at 30 fps is 12.3333 s; "12.333" would be the frame before it
+    listing = export.concat_list([{"path": "/a.mp4", "inpoint": 370 / 30, "outpoint": None}])
+    assert "inpoint 12.334\n" in listing
+    assert "inpoint 2.000\n" in export.concat_list([{"path": "/a.mp4", "inpoint": 2.0, "outpoint": None}])
+
+
+def test_accurate_export_head_matches_source_codec(rec_client, write_segment):
+    from backend.app import export, mp4frag, recordings
+
+    client, rec_dir = rec_client
+    seg = write_segment(rec_dir, "2024-04-10_11-00-00.mp4", 0, age=3600)
+    seg.write_bytes(_fmp4(list(range(0, 60, 2)), entry=("hvc1", 2560, 1440)))
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("2024-04-10_11-00-00.mp4,0.0,60.0\n")
+    recordings.segment_index.poll_segment_lists()
+    t0 = time.mktime(time.strptime("2024-04-10 11:00:00", "%Y-%m-%d %H:%M:%S"))
+    assert mp4frag.video_format(str(seg)) == ("hevc", 2560, 1440)
+
+    plan = export.ExportPlan("cam1", t0 + 31, t0 + 50, Path("/tmp/out.mp4"), accurate=True)
+    try:
+        head, _, final = plan.steps
+        assert "libx265" in head and "libx264" not in head
+        assert final[final.index("-tag:v") + 1] == "hev1"  # in-band parameter sets across the join
+    finally:
+        plan.cleanup()
+
+    # a codec we cannot re-encode to: keyframe-aligned copy instead of a broken join
+    seg.write_bytes(_fmp4(list(range(0, 60, 2)), entry=("av01", 1920, 1080)))
+    plan = export.ExportPlan("cam1", t0 + 31, t0 + 50, Path("/tmp/out.mp4"), accurate=True)
+    try:
+        assert len(plan.steps) == 1 and "-c" in plan.steps[0]
+    finally:
+        plan.cleanup()
+
+
+def test_accurate_export_head_runs_to_a_real_keyframe(rec_client, write_segment):
+    from backend.app import export, mp4frag, recordings
+
+    client, rec_dir = rec_client
+    # fragments every 2 s (frag_duration), keyframes every 10 s
+    seg = write_segment(rec_dir, "2024-04-10_13-00-00.mp4", 0, age=3600)
+    data = _fmp4(list(range(0, 60, 2)), keyframes=set(range(0, 60, 10)))
+    seg.write_bytes(data)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("2024-04-10_13-00-00.mp4,0.0,60.0\n")
+    recordings.segment_index.poll_segment_lists()
+    t0 = time.mktime(time.strptime("2024-04-10 13:00:00", "%Y-%m-%d %H:%M:%S"))
+    assert [t for _, t in mp4frag.fragment_table(str(seg))] == [0, 10, 20, 30, 40, 50]
+    assert mp4frag.locate(str(seg), len(data), 37)[1] == 30
+
+    plan = export.ExportPlan("cam1", t0 + 31, t0 + 50, Path("/tmp/out.mp4"), accurate=True)
+    try:
+        head, body, _ = plan.steps
+        # not the mid-GOP fragment at 32 s: the copy would restart from the keyframe at 30
+        assert head[head.index("-t") + 1] == "9.000"
+        assert "inpoint 40.000" in Path(body[body.index("-i") + 1]).read_text()
+    finally:
+        plan.cleanup()
+
+
+def test_export_across_hot_and_cold_tiers_reencodes_the_odd_run(rec_client, write_segment):
+    from backend.app import export, recordings
+
+    client, rec_dir = rec_client
+    frags = list(range(0, 60, 2))
+    formats = {"00": ("hvc1", 1280, 720), "01": ("avc1", 1920, 1080), "02": ("avc1", 1920, 1080)}
+    for minute, entry in formats.items():
+        write_segment(rec_dir, f"2024-04-10_12-{minute}-00.mp4", 0, age=3600).write_bytes(_fmp4(frags, entry=entry))
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text(
+        "".join(f"2024-04-10_12-{m}-00.mp4,0.0,60.0\n" for m in formats))
+    recordings.segment_index.poll_segment_lists()
+    t0 = time.mktime(time.strptime("2024-04-10 12:00:00", "%Y-%m-%d %H:%M:%S"))
+
+    plan = export.ExportPlan("cam1", t0 + 30, t0 + 150, Path("/tmp/out.mp4"))
+    try:
+        assert plan.stream_cmd is None
+        cold, hot, final = plan.steps
+        # the archived (HEVC 720p) minute is brought to the hot footage's format
+        assert "libx264" in cold and cold[cold.index("-vf") + 1] == "scale=1920:1080,setsar=1"
+        assert "2024-04-10_12-00-00.mp4" in Path(cold[cold.index("-i") + 1]).read_text()
+        assert hot[hot.index("-c") + 1] == "copy"
+        assert "2024-04-10_12-01-00.mp4" in Path(hot[hot.index("-i") + 1]).read_text()
+        assert final[final.index("-i") + 1].count("|") == 1 and final[final.index("-tag:v") + 1] == "avc3"
+    finally:
+        plan.cleanup()
+
+    plan = export.ExportPlan("cam1", t0 + 31, t0 + 150, Path("/tmp/out.mp4"), accurate=True)
+    try:
+        head, hot, final = plan.steps
+        # the head is in the odd format anyway: re-encode the rest of that file, exactly
+        assert head[head.index("-ss") + 1] == "31.000" and head[head.index("-t") + 1] == "29.000"
+        assert "-vf" in head and "-vf" not in hot
+    finally:
+        plan.cleanup()
+
+    write_segment(rec_dir, "2024-04-10_12-01-00.mp4", 0, age=3600).write_bytes(_fmp4(frags, entry=("av01", 1920, 1080)))
+    write_segment(rec_dir, "2024-04-10_12-02-00.mp4", 0, age=3600).write_bytes(_fmp4(frags, entry=("av01", 1920, 1080)))
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+    resp = client.post(f"/api/cameras/{cam_id}/export", json={"start": t0 + 30, "end": t0 + 150})
+    assert resp.status_code == 400 and "hevc 1280x720 -> av01 1920x1080" in resp.json()["detail"]
@@ -0,0 +1,93 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, recordings, thumbnails, retention, main
+    for module in (config, db, models, recordings, thumbnails, retention, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def test_retention_expires_by_age_and_evicts_weighted_oldest_for_space(rec_client, monkeypatch):
+    from collections import namedtuple
+    from backend.app import recordings, retention
+
+    client, rec_dir = rec_client
+    cam1 = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x", "retention_days": 7}).json()["id"]
+    client.post("/api/admin/cameras", json={"name": "cam2", "rtsp_url": "rtsp://y", "retention_priority": 2})
+    assert client.put(f"/api/admin/cameras/{cam1}", json={"retention_priority": 0}).status_code == 400
+
+    segs = {
+        "cam1": ["2024-04-10_12-00-00.mp4", "2024-04-19_10-00-00.mp4", "2024-04-19_11-00-00.mp4", "2024-04-20_09-00-00.mp4"],
+        "cam2": ["2024-04-18_14-00-00.mp4", "2024-04-20_08-00-00.mp4"],
+    }
+    for cam, names in segs.items():
+        for n in names:
+            p = rec_dir / cam / n[:10] / n[11:13] / n
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_bytes(b"x" * 1000)
+        (rec_dir / cam / recordings.SEGMENT_LIST_NAME).write_text("".join(f"{n},0.0,600.0\n" for n in names))
+    junk = rec_dir / "cam1" / "2024-04-01" / "05" / "unindexed.mp4"
+    junk.parent.mkdir(parents=True)
+    junk.write_bytes(b"x")
+    recordings.segment_index.poll_segment_lists()
+
+    # 8% free on a 100 kB disk: 2 kB below the 10% watermark
+    Usage = namedtuple("Usage", "total used free")
+    monkeypatch.setattr(retention.retention_engine, "_disk_usage", lambda path: Usage(100000, 92000, 8000))
+    paced = []
+    monkeypatch.setattr(retention.retention_engine, "_sleep", paced.append)
+    monkeypatch.setattr(retention.settings, "RETENTION_HEADROOM_PCT", 0)
+
+    now = recordings.parse_start("2024-04-20_12-00-00.mp4")
+    report = retention.retention_engine.run_pass(now=now)
+
+    # cam2's 04-18 14:00 is the oldest file, but priority 2 halves its age (46 h -> 23 h)
+    left = {cam: sorted(p.name for p in (rec_dir / cam).rglob("*.mp4")) for cam in segs}
+    assert left == {"cam1": ["2024-04-20_09-00-00.mp4"], "cam2": segs["cam2"]}
+    assert not (rec_dir / "cam1" / "2024-04-01").exists()
+    assert not (rec_dir / "cam1" / "2024-04-19").exists()  # emptied hours and day are pruned
+    assert report.evicted == {"cam1": {"age": {"segments": 1, "bytes": 1000}, "space": {"segments": 2, "bytes": 2000}}}
+    assert len(paced) == 3 and report.usage_bytes == 3000
+
+    status = client.get("/api/admin/retention").json()
+    assert status["usage"] == {"cam1": 1000, "cam2": 2000}
+    assert status["last_pass"]["evicted"]["cam1"]["space"] == {"segments": 2, "bytes": 2000}
+    assert status["last_pass"]["free_bytes"] == 8000 and status["last_pass"]["duration_sec"] >= 0
+
+    # the disk is full of something else: everything evictable goes, and the rest is reported
+    monkeypatch.setattr(retention.retention_engine, "_disk_usage", lambda path: Usage(100000, 95000, 5000))
+    report = retention.retention_engine.run_pass(now=now)
+    assert report.evicted == {"cam1": {"space": {"segments": 1, "bytes": 1000}},
+                              "cam2": {"space": {"segments": 2, "bytes": 2000}}}
+    assert report.usage_bytes == 0 and report.shortfall_bytes > 0
+    assert client.get("/api/admin/retention").json()["last_pass"]["shortfall_bytes"] == report.shortfall_bytes
+
+
+def test_eviction_candidates_page_past_segments_sharing_a_start_second(rec_client, write_segment, monkeypatch):
+    from backend.app import db, recordings, retention
+
+    client, rec_dir = rec_client
+    names = ["2024-04-10_10-00-00_001.mp4", "2024-04-10_10-00-00_002.mp4", "2024-04-10_10-05-00_003.mp4"]
+    for n in names:
+        write_segment(rec_dir, n, 100, age=3600)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("".join(f"{n},0.0,300.0\n" for n in names))
+    recordings.segment_index.poll_segment_lists()
+    monkeypatch.setattr(retention, "CANDIDATE_PAGE", 1)
+    with db.SessionLocal() as s:
+        rows = list(retention.retention_engine._oldest(s, "cam1", None))
+    assert [r.filename for r in rows] == names
@@ -0,0 +1,75 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+from backend.app import snapshots  # noqa: E402
+from backend.app.config import settings  # noqa: E402
+
+
+def _playlist(live: Path, *segments: str, name: str = "index.m3u8"):
+    d = live / "cam1" / "grid"
+    d.mkdir(parents=True, exist_ok=True)
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:2"]
+    for seg in segments:
+        lines += ["#EXTINF:2.0,", seg]
+        (d / seg).write_bytes(seg.encode())
+    (d / name).write_text("\n".join(lines) + "\n")
+
+
+def _fake_ffmpeg(monkeypatch, delay=0.0):
+    calls = []
+
+    def fake_run(cmd, input=None, **kwargs):
+        calls.append(input)
+        time.sleep(delay)
+        return subprocess.CompletedProcess(cmd, 0, b"JPEG:" + input, b"")
+
+    monkeypatch.setattr(snapshots.subprocess, "run", fake_run)
+    return calls
+
+
+def test_concurrent_requests_share_one_decode(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "LIVE_DIR", tmp_path)
+    monkeypatch.setattr(settings, "SNAPSHOT_TTL_SEC", 60.0)
+    calls = _fake_ffmpeg(monkeypatch, delay=0.2)
+    _playlist(tmp_path, "segment_000001.ts", "segment_000002.ts")
+    cache = snapshots.SnapshotCache()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("cam1"))) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == [b"segment_000002.ts"]
+    assert {r.jpeg for r in results} == {b"JPEG:segment_000002.ts"}
+    assert cache.get("cam2") is None
+
+
+def test_expired_snapshot_decodes_only_newer_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "LIVE_DIR", tmp_path)
+    monkeypatch.setattr(settings, "SNAPSHOT_TTL_SEC", 0.0)
+    calls = _fake_ffmpeg(monkeypatch)
+    _playlist(tmp_path, "segment_000001.ts")
+    cache = snapshots.SnapshotCache()
+
+    first = cache.get("cam1")
+    assert cache.get("cam1") is first and len(calls) == 1
+    _playlist(tmp_path, "segment_000001.ts", "segment_000002.ts")
+    assert cache.get("cam1").jpeg == b"JPEG:segment_000002.ts" and len(calls) == 2
+
+
+def test_ll_hls_parts_get_init_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "LIVE_DIR", tmp_path)
+    calls = _fake_ffmpeg(monkeypatch)
+    _playlist(tmp_path, "part_000007.m4s", name=snapshots.PARTS_PLAYLIST)
+    (tmp_path / "cam1" / "grid" / "init.mp4").write_bytes(b"init|")
+
+    assert snapshots.SnapshotCache().get("cam1").segment == "part_000007.m4s"
+    assert calls == [b"init|part_000007.m4s"]
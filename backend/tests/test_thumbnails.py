@@ -0,0 +1,95 @@
+import importlib
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.append(str(ROOT))
+
+
+@pytest.fixture()
+def rec_client(rec_env, monkeypatch):
+    from backend.app import config, db, models, recordings, thumbnails, main
+    for module in (config, db, models, recordings, thumbnails, main):
+        importlib.reload(module)
+
+    monkeypatch.setattr(main.ffmpeg_manager, "start_by_config", lambda cam: None)
+    monkeypatch.setattr(main.ffmpeg_manager, "start_role", lambda *args, **kwargs: None)
+
+    with TestClient(main.app) as client:
+        yield client, config.REC_DIR
+
+
+def _jpeg(w: int, h: int) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, h, w, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app0 + sof + b"\xff\xd9"
+
+
+def test_thumbnail_sprites_for_closed_segments(rec_client, write_segment, monkeypatch):
+    from backend.app import recordings, thumbnails
+
+    client, rec_dir = rec_client
+    write_segment(rec_dir, "2024-04-11_10-00-00.mp4", 100, age=3600)
+    write_segment(rec_dir, "2024-04-11_10-05-00.mp4", 100)
+    (rec_dir / "cam1" / recordings.SEGMENT_LIST_NAME).write_text("2024-04-11_10-00-00.mp4,0.0,125.0\n")
+    recordings.segment_index.poll_segment_lists()
+
+    ran = []
+
+    def fake_run(cmd, **kwargs):
+        ran.append(cmd)
+        Path(cmd[-1]).write_bytes(_jpeg(160 * 10, 90 * 2))
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    monkeypatch.setattr(thumbnails.subprocess, "run", fake_run)
+    assert thumbnails.thumbnail_workers.run_batch() == 1  # the open segment waits until it closes
+    assert "nokey" in ran[0] and "fps=1/10,scale=160:-2,tile=10x2" in ran[0]
+
+    cam_id = client.post("/api/admin/cameras", json={"name": "cam1", "rtsp_url": "rtsp://x"}).json()["id"]
+    items = client.get(f"/api/cameras/{cam_id}/recordings/2024-04-11").json()
+    assert items[1]["thumbnails"] is None
+    vtt_url = items[0]["thumbnails"]
+    assert vtt_url == items[0]["path"] + "/thumbnails.vtt"
+
+    vtt = client.get(vtt_url)
+    assert vtt.status_code == 200 and vtt.headers["content-type"].startswith("text/vtt")
+    cues = vtt.text.split("\n\n")[1:]
+    assert cues[0] == "00:00:00.000 --> 00:00:10.000\nthumbnails.jpg#xywh=0,0,160,90"
+    assert cues[11] == "00:01:50.000 --> 00:02:00.000\nthumbnails.jpg#xywh=160,90,160,90"
+    assert cues[12].startswith("00:02:00.000 --> 00:02:05.000")
+    assert client.get(items[0]["path"] + "/thumbnails.jpg").headers["content-type"] == "image/jpeg"
+    assert client.get(items[1]["path"] + "/thumbnails.vtt").status_code == 404
+
+
+def test_worker_loop_survives_a_failed_batch(monkeypatch):
+    import sqlite3
+    from backend.app import thumbnails
+
+    class Stop(Exception):
+        pass
+
+    batches = [sqlite3.OperationalError("database is locked"), 1, 0]
+    slept = []
+
+    def run_batch():
+        result = batches.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def sleep(sec):
+        slept.append(sec)
+        if not batches:
+            raise Stop
+
+    workers = thumbnails.ThumbnailWorkers()
+    monkeypatch.setattr(workers, "run_batch", run_batch)
+    monkeypatch.setattr(thumbnails.time, "sleep", sleep)
+    with pytest.raises(Stop):
+        workers.run()
+    assert not batches and len(slept) == 2  # after the error, then idle
@@ -37,12 +37,17 @@ while [[ $# -gt 0 ]]; do
 done
 
 API_BACKEND="${API_BACKEND:-127.0.0.1:${API_PORT}}"
+# directories nginx serves for X-Accel-Redirect (same layout as backend/app/config.py)
+REC_ROOT="${RECORDINGS_ROOT:-${MEDIA_ROOT:-/media}/recordings}"
+CLIP_ROOT="${REC_ROOT}/saved"
+# archive tier; a placeholder when COLD_ROOT is unset (the location is then never used)
+COLD_ACCEL_ROOT="${COLD_ROOT:-/nonexistent}"
 
-export PORT API_PORT API_BACKEND
+export PORT API_PORT API_BACKEND REC_ROOT CLIP_ROOT COLD_ACCEL_ROOT
 
 # render nginx config with env vars
 if [ -f /etc/nginx/nginx.conf.template ]; then
-  envsubst '${PORT} ${API_BACKEND}' < /etc/nginx/nginx.conf.template > /etc/nginx/nginx.conf
+  envsubst '${PORT} ${API_BACKEND} ${REC_ROOT} ${CLIP_ROOT} ${COLD_ACCEL_ROOT}' < /etc/nginx/nginx.conf.template > /etc/nginx/nginx.conf
 fi
 
 start_backend() {
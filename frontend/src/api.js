@@ -15,6 +15,24 @@ const API = {
     return fetch(`/api/cameras/${camId}/recordings/${date}`).then(r => r.json());
   },
 
+  // Motion: paged events for one camera, hourly activity for all (heatmaps)
+  motionEvents(camId, { start, end, limit, after } = {}) {
+    const q = new URLSearchParams();
+    if (start != null) q.set('start', start);
+    if (end != null) q.set('end', end);
+    if (limit != null) q.set('limit', limit);
+    if (after) q.set('after', after);
+    return fetch(`/api/cameras/${camId}/motion?${q}`).then(r => r.json());
+  },
+
+  motionHistogram({ start, end, cameras } = {}) {
+    const q = new URLSearchParams();
+    if (start != null) q.set('start', start);
+    if (end != null) q.set('end', end);
+    if (cameras && cameras.length) q.set('cameras', cameras.join(','));
+    return fetch(`/api/motion/histogram?${q}`).then(r => r.json());
+  },
+
   savedVideos() {
     return fetch('/api/saved').then(r => r.json());
   },
@@ -106,6 +106,7 @@ export default function CameraCard({ cam }) {
         autoPlay
         playsInline
         preload="auto"
+        poster={`/api/cameras/${cam.id}/snapshot.jpg`}
         onClick={openMedium}
         // no controls to keep compact
         style={{ width:'100%', height:260, background:'#000', display:'block', cursor:'pointer' }}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark the software motion detector (backend/app/motion_detect.py).
+
+Runs the same ffmpeg tap the backend uses (keyframe-friendly cheap decode,
+fps + area downscale to gray rawvideo) over recorded footage as fast as it
+will go, feeds the frames to FrameDiffDetector, and reports CPU per second of
+footage, i.e. the fraction of a core one camera costs, and what that means
+for N cameras.
+
+Usage:
+  python motion/bench_detector.py /recordings/front/2024-04-10/10/*.mp4 --cameras 20
+  python motion/bench_detector.py --synthetic 20000      # detector only, no ffmpeg
+
+Recordings are usually the camera's main stream; the live tap decodes the grid
+source (often the substream), so footage numbers are an upper bound.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend.app.config import settings  # noqa: E402
+from backend.app.motion_detect import FrameDiffDetector, run_frames, tap_args  # noqa: E402
+
+
+class _TimedDetector(FrameDiffDetector):
+    cpu = 0.0
+
+    def feed(self, frame, ts):
+        t0 = time.process_time()
+        try:
+            return super().feed(frame, ts)
+        finally:
+            self.cpu += time.process_time() - t0
+
+
+def _children_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def bench_file(path: str, seconds: float):
+    input_opts, tail = tap_args()
+    limit = ["-t", str(seconds)] if seconds else []
+    cmd = ["ffmpeg", "-v", "error", "-nostdin", *input_opts, *limit, "-i", path, *tail]
+    det = _TimedDetector(settings.MOTION_WIDTH, settings.MOTION_HEIGHT,
+                         pixel_delta=settings.MOTION_PIXEL_DELTA, threshold=settings.MOTION_THRESHOLD)
+    events = []
+    cpu0, wall0 = _children_cpu(), time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    frames = run_frames(proc.stdout, det, lambda ts, active: events.append(active))
+    proc.wait()
+    return {
+        "frames": frames,
+        "footage_sec": frames / settings.MOTION_FPS,
+        "decode_cpu": _children_cpu() - cpu0,
+        "detect_cpu": det.cpu,
+        "wall": time.time() - wall0,
+        "starts": sum(1 for e in events if e),
+    }
+
+
+def bench_synthetic(n: int):
+    w, h = settings.MOTION_WIDTH, settings.MOTION_HEIGHT
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=(h, w), dtype=np.uint8) for _ in range(64)]
+    det = FrameDiffDetector(w, h, mask=np.ones((h, w), dtype=bool))
+    t0 = time.process_time()
+    for i in range(n):
+        det.feed(frames[i % len(frames)], i / settings.MOTION_FPS)
+    per_frame = (time.process_time() - t0) / n
+    print(f"detector: {per_frame * 1e6:.1f} us/frame at {w}x{h} (mask on)")
+    print(f"  = {per_frame * settings.MOTION_FPS * 100:.4f}% of a core per camera at {settings.MOTION_FPS:g} fps")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the grid-stream motion detector")
+    ap.add_argument("files", nargs="*", help="recorded segments to replay")
+    ap.add_argument("--cameras", type=int, default=20, help="extrapolate to this many cameras")
+    ap.add_argument("--seconds", type=float, default=0, help="only the first N seconds of each file")
+    ap.add_argument("--synthetic", type=int, default=0, metavar="FRAMES", help="time the detector alone")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        bench_synthetic(args.synthetic)
+    if not args.files:
+        if not args.synthetic:
+            ap.error("give footage files or --synthetic N")
+        return
+
+    total = {"frames": 0, "footage_sec": 0.0, "decode_cpu": 0.0, "detect_cpu": 0.0, "wall": 0.0, "starts": 0}
+    for path in args.files:
+        r = bench_file(path, args.seconds)
+        for k in total:
+            total[k] += r[k]
+        print(f"{os.path.basename(path)}: {r['frames']} frames, {r['footage_sec']:.0f}s footage, "
+              f"decode {r['decode_cpu']:.2f}s cpu, detect {r['detect_cpu'] * 1000:.1f}ms cpu, "
+              f"{r['starts']} motion starts")
+
+    if not total["footage_sec"]:
+        print("no frames decoded")
+        return
+    per_cam = (total["decode_cpu"] + total["detect_cpu"]) / total["footage_sec"]
+    print()
+    print(f"{total['footage_sec']:.0f}s of footage in {total['wall']:.1f}s wall "
+          f"({total['footage_sec'] / max(total['wall'], 1e-9):.0f}x realtime)")
+    print(f"detector: {total['detect_cpu'] / total['frames'] * 1e6:.1f} us/frame; "
+          f"decode: {total['decode_cpu'] / total['frames'] * 1e3:.2f} ms/frame")
+    print(f"per camera: {per_cam * 100:.2f}% of a core; "
+          f"{args.cameras} cameras: {per_cam * args.cameras * 100:.1f}% of a core")
+
+
+if __name__ == "__main__":
+    main()